@@ -1,9 +1,37 @@
+import scene_backend
+import profiler
+import lpe
 import aov
+import aov_registry
+import jobs
+import scene_index
+import reconciler
+import consolidation
+import render_budget
+import render_layers
+import light_clustering
+import driver_layout
 import lpe_manager
+import scene_sync
+import list_model
 import lpe_manager_ui
 
 # This is temporary helper code for development.
 # Delete when done with active development of this package.
+reload(scene_backend)
+reload(profiler)
+reload(lpe)
 reload(aov)
+reload(aov_registry)
+reload(jobs)
+reload(scene_index)
+reload(reconciler)
+reload(consolidation)
+reload(render_budget)
+reload(render_layers)
+reload(light_clustering)
+reload(driver_layout)
 reload(lpe_manager)
+reload(scene_sync)
+reload(list_model)
 reload(lpe_manager_ui)
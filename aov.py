@@ -1,64 +1,103 @@
-import mtoa as arnold
-import pymel.core as pm
-
-# TODO: add all scatter events
-SCATTER_EVENTS = {
-	"background": "B",
-	"beauty": ".*",
-	"coat": "<RS'coat'>.*",
-	"diffuse": "<RD>.*",
-	"diffuse_direct": "<RD>",
-	"diffuse_indirect": "<RD>[DSVOB].*",
-	"direct": "[DSV]",
-	"emission": "[LO]",
-	"indirect": "[DSV][DSVOB].*",
-	"transmission": "<TS>.*",
-	"specular": "<RS>.*",
-	"specular_direct": "<RS[^'coat']>",
-	"specular_indirect": "<RS[^'coat']>[DSVOB].*",
-	"sss": "<TD>.*",
-	"volume": "V.*"
-}
+import lpe
+from lpe import SCATTER_EVENTS
+from scene_backend import AOV_NODE_PREFIX
+from scene_backend import get_backend
+
+# One copy of every light group and pass name, shared by all AOVs
+_shared_names = {}
+
+
+def _share(name):
+	return _shared_names.setdefault(name, name)
+
+
+def resolve_nodes(aov_list, backend=None):
+	"""Bind the aiAOV nodes of every unresolved AOV with a single scene query"""
+	unresolved = [aov for aov in aov_list if not aov._resolved]
+	if not unresolved:
+		return
+	backend = backend or unresolved[0]._backend
+	node_names = [AOV.node_name(aov.light_group, aov.render_pass) for aov in unresolved]
+	for aov, node in zip(unresolved, backend.find_aov_nodes(node_names)):
+		aov._node = node
+		aov._resolved = True
 
 
 class AOV(object):
-	"""Arnold AOV objects"""
+	"""
+	Arnold AOV objects
+	AOVs made with make_node=False look up their aiAOV node the first time
+	it's used, or all at once through resolve_nodes(). A known expression,
+	like one from the scene index, is used instead of formatting the LPE.
+	With strict, an unknown render pass raises LPEError instead of falling
+	back to the beauty LPE with a warning.
+	"""
+
+	__slots__ = ("light_group", "render_pass", "lpe", "_backend", "_node", "_resolved")
 
-	def __init__(self, light_group, render_pass, make_node=True):
+	def __init__(self, light_group, render_pass, make_node=True, node=None, backend=None, expression=None,
+				strict=False):
 		super(AOV, self).__init__()
-		self.light_group = light_group
-		self.render_pass = render_pass
-		self.lpe = AOV.format_lpe(self.light_group, self.render_pass)
-		self._interface = arnold.aovs.AOVInterface()
-		self._aov_node = None
-		if(make_node):
+		self.light_group = _share(light_group)
+		self.render_pass = _share(render_pass)
+		self.lpe = expression or AOV.format_lpe(self.light_group, self.render_pass, strict)
+		self._backend = backend or get_backend()
+		self._node = node
+		self._resolved = node is not None
+		if(node is None and make_node):
 			self.make_aov_node()
-		else:
+
+	@property
+	def _aov_node(self):
+		if not self._resolved:
 			self._find_node()
+		return self._node
+
+	@_aov_node.setter
+	def _aov_node(self, node):
+		self._node = node
+		self._resolved = True
+
+	@staticmethod
+	def format_lpe(group, renderPass, strict=False):
+		return lpe.format_lpe(group, renderPass, strict)
 
 	@staticmethod
-	def format_lpe(group, renderPass):
-		if renderPass not in SCATTER_EVENTS.keys():
-			renderPass = "beauty"
-		events = SCATTER_EVENTS[renderPass.lower()]
-		return "C{}<L.'{}'>".format(events, group)
+	def node_name(group, renderPass):
+		return "{}{}_{}".format(AOV_NODE_PREFIX, group, renderPass)
+
+	@staticmethod
+	def parse_node_name(node_name, groups):
+		"""
+		Split an aiAOV node name into (light_group, render_pass).
+		The name has to start with the aiAOV_ prefix and one of the given groups.
+		When several groups match, the longest one wins, so "key_fill" takes
+		aiAOV_key_fill_diffuse over "key". Returns None when nothing matches.
+		"""
+		if not node_name.startswith(AOV_NODE_PREFIX):
+			return None
+
+		name = node_name[len(AOV_NODE_PREFIX):]
+		end = len(name)
+		while True:
+			end = name.rfind("_", 0, end)
+			if end <= 0:
+				return None
+			if name[:end] in groups and end < len(name) - 1:
+				return name[:end], name[end + 1:]
 
 	def delete_node(self):
-		if(self._aov_node):
-			pm.delete(self._aov_node)
+		if(self._backend.node_exists(self._aov_node)):
+			self._backend.delete_nodes([self._aov_node])
 
 	def make_aov_node(self):
-		aov_name = self.nice_name()
-		self._aov_node = pm.PyNode(self._interface.addAOV(aov_name).node)
-		self._aov_node.lightPathExpression.set(self.lpe)
+		self._aov_node = self._backend.create_aov_node(self.nice_name())
+		self._backend.set_lpe(self._aov_node, self.lpe)
 
 	def nice_name(self):
 		return "{}_{}".format(self.light_group, self.render_pass)
 
 	def _find_node(self):
-		search_name = "aiAOV_{}_{}".format(self.light_group, self.render_pass)
-		search_results = pm.ls(search_name, type="aiAOV")
-		if(search_results):
-			self._aov_node = search_results[0]
-			return True
-		return False
+		search_name = AOV.node_name(self.light_group, self.render_pass)
+		self._aov_node = self._backend.find_aov_node(search_name)
+		return self._node is not None
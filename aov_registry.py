@@ -0,0 +1,83 @@
+"""
+Indexed storage for AOV objects owned by an LPEManager.
+
+Every AOV is indexed three ways so that lookups never walk the whole set:
+- (light_group, render_pass), the identity of an AOV
+- nice_name(), the label shown in the UI
+- light_group, keeping the insertion order of the group's passes
+"""
+from collections import OrderedDict
+
+
+class AOVRegistry(object):
+	"""Collection of AOV objects with constant-time lookups"""
+
+	def __init__(self):
+		super(AOVRegistry, self).__init__()
+		self._by_key = OrderedDict()
+		self._by_name = {}
+		self._by_group = {}
+
+	def __contains__(self, key):
+		return key in self._by_key
+
+	def __iter__(self):
+		return iter(list(self._by_key.values()))
+
+	def __len__(self):
+		return len(self._by_key)
+
+	def add(self, aov, nice_name=None):
+		key = (aov.light_group, aov.render_pass)
+		if key in self._by_key:
+			return False
+
+		self._by_key[key] = aov
+		self._by_name.setdefault(nice_name or aov.nice_name(), aov)
+		self._by_group.setdefault(aov.light_group, OrderedDict())[aov.render_pass] = aov
+		return True
+
+	def clear(self):
+		self._by_key.clear()
+		self._by_name.clear()
+		self._by_group.clear()
+
+	def get(self, group_name, render_pass):
+		return self._by_key.get((group_name, render_pass))
+
+	def get_all(self):
+		return list(self._by_key.values())
+
+	def get_by_name(self, nice_name):
+		return self._by_name.get(nice_name)
+
+	def get_group(self, group_name):
+		group = self._by_group.get(group_name)
+		if group is None:
+			return []
+		return list(group.values())
+
+	def groups(self):
+		return list(self._by_group.keys())
+
+	def remove(self, aov):
+		key = (aov.light_group, aov.render_pass)
+		if self._by_key.get(key) is not aov:
+			return False
+
+		del self._by_key[key]
+		if self._by_name.get(aov.nice_name()) is aov:
+			del self._by_name[aov.nice_name()]
+
+		group = self._by_group[aov.light_group]
+		del group[aov.render_pass]
+		if not group:
+			del self._by_group[aov.light_group]
+		return True
+
+	def remove_many(self, aovs):
+		removed = 0
+		for aov in aovs:
+			if self.remove(aov):
+				removed += 1
+		return removed
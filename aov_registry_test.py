@@ -0,0 +1,75 @@
+import unittest
+from aov_registry import AOVRegistry
+
+
+class RegistryEntry(object):
+	"""Minimal stand-in exposing the attributes AOVRegistry indexes"""
+
+	def __init__(self, light_group, render_pass):
+		self.light_group = light_group
+		self.render_pass = render_pass
+
+	def nice_name(self):
+		return "{}_{}".format(self.light_group, self.render_pass)
+
+
+class AOVRegistryTest(unittest.TestCase):
+	"""Test class for AOVRegistry"""
+
+	def setUp(self):
+		self.registry = AOVRegistry()
+
+	def test_adds_an_entry(self):
+		entry = RegistryEntry("group_1", "diffuse")
+		self.assertTrue(self.registry.add(entry))
+		self.assertEqual(len(self.registry), 1)
+		self.assertTrue(("group_1", "diffuse") in self.registry)
+
+	def test_rejects_duplicate_entry(self):
+		self.registry.add(RegistryEntry("group_1", "diffuse"))
+		self.assertFalse(self.registry.add(RegistryEntry("group_1", "diffuse")))
+		self.assertEqual(len(self.registry), 1)
+
+	def test_gets_entry_by_key(self):
+		entry = RegistryEntry("group_1", "diffuse")
+		self.registry.add(entry)
+		self.assertTrue(self.registry.get("group_1", "diffuse") is entry)
+		self.assertEqual(self.registry.get("group_1", "specular"), None)
+
+	def test_gets_entry_by_nice_name(self):
+		entry = RegistryEntry("group_1", "diffuse")
+		self.registry.add(entry)
+		self.assertTrue(self.registry.get_by_name("group_1_diffuse") is entry)
+
+	def test_gets_group_in_insertion_order(self):
+		self.registry.add(RegistryEntry("group_1", "direct"))
+		self.registry.add(RegistryEntry("group_2", "direct"))
+		self.registry.add(RegistryEntry("group_1", "indirect"))
+
+		passes = [entry.render_pass for entry in self.registry.get_group("group_1")]
+		self.assertEqual(passes, ["direct", "indirect"])
+		self.assertEqual(self.registry.get_group("missing"), [])
+
+	def test_removes_entry_from_every_index(self):
+		entry = RegistryEntry("group_1", "diffuse")
+		self.registry.add(entry)
+		self.assertTrue(self.registry.remove(entry))
+
+		self.assertEqual(len(self.registry), 0)
+		self.assertEqual(self.registry.get_by_name("group_1_diffuse"), None)
+		self.assertEqual(self.registry.get_group("group_1"), [])
+		self.assertEqual(self.registry.groups(), [])
+
+	def test_ignores_removal_of_unknown_entry(self):
+		self.registry.add(RegistryEntry("group_1", "diffuse"))
+		self.assertFalse(self.registry.remove(RegistryEntry("group_1", "diffuse")))
+		self.assertEqual(len(self.registry), 1)
+
+	def test_removes_many_entries(self):
+		entries = [RegistryEntry("group_1", "direct"), RegistryEntry("group_1", "indirect")]
+		for entry in entries:
+			self.registry.add(entry)
+		self.registry.add(RegistryEntry("group_2", "direct"))
+
+		self.assertEqual(self.registry.remove_many(entries), 2)
+		self.assertEqual(self.registry.groups(), ["group_2"])
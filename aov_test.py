@@ -1,7 +1,12 @@
 import unittest
-import pymel.core as pm
 from aov import AOV
-from aov import arnold
+from aov import resolve_nodes
+from lpe import LPEError
+from scene_backend import get_backend
+
+
+def aov_node_names():
+	return [str(node) for node in get_backend().list_aov_nodes()]
 
 
 class AOVTest(unittest.TestCase):
@@ -13,11 +18,7 @@ class AOVTest(unittest.TestCase):
 
 	def clean_environment(self):
 		# Open a new file to clear out any AOVs created by the tests
-		pm.newFile(force=True)
-		# defaultArnoldDriver (among other objects) doesn't load until needed.
-		# The following 2 lines will force them to load to avoid runtime errors.
-		from mtoa.core import createOptions
-		createOptions()
+		get_backend().new_scene()
 
 	def test_saves_a_lightgroup_name(self):
 		self.assertEqual(self.dummy_aov.light_group, "test_name")
@@ -30,13 +31,13 @@ class AOVTest(unittest.TestCase):
 
 	def test_creates_an_aov_node(self):
 		AOV("test_aov", "test_pass")
-		aov_list = pm.ls(type="aiAOV")
+		aov_list = aov_node_names()
 		self.assertEqual(len(aov_list), 2)  # 2, because one is created in setUp()
 		self.assertTrue("aiAOV_test_aov_test_pass" in aov_list)
 
 	def test_optionally_does_not_create_node(self):
 		AOV("test_aov", "test_lpe", False)
-		aov_list = pm.ls(type="aiAOV")
+		aov_list = aov_node_names()
 		self.assertEqual(len(aov_list), 1)
 
 	def test_formats_background_lpe_expression(self):
@@ -103,39 +104,80 @@ class AOVTest(unittest.TestCase):
 		expression = AOV.format_lpe("group_name", "fake pass")
 		self.assertEqual(expression, "C.*<L.'group_name'>")
 
+	def test_strict_format_rejects_unknown_pass(self):
+		self.assertRaises(LPEError, AOV, "test_aov", "fake pass", False, strict=True)
+
 	def test_saves_lpe_to_maya_node(self):
-		test_aov = pm.ls(type="aiAOV")[0]
+		test_aov = get_backend().list_aov_nodes()[0]
 		expectedExpression = "C.*<L.'test_name'>"
 
-		self.assertEqual(test_aov.lightPathExpression.get(), expectedExpression)
+		self.assertEqual(get_backend().get_lpe(test_aov), expectedExpression)
 
 	def test_deletes_node_when_explicitly_requested(self):
 		new_aov = AOV("group_name", "direct")
-		aov_list = pm.ls(type="aiAOV")
+		aov_list = aov_node_names()
 		self.assertEqual(len(aov_list), 2)
 		new_aov.delete_node()
-		aov_list = pm.ls(type="aiAOV")
+		aov_list = aov_node_names()
 		self.assertEqual(len(aov_list), 1)
 
 	def test_does_not_delete_node_on_destruction(self):
 		new_aov = AOV("group_name", "direct")
-		aov_list = pm.ls(type="aiAOV")
+		aov_list = aov_node_names()
 		self.assertEqual(len(aov_list), 2)
 		del(new_aov)
-		aov_list = pm.ls(type="aiAOV")
+		aov_list = aov_node_names()
 		self.assertEqual(len(aov_list), 2)
 
 	def test_finds_existing_aov_node(self):
-		# Make an AOV directly through arnold, and verify it exists
+		# Make an AOV directly through the backend, and verify it exists
 		aov_name = "test_group_test_pass"
-		arnold.aovs.AOVInterface().addAOV(aov_name)
-		aov_list = pm.ls("aiAOV_" + aov_name)
-		self.assertEqual(len(aov_list), 1)
+		get_backend().create_aov_node(aov_name)
+		self.assertTrue("aiAOV_" + aov_name in aov_node_names())
 
 		# Ensure that the AOV instance found the node
 		new_aov = AOV("test_group", "test_pass", False)
-		self.assertTrue(new_aov._aov_node.type() == "aiAOV")
+		self.assertTrue(get_backend().node_type(new_aov._aov_node) == "aiAOV")
 
 	def test_returns_nice_name(self):
 		expected_return = "test_name_test_pass"
 		self.assertEqual(self.dummy_aov.nice_name(), expected_return)
+
+	def test_parses_node_name(self):
+		parsed = AOV.parse_node_name("aiAOV_warm_diffuse_direct", set(["warm"]))
+		self.assertEqual(parsed, ("warm", "diffuse_direct"))
+
+	def test_parse_prefers_longest_group(self):
+		groups = set(["key", "key_fill"])
+		parsed = AOV.parse_node_name("aiAOV_key_fill_diffuse", groups)
+		self.assertEqual(parsed, ("key_fill", "diffuse"))
+
+	def test_parse_is_anchored_to_the_prefix(self):
+		groups = set(["key"])
+		self.assertEqual(AOV.parse_node_name("my_aiAOV_key_diffuse", groups), None)
+		self.assertEqual(AOV.parse_node_name("aiAOV_monkey_diffuse", groups), None)
+		self.assertEqual(AOV.parse_node_name("aiAOV_key_", groups), None)
+
+	def test_finds_existing_node_on_first_use(self):
+		node = get_backend().create_aov_node("test_group_test_pass")
+		new_aov = AOV("test_group", "test_pass", False)
+		self.assertFalse(new_aov._resolved)
+		self.assertTrue(new_aov._aov_node is node)
+		self.assertTrue(new_aov._resolved)
+
+	def test_resolves_nodes_in_bulk(self):
+		node = get_backend().create_aov_node("test_group_direct")
+		aov_list = [AOV("test_group", "direct", False), AOV("test_group", "indirect", False)]
+		resolve_nodes(aov_list)
+		self.assertTrue(all(aov._resolved for aov in aov_list))
+		self.assertTrue(aov_list[0]._aov_node is node)
+		self.assertEqual(aov_list[1]._aov_node, None)
+
+	def test_shares_names_and_lpes(self):
+		first = AOV("test_group", "direct", False)
+		second = AOV("".join(["test_", "group"]), "direct", False)
+		self.assertTrue(first.light_group is second.light_group)
+		self.assertTrue(first.lpe is second.lpe)
+
+	def test_has_no_instance_dict(self):
+		self.assertFalse(hasattr(self.dummy_aov, "__dict__"))
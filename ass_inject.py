@@ -0,0 +1,351 @@
+"""
+Add light group AOVs to exported .ass files without Maya.
+
+Changing the light group AOVs of a shot normally means exporting every
+.ass file again. This rewrites the files in place instead. The preset is
+the same spec of light group -> level or passes that lpe_batch takes, and
+the expressions come from AOV.format_lpe, so the files end up with the same
+AOVs the manager would build:
+	python ass_inject.py --preset preset.json "shots/shot010/ass/shot010.*.ass.gz"
+	python ass_inject.py --group key=fine --group rim=coarse "shot010.####.ass" --frames 1001-1100
+A merged light group from LPEManager.consolidate() lives in the Maya scene,
+not in the .ass files, so it's given again with --merge:
+	python ass_inject.py --merge key_fill=key,fill --group key_fill=coarse "shot010.*.ass"
+
+Light group AOVs live in the options node: one "name TYPE filter driver"
+entry of outputs and one "name expression" entry of light_path_expressions
+each. For every light group of the spec, its entries are replaced by the
+spec's, like LPEManager.reconcile() does with aiAOVs. Entries of other
+groups and AOVs stay as they are. A new AOV is written through the filter
+and driver of the RGBA beauty, while an AOV that's already there keeps its
+own.
+
+Each file is read once, line by line. Only the options block is held in
+memory, and every other line is copied through as it is, so the geometry
+of a frame is never loaded. Files ending in .gz are read and written
+compressed. A file that already matches is left untouched, and the
+rewritten ones don't depend on when they were written, so running the
+same preset twice leaves identical files.
+"""
+import argparse
+import gzip
+import io
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import timeit
+import traceback
+from collections import OrderedDict
+import lpe
+from aov import AOV
+from beauty_check import frame_path
+from beauty_check import parse_frame_range
+from lpe import SCATTER_EVENTS
+from lpe_batch import expand_scenes
+from lpe_batch import load_preset
+from lpe_batch import parse_group_args
+from reconciler import resolve_spec
+
+OUTPUTS = "outputs"
+EXPRESSIONS = "light_path_expressions"
+
+# Arnold output type of light group AOVs
+DATA_TYPE = "RGB"
+
+_TOKEN = re.compile(r'"((?:[^"\\]|\\.)*)"|(\S+)')
+
+
+def tokenize(text):
+	"""Split .ass text into (value, quoted) tokens"""
+	# Bare tokens are never empty, so an empty bare group means a quoted one
+	return [(bare, False) if bare else (quoted, True) for quoted, bare in _TOKEN.findall(text)]
+
+
+def parse_string_array(lines):
+	"""Name and values of a STRING array parameter, in either of its forms"""
+	tokens = tokenize(" ".join(lines))
+	name, rest = tokens[0][0], tokens[1:]
+	# "outputs 2 1 STRING" followed by the values, or the values straight away
+	if len(rest) >= 3 and not any(quoted for _, quoted in rest[:3]) and rest[0][0].isdigit():
+		rest = rest[3:]
+	return name, [value for value, _ in rest]
+
+
+def format_string_array(name, values, indent=" "):
+	lines = ["{}{} {} 1 STRING\n".format(indent, name, len(values))]
+	lines.extend('{} "{}"\n'.format(indent * 2, value) for value in values)
+	return lines
+
+
+def parse_merge_args(merge_args):
+	"""Turn ["key_fill=key,fill"] into a dict of merged group -> light groups"""
+	merges = OrderedDict()
+	for merge_arg in merge_args:
+		merged_name, _, members = merge_arg.partition("=")
+		if not merged_name or "," not in members:
+			raise ValueError("Expected GROUP=GROUP,GROUP, got '{}'".format(merge_arg))
+		merges[merged_name] = members.split(",")
+	return merges
+
+
+def register_merges(merges):
+	for merged_name, members in (merges or {}).items():
+		lpe.register_merged_group(merged_name, members, replace=True)
+
+
+def spec_aovs(spec):
+	"""OrderedDict of AOV name -> expression for a spec, and the groups it covers"""
+	resolved = resolve_spec(spec)
+	aovs = OrderedDict()
+	for group_name, passes in resolved.items():
+		for render_pass in passes:
+			aovs["{}_{}".format(group_name, render_pass)] = AOV.format_lpe(group_name, render_pass)
+	return aovs, list(resolved)
+
+
+class OptionsRewriter(object):
+	"""Puts the light group AOVs of a spec into the options block of .ass files"""
+
+	def __init__(self, spec):
+		super(OptionsRewriter, self).__init__()
+		self.aovs, groups = spec_aovs(spec)
+		# Every pass name of the spec's groups, whether the spec keeps it or not
+		self._owned = set("{}_{}".format(group_name, render_pass)
+						for group_name in groups for render_pass in SCATTER_EVENTS)
+
+	def rewrite(self, lines):
+		"""
+		Yield the lines of an .ass file with its options block rewritten.
+		self.changed tells afterwards whether anything was different.
+		"""
+		self.changed = False
+		lines = iter(lines)
+		for line in lines:
+			yield line
+			if line.strip() != "options":
+				continue
+			for line in lines:
+				yield line
+				if line.strip() == "{":
+					break
+			block = []
+			for line in lines:
+				if line.strip() == "}":
+					for block_line in self._rewrite_block(block):
+						yield block_line
+					yield line
+					break
+				block.append(line)
+			# Only the first options block counts, like in Arnold
+			for line in lines:
+				yield line
+
+	def _rewrite_block(self, block):
+		statements = self._statements(block)
+		arrays = dict((name, parse_string_array(lines)[1]) for name, lines in statements
+					if name in (OUTPUTS, EXPRESSIONS))
+		outputs = self._outputs(arrays.get(OUTPUTS, []))
+		expressions = self._expressions(arrays.get(EXPRESSIONS, []))
+
+		rewritten = []
+		wanted = {OUTPUTS: outputs, EXPRESSIONS: expressions}
+		for name, lines in statements:
+			if name in wanted:
+				values = wanted.pop(name)
+				if values != arrays[name]:
+					indent = lines[0][:len(lines[0]) - len(lines[0].lstrip())]
+					lines = format_string_array(name, values, indent)
+					self.changed = True
+			rewritten.extend(lines)
+		for name in (OUTPUTS, EXPRESSIONS):
+			if name in wanted:
+				rewritten.extend(format_string_array(name, wanted[name]))
+				self.changed = True
+		return rewritten
+
+	def _outputs(self, outputs):
+		existing = OrderedDict()
+		kept = []
+		template = None
+		for output in outputs:
+			tokens = output.split()
+			if tokens and tokens[0] == "RGBA" and template is None and len(tokens) >= 4:
+				template = tokens
+			if tokens and tokens[0] in self._owned:
+				existing[tokens[0]] = output
+			else:
+				kept.append(output)
+		if template is None:
+			if not outputs:
+				raise ValueError("The options have no outputs to take a driver from")
+			template = outputs[0].split()
+
+		for name in self.aovs:
+			kept.append(existing.get(name) or "{} {} {} {}".format(name, DATA_TYPE, template[2], template[3]))
+		return kept
+
+	def _expressions(self, expressions):
+		kept = [expression for expression in expressions if expression.split(" ", 1)[0] not in self._owned]
+		kept.extend("{} {}".format(name, expression) for name, expression in self.aovs.items())
+		return kept
+
+	def _statements(self, block):
+		# A parameter starts with its name, its values may follow on more lines
+		statements = []
+		for line in block:
+			stripped = line.lstrip()
+			if statements and not re.match(r"[A-Za-z_]", stripped):
+				statements[-1][1].append(line)
+			else:
+				statements.append((stripped.split(None, 1)[0] if stripped else "", [line]))
+		return statements
+
+
+def _open_text(path, mode, compressed):
+	# latin-1 maps every byte to a character, so the files round trip exactly
+	if compressed:
+		raw = open(path, mode + "b")
+		# No file name or time in the header, so the same content gives the same file
+		stream = gzip.GzipFile(filename="", mode=mode + "b", fileobj=raw, mtime=0)
+		return io.TextIOWrapper(stream, encoding="latin-1", newline=""), raw
+	return io.open(path, mode, encoding="latin-1", newline=""), None
+
+
+def inject_file(path, rewriter, dry_run=False):
+	"""Rewrite one file in place. Returns True when it was changed."""
+	directory, name = os.path.split(os.path.abspath(path))
+	handle, temp_path = tempfile.mkstemp(prefix="." + name, dir=directory)
+	os.close(handle)
+	try:
+		compressed = path.endswith(".gz")
+		source, source_raw = _open_text(path, "r", compressed)
+		target, target_raw = _open_text(temp_path, "w", compressed)
+		try:
+			for line in rewriter.rewrite(source):
+				target.write(line)
+		finally:
+			for stream in (source, source_raw, target, target_raw):
+				if stream is not None:
+					stream.close()
+		if rewriter.changed and not dry_run:
+			os.chmod(temp_path, os.stat(path).st_mode & 0o7777)
+			# Renamed over the original, so no reader ever sees half a file
+			if os.name == "nt" and os.path.exists(path):
+				os.remove(path)
+			os.rename(temp_path, path)
+		return rewriter.changed
+	finally:
+		if os.path.exists(temp_path):
+			os.remove(temp_path)
+
+
+def inject_job(job):
+	"""Rewrite one file, returning a result dict"""
+	path, spec, dry_run, merges = job
+	result = {"path": path, "ok": False, "changed": False, "seconds": 0.0, "error": None}
+	start = timeit.default_timer()
+	try:
+		# Worker processes don't share the merged groups of the parent
+		register_merges(merges)
+		result["changed"] = inject_file(path, OptionsRewriter(spec), dry_run)
+		result["ok"] = True
+	except Exception:
+		result["error"] = traceback.format_exc()
+	result["seconds"] = timeit.default_timer() - start
+	return result
+
+
+def run_inject(paths, spec, workers=1, dry_run=False, report=None, merges=None):
+	"""
+	Rewrite every file, calling report(result) as each one finishes.
+	merges maps merged group names of the spec to their light groups.
+	"""
+	jobs = [(path, spec, dry_run, merges) for path in paths]
+	results = []
+
+	def finished(result):
+		results.append(result)
+		if report:
+			report(result)
+
+	if workers <= 1:
+		for job in jobs:
+			finished(inject_job(job))
+		return results
+
+	pool = multiprocessing.Pool(processes=workers)
+	try:
+		for result in pool.imap_unordered(inject_job, jobs):
+			finished(result)
+	finally:
+		pool.close()
+		pool.join()
+	return results
+
+
+def format_result(result):
+	if not result["ok"]:
+		return "FAILED     {:>8.2f}s  {}".format(result["seconds"], result["path"])
+	return "{:<10} {:>8.2f}s  {}".format("changed" if result["changed"] else "unchanged",
+										result["seconds"], result["path"])
+
+
+def format_summary(results, elapsed):
+	failures = [result for result in results if not result["ok"]]
+	changed = sum(1 for result in results if result["changed"])
+	lines = ["{} files, {} changed, {} failed, {:.2f}s".format(len(results), changed, len(failures), elapsed)]
+	for result in failures:
+		lines.append("")
+		lines.append("FAILED {}".format(result["path"]))
+		lines.append(result["error"].rstrip())
+	return "\n".join(lines)
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Add light group AOVs to .ass files")
+	parser.add_argument("files", nargs="+", help=".ass or .ass.gz files or glob patterns, #### with --frames")
+	parser.add_argument("--preset", help="JSON file mapping light groups to a level or list of passes")
+	parser.add_argument("--group", action="append", default=[], metavar="GROUP=LEVEL",
+						help="light group and level or comma separated passes, may be repeated")
+	parser.add_argument("--merge", action="append", default=[], metavar="GROUP=GROUP,GROUP",
+						help="merged light group and the light groups it stands for, may be repeated")
+	parser.add_argument("--frames", help="frame range to fill in for #### like 1001-1100")
+	parser.add_argument("--workers", type=int, default=max(1, multiprocessing.cpu_count() // 2),
+						help="number of worker processes")
+	parser.add_argument("--dry-run", action="store_true", help="report the files that would change")
+	args = parser.parse_args(argv)
+
+	try:
+		spec = load_preset(args.preset) if args.preset else {}
+		spec.update(parse_group_args(args.group))
+		merges = parse_merge_args(args.merge)
+		register_merges(merges)
+		spec_aovs(spec)
+		patterns = args.files
+		if args.frames:
+			frames = parse_frame_range(args.frames)
+			patterns = [frame_path(pattern, frame) for frame in frames for pattern in patterns]
+	except (IOError, ValueError) as error:
+		parser.error(str(error))
+	if not spec:
+		parser.error("a preset or at least one --group is required")
+
+	paths = expand_scenes(patterns)
+	if not paths:
+		parser.error("no files matched")
+
+	def report(result):
+		print(format_result(result))
+		sys.stdout.flush()
+
+	start = timeit.default_timer()
+	results = run_inject(paths, spec, min(args.workers, len(paths)), args.dry_run, report, merges)
+	print("")
+	print(format_summary(results, timeit.default_timer() - start))
+	return 0 if all(result["ok"] for result in results) else 1
+
+
+if __name__ == '__main__':
+	sys.exit(main())
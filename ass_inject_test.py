@@ -0,0 +1,145 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+import lpe
+from ass_inject import OptionsRewriter
+from ass_inject import inject_file
+from ass_inject import parse_merge_args
+from ass_inject import parse_string_array
+from ass_inject import run_inject
+from lpe import format_lpe
+
+SCENE = """### exported: Mon Jan 1 00:00:00 2024
+options
+{
+ AA_samples 3
+ outputs 2 1 STRING
+  "RGBA RGBA defaultArnoldFilter@gaussian_filter defaultArnoldDriver@driver_exr.RGBA"
+  "warm_sss RGB defaultArnoldFilter@gaussian_filter aiAOVDriver_lpe_warm"
+ light_path_expressions 1 1 STRING "warm_sss C<TD>.*<L.'warm'>"
+ camera "perspShape"
+}
+
+polymesh
+{
+ name pCubeShape1
+ vidxs 4 1 UINT
+  0 1 2 3
+}
+"""
+
+
+class OptionsRewriterTest(unittest.TestCase):
+	"""Test class for rewriting the options of .ass files"""
+
+	def rewrite(self, text, spec):
+		rewriter = OptionsRewriter(spec)
+		return "".join(rewriter.rewrite(text.splitlines(True))), rewriter.changed
+
+	def options(self, text):
+		block = text[text.index("{\n") + 2:text.index("\n}") + 1].splitlines(True)
+		arrays = dict((name, parse_string_array(lines)[1]) for name, lines in OptionsRewriter({})._statements(block)
+					if name in ("outputs", "light_path_expressions"))
+		return arrays["outputs"], arrays["light_path_expressions"]
+
+	def test_parses_both_array_forms(self):
+		self.assertEqual(parse_string_array([' outputs 1 1 STRING "a b"']), ("outputs", ["a b"]))
+		self.assertEqual(parse_string_array([' outputs "a b" "c d"']), ("outputs", ["a b", "c d"]))
+		self.assertEqual(parse_string_array([' outputs 2 1 STRING\n', '  "a b"\n', '  "c d"\n']),
+						("outputs", ["a b", "c d"]))
+
+	def test_replaces_the_aovs_of_spec_groups(self):
+		text, changed = self.rewrite(SCENE, {"warm": ["direct", "indirect"]})
+		self.assertTrue(changed)
+		outputs, expressions = self.options(text)
+		self.assertEqual(outputs, [
+			"RGBA RGBA defaultArnoldFilter@gaussian_filter defaultArnoldDriver@driver_exr.RGBA",
+			"warm_direct RGB defaultArnoldFilter@gaussian_filter defaultArnoldDriver@driver_exr.RGBA",
+			"warm_indirect RGB defaultArnoldFilter@gaussian_filter defaultArnoldDriver@driver_exr.RGBA"])
+		self.assertEqual(expressions, ["warm_direct " + format_lpe("warm", "direct"),
+									"warm_indirect " + format_lpe("warm", "indirect")])
+
+	def test_keeps_other_groups_and_drivers(self):
+		text, _ = self.rewrite(SCENE, {"cold": ["direct"], "warm": ["sss"]})
+		outputs, expressions = self.options(text)
+		self.assertTrue("warm_sss RGB defaultArnoldFilter@gaussian_filter aiAOVDriver_lpe_warm" in outputs)
+		self.assertEqual(len(outputs), 3)
+		self.assertEqual(expressions, ["cold_direct " + format_lpe("cold", "direct"),
+									"warm_sss " + format_lpe("warm", "sss")])
+
+	def test_copies_everything_else(self):
+		text, _ = self.rewrite(SCENE, {"warm": "coarse"})
+		self.assertTrue(text.startswith("### exported: Mon Jan 1 00:00:00 2024\noptions\n{\n AA_samples 3\n"))
+		self.assertTrue(text.endswith(' camera "perspShape"\n}\n' + SCENE.split("}\n", 1)[1]))
+
+	def test_is_idempotent(self):
+		once, _ = self.rewrite(SCENE, {"warm": "fine", "cold": "coarse"})
+		twice, changed = self.rewrite(once, {"warm": "fine", "cold": "coarse"})
+		self.assertFalse(changed)
+		self.assertEqual(once, twice)
+
+	def test_adds_missing_arrays(self):
+		text, _ = self.rewrite("options\n{\n outputs \"RGBA RGBA f d\"\n}\n", {"warm": ["direct"]})
+		self.assertEqual(self.options(text)[1], ["warm_direct " + format_lpe("warm", "direct")])
+
+
+class InjectFileTest(unittest.TestCase):
+	"""Test class for rewriting .ass files in place"""
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def write(self, name, text):
+		path = os.path.join(self.directory, name)
+		stream = gzip.open(path, "wb") if name.endswith(".gz") else open(path, "wb")
+		with stream:
+			stream.write(text.encode("latin-1"))
+		return path
+
+	def read_bytes(self, path):
+		with open(path, "rb") as stream:
+			return stream.read()
+
+	def test_rewrites_compressed_files_the_same_every_time(self):
+		path = self.write("shot.1001.ass.gz", SCENE)
+		self.assertTrue(inject_file(path, OptionsRewriter({"warm": "coarse"})))
+		first = self.read_bytes(path)
+		self.write("shot.1001.ass.gz", SCENE)
+		inject_file(path, OptionsRewriter({"warm": "coarse"}))
+		self.assertEqual(self.read_bytes(path), first)
+		with gzip.open(path, "rb") as stream:
+			self.assertTrue(b"warm_emission" in stream.read())
+
+	def test_leaves_matching_files_untouched(self):
+		path = self.write("shot.1001.ass", SCENE)
+		inject_file(path, OptionsRewriter({"warm": "coarse"}))
+		modified = os.stat(path).st_mtime
+		self.assertFalse(inject_file(path, OptionsRewriter({"warm": "coarse"})))
+		self.assertEqual(os.stat(path).st_mtime, modified)
+		self.assertEqual(os.listdir(self.directory), ["shot.1001.ass"])
+
+	def test_dry_run_changes_nothing(self):
+		path = self.write("shot.1001.ass", SCENE)
+		results = run_inject([path], {"warm": "coarse"}, dry_run=True)
+		self.assertTrue(results[0]["changed"])
+		self.assertEqual(self.read_bytes(path), SCENE.encode("latin-1"))
+
+	def test_reports_files_without_outputs(self):
+		path = self.write("broken.ass", "options\n{\n AA_samples 3\n}\n")
+		result = run_inject([path], {"warm": "coarse"})[0]
+		self.assertFalse(result["ok"])
+		self.assertTrue("no outputs" in result["error"])
+
+	def test_writes_merged_groups(self):
+		path = self.write("shot.1001.ass", SCENE)
+		try:
+			results = run_inject([path], {"warm_cold": ["direct"]}, merges=parse_merge_args(["warm_cold=warm,cold"]))
+		finally:
+			lpe.unregister_merged_group("warm_cold")
+		self.assertTrue(results[0]["ok"])
+		self.assertTrue(b"warm_cold_direct C[DSV]<L.('cold'|'warm')>" in self.read_bytes(path))
@@ -0,0 +1,443 @@
+"""
+Check rendered light group AOVs against the beauty they should add up to.
+
+Every AOV_PASSES level splits a light group's contribution into passes that
+add up to all of it, and the light groups together add up to the beauty.
+Broken or overlapping expressions only show in comp, so this reads the
+rendered EXRs back and checks, for every level the frame has all passes of:
+- "<group>/<level>": a group's passes against its own <group>_beauty AOV,
+- "all/<level>": every group's passes together against the RGBA beauty.
+The second check also fails when lights are missing from every light group.
+
+Frames are read a band of scanlines at a time, so a 4K multilayer frame is
+never in memory at once, and the passes are summed with NumPy. Each check
+reports the worst, mean and RMS per-pixel error, the error relative to the
+beauty, and the pixels over the tolerance. A heatmap keeps the worst error
+of each block of pixels, and can be written out as a PFM image.
+
+Run it over a frame range, with the frames handed out to a process pool:
+	python beauty_check.py "renders/shot010.####.exr" --frames 1001-1100 --workers 8
+Files written through per group drivers are all given, one pattern each:
+	python beauty_check.py "renders/shot010_lpe_*.####.exr" "renders/shot010.####.exr" --frames 1001
+
+Reading EXRs needs NumPy and the OpenEXR module, which come with most
+compositing installs but not with Maya.
+"""
+import argparse
+import glob
+import json
+import math
+import multiprocessing
+import os
+import re
+import sys
+import timeit
+import traceback
+from collections import OrderedDict
+from lpe import AOV_PASSES
+from lpe import SCATTER_EVENTS
+from render_budget import LEVELS
+
+try:
+	import numpy as np
+	NUMPY_AVAILABLE = True
+except ImportError:
+	NUMPY_AVAILABLE = False
+
+try:
+	import Imath
+	import OpenEXR
+	OPENEXR_AVAILABLE = True
+except ImportError:
+	OPENEXR_AVAILABLE = False
+
+RGB = ("R", "G", "B")
+
+# Layer of the RGBA beauty, whose channels have no layer prefix
+BEAUTY_LAYER = ""
+
+# Allowed error per pixel, relative to the beauty and absolute below 1
+DEFAULT_TOLERANCE = 0.01
+
+# Scanlines read at once, rounded down to whole heatmap blocks
+DEFAULT_BAND_HEIGHT = 64
+
+# Pixels per heatmap block side
+HEATMAP_BLOCK = 16
+
+
+def layer_channels(layer):
+	return ["{}.{}".format(layer, channel) if layer else channel for channel in RGB]
+
+
+def layers_from_channels(channel_names):
+	"""Names of the layers that have all of R, G and B"""
+	names = set(channel_names)
+	return set(layer for layer in (name.rpartition(".")[0] for name in names if name.rpartition(".")[2] == "R")
+			if all(channel in names for channel in layer_channels(layer)))
+
+
+def group_passes(layers):
+	"""Map every light group to the passes rendered for it"""
+	# Longest first, so warm_diffuse_direct isn't read as a direct pass
+	passes = sorted(SCATTER_EVENTS, key=len, reverse=True)
+	groups = OrderedDict()
+	for layer in sorted(layers):
+		for render_pass in passes:
+			suffix = "_" + render_pass
+			if layer.endswith(suffix) and len(layer) > len(suffix):
+				groups.setdefault(layer[:-len(suffix)], set()).add(render_pass)
+				break
+	return groups
+
+
+class Check(object):
+	"""Passes that should add up to a reference layer"""
+
+	def __init__(self, name, level, parts, reference):
+		super(Check, self).__init__()
+		self.name = name
+		self.level = level
+		# light group -> its layers that are added up
+		self.parts = parts
+		self.reference = reference
+
+
+def plan_checks(layers):
+	"""Every check a frame with these layers can be verified with"""
+	groups = group_passes(layers)
+	checks = []
+	for level in LEVELS:
+		level_passes = AOV_PASSES[level]
+		complete = [group_name for group_name, passes in groups.items() if passes.issuperset(level_passes)]
+		for group_name in complete:
+			if "beauty" in groups[group_name]:
+				parts = OrderedDict([(group_name, ["{}_{}".format(group_name, render_pass)
+												for render_pass in level_passes])])
+				checks.append(Check("{}/{}".format(group_name, level), level, parts,
+									"{}_beauty".format(group_name)))
+		# Groups with only a beauty pass don't break down into passes at all
+		breakdown_groups = [group_name for group_name, passes in groups.items() if passes != set(["beauty"])]
+		if BEAUTY_LAYER in layers and complete and len(complete) == len(breakdown_groups):
+			parts = OrderedDict((group_name, ["{}_{}".format(group_name, render_pass)
+											for render_pass in level_passes]) for group_name in complete)
+			checks.append(Check("all/{}".format(level), level, parts, BEAUTY_LAYER))
+	return checks
+
+
+class ExrFrame(object):
+	"""An EXR file read a band of scanlines at a time"""
+
+	def __init__(self, path):
+		super(ExrFrame, self).__init__()
+		if not (NUMPY_AVAILABLE and OPENEXR_AVAILABLE):
+			raise ImportError("Reading EXRs needs the numpy and OpenEXR modules")
+		self.path = path
+		self._file = OpenEXR.InputFile(path)
+		header = self._file.header()
+		window = header["dataWindow"]
+		self._top = window.min.y
+		self.width = window.max.x - window.min.x + 1
+		self.height = window.max.y - window.min.y + 1
+		self.layers = layers_from_channels(header["channels"].keys())
+		self._pixel_type = Imath.PixelType(Imath.PixelType.FLOAT)
+
+	def read(self, layer, start, end):
+		"""Rows start to end of a layer as a float32 array of shape (rows, width, 3)"""
+		# OpenEXR's scanline range is inclusive and in data window coordinates
+		channels = self._file.channels(layer_channels(layer), self._pixel_type, self._top + start, self._top + end - 1)
+		rows = end - start
+		return np.dstack([np.frombuffer(data, dtype=np.float32).reshape(rows, self.width) for data in channels])
+
+	def close(self):
+		self._file.close()
+
+
+class ArrayFrame(object):
+	"""Layers that are already in memory as (height, width, 3) arrays"""
+
+	def __init__(self, layers):
+		super(ArrayFrame, self).__init__()
+		self._arrays = layers
+		self.layers = set(layers)
+		self.height, self.width = next(iter(layers.values())).shape[:2]
+
+	def read(self, layer, start, end):
+		return self._arrays[layer][start:end]
+
+	def close(self):
+		pass
+
+
+class ErrorStats(object):
+	"""Per-pixel error of one check, added up band by band"""
+
+	def __init__(self, width, height, tolerance, block=HEATMAP_BLOCK):
+		super(ErrorStats, self).__init__()
+		self.tolerance = tolerance
+		self.block = block
+		self.pixels = 0
+		self.bad_pixels = 0
+		self.max_error = 0.0
+		self._error_sum = 0.0
+		self._square_sum = 0.0
+		self._reference_sum = 0.0
+		self.heatmap = np.zeros((-(-height // block), -(-width // block)), dtype=np.float32)
+
+	def add(self, total, reference, start):
+		"""Compare a band of summed passes, starting at row start, with the reference"""
+		# The worst channel of each pixel
+		error = np.abs(total - reference).max(axis=2)
+		magnitude = np.abs(reference).max(axis=2)
+		self.pixels += error.size
+		self.bad_pixels += int(np.count_nonzero(error > self.tolerance * np.maximum(magnitude, 1.0)))
+		self.max_error = max(self.max_error, float(error.max()))
+		self._error_sum += float(error.sum(dtype=np.float64))
+		self._square_sum += float(np.square(error.astype(np.float64)).sum())
+		self._reference_sum += float(magnitude.sum(dtype=np.float64))
+
+		rows, width = error.shape
+		block = self.block
+		padded = np.zeros((-(-rows // block) * block, -(-width // block) * block), dtype=np.float32)
+		padded[:rows, :width] = error
+		blocks = padded.reshape(padded.shape[0] // block, block, padded.shape[1] // block, block).max(axis=(1, 3))
+		self.heatmap[start // block:start // block + blocks.shape[0]] = blocks
+
+	def result(self):
+		pixels = max(self.pixels, 1)
+		return {
+			"pixels": self.pixels,
+			"max": self.max_error,
+			"mean": self._error_sum / pixels,
+			"rms": math.sqrt(self._square_sum / pixels),
+			"relative": self._error_sum / self._reference_sum if self._reference_sum else 0.0,
+			"bad_pixels": self.bad_pixels,
+			"passed": self.bad_pixels == 0
+		}
+
+
+def verify_frame(frames, tolerance=DEFAULT_TOLERANCE, band_height=DEFAULT_BAND_HEIGHT, block=HEATMAP_BLOCK):
+	"""
+	Run every check the layers of a frame allow. frames are the files of one
+	frame, like ExrFrame or ArrayFrame. Returns an OrderedDict of check name
+	-> ErrorStats.
+	"""
+	sources = {}
+	for frame in frames:
+		if (frame.width, frame.height) != (frames[0].width, frames[0].height):
+			raise ValueError("Files of one frame differ in size")
+		for layer in frame.layers:
+			sources.setdefault(layer, frame)
+	width, height = frames[0].width, frames[0].height
+
+	checks = plan_checks(sources)
+	stats = OrderedDict((check.name, ErrorStats(width, height, tolerance, block)) for check in checks)
+	references = dict((check.name, check.reference) for check in checks)
+	# The levels each group is summed for, shared by its own and the total checks
+	group_levels = OrderedDict()
+	for check in checks:
+		for group_name, parts in check.parts.items():
+			group_levels.setdefault(group_name, OrderedDict())[check.level] = parts
+
+	band_height = max(block, band_height // block * block)
+	for start in range(0, height, band_height):
+		end = min(height, start + band_height)
+		totals = {}
+		for group_name, levels in group_levels.items():
+			# The group's layers are read once per band, whatever the levels share
+			layers = {}
+			for level, parts in levels.items():
+				level_sum = None
+				for layer in parts:
+					if layer not in layers:
+						layers[layer] = sources[layer].read(layer, start, end)
+					if level_sum is None:
+						level_sum = np.array(layers[layer], dtype=np.float32)
+					else:
+						level_sum += layers[layer]
+
+				name = "{}/{}".format(group_name, level)
+				if name in stats:
+					reference = references[name]
+					stats[name].add(level_sum, sources[reference].read(reference, start, end), start)
+				if "all/{}".format(level) in stats:
+					if level in totals:
+						totals[level] += level_sum
+					else:
+						totals[level] = level_sum
+
+		if totals:
+			beauty = sources[BEAUTY_LAYER].read(BEAUTY_LAYER, start, end)
+			for level, total in totals.items():
+				stats["all/{}".format(level)].add(total, beauty, start)
+	return stats
+
+
+def write_heatmap(path, heatmap):
+	"""Write a heatmap as a greyscale PFM image"""
+	with open(path, "wb") as heatmap_file:
+		heatmap_file.write("Pf\n{} {}\n-1.0\n".format(heatmap.shape[1], heatmap.shape[0]).encode("ascii"))
+		# PFM rows go from the bottom up
+		heatmap_file.write(np.flipud(heatmap).astype("<f4").tobytes())
+
+
+def parse_frame_range(text):
+	"""Turn "1001-1010", "1001-1100x5" or "1001,1005,1010-1012" into frame numbers"""
+	frames = []
+	for part in text.split(","):
+		match = re.match(r"^\s*(-?\d+)(?:-(-?\d+)(?:x(\d+))?)?\s*$", part)
+		if match is None:
+			raise ValueError("Expected FIRST-LAST[xSTEP] frames, got '{}'".format(part))
+		first = int(match.group(1))
+		last = int(match.group(2)) if match.group(2) else first
+		step = int(match.group(3)) if match.group(3) else 1
+		if last < first or step < 1:
+			raise ValueError("Invalid frame range '{}'".format(part))
+		frames.extend(range(first, last + 1, step))
+	return list(OrderedDict.fromkeys(frames))
+
+
+def frame_path(pattern, frame):
+	"""Replace the run of # in a pattern with the zero padded frame number"""
+	return re.sub(r"#+", lambda match: "{:0{}d}".format(frame, len(match.group(0))), pattern)
+
+
+def expand_frames(patterns, frames):
+	"""Map every frame to the files its patterns match"""
+	frame_paths = OrderedDict()
+	for frame in frames:
+		paths = []
+		for pattern in patterns:
+			path = frame_path(pattern, frame)
+			for match in (sorted(glob.glob(path)) if glob.has_magic(path) else [path]):
+				if match not in paths:
+					paths.append(match)
+		frame_paths[frame] = paths
+	return frame_paths
+
+
+def verify_job(job):
+	"""Verify the files of one frame, returning a result dict"""
+	frame, paths, tolerance, band_height = job
+	result = {"frame": frame, "paths": paths, "ok": False, "passed": False, "seconds": 0.0,
+			"checks": None, "heatmaps": None, "error": None}
+	start = timeit.default_timer()
+	try:
+		if not paths:
+			raise IOError("No files for frame {}".format(frame))
+		frames = [ExrFrame(path) for path in paths]
+		try:
+			stats = verify_frame(frames, tolerance, band_height)
+		finally:
+			for opened in frames:
+				opened.close()
+		if not stats:
+			raise ValueError("Frame {} has no light group passes to check".format(frame))
+		result["checks"] = OrderedDict((name, check.result()) for name, check in stats.items())
+		result["heatmaps"] = OrderedDict((name, check.heatmap) for name, check in stats.items())
+		result["passed"] = all(check["passed"] for check in result["checks"].values())
+		result["ok"] = True
+	except Exception:
+		result["error"] = traceback.format_exc()
+	result["seconds"] = timeit.default_timer() - start
+	return result
+
+
+def run_verify(frame_paths, workers=1, tolerance=DEFAULT_TOLERANCE, band_height=DEFAULT_BAND_HEIGHT, report=None):
+	"""Verify every frame, calling report(result) as each one finishes"""
+	jobs = [(frame, paths, tolerance, band_height) for frame, paths in frame_paths.items()]
+	results = []
+	if workers <= 1:
+		for job in jobs:
+			results.append(verify_job(job))
+			if report:
+				report(results[-1])
+		return results
+
+	pool = multiprocessing.Pool(processes=workers)
+	try:
+		for result in pool.imap_unordered(verify_job, jobs):
+			results.append(result)
+			if report:
+				report(result)
+	finally:
+		pool.close()
+		pool.join()
+	results.sort(key=lambda result: result["frame"])
+	return results
+
+
+def format_result(result):
+	if not result["ok"]:
+		return "FAILED  {:>8.2f}s  frame {}".format(result["seconds"], result["frame"])
+	checks = result["checks"]
+	passed = sum(1 for check in checks.values() if check["passed"])
+	lines = ["{:<7} {:>8.2f}s  frame {}  {}/{} checks passed".format(
+		"ok" if result["passed"] else "WRONG", result["seconds"], result["frame"], passed, len(checks))]
+	for name, check in checks.items():
+		if not check["passed"]:
+			lines.append("        {:<24} max {:.4g}  mean {:.4g}  relative {:.2%}  {} pixels over".format(
+				name, check["max"], check["mean"], check["relative"], check["bad_pixels"]))
+	return "\n".join(lines)
+
+
+def format_summary(results, elapsed):
+	failures = [result for result in results if not result["ok"]]
+	wrong = [result for result in results if result["ok"] and not result["passed"]]
+	lines = ["{} frames, {} with errors over the tolerance, {} failed, {:.2f}s".format(
+		len(results), len(wrong), len(failures), elapsed)]
+	for result in failures:
+		lines.append("")
+		lines.append("FAILED frame {}".format(result["frame"]))
+		lines.append(result["error"].rstrip())
+	return "\n".join(lines)
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Check that rendered light group AOVs add up to the beauty")
+	parser.add_argument("patterns", nargs="+", help="EXR paths with #### for the frame number, may be globs")
+	parser.add_argument("--frames", required=True, help="frame range like 1001-1100, 1001-1100x5 or 1001,1005")
+	parser.add_argument("--workers", type=int, default=max(1, multiprocessing.cpu_count() // 2),
+						help="number of worker processes")
+	parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+						help="allowed error per pixel, relative to the beauty (default 0.01)")
+	parser.add_argument("--band-height", type=int, default=DEFAULT_BAND_HEIGHT,
+						help="scanlines read at once (default 64)")
+	parser.add_argument("--heatmaps", help="write a PFM heatmap of every check into this directory")
+	parser.add_argument("--json", help="also write the per-frame results to this JSON file")
+	args = parser.parse_args(argv)
+
+	if not (NUMPY_AVAILABLE and OPENEXR_AVAILABLE):
+		parser.error("the numpy and OpenEXR modules are required")
+	try:
+		frames = parse_frame_range(args.frames)
+	except ValueError as error:
+		parser.error(str(error))
+
+	def report(result):
+		print(format_result(result))
+		sys.stdout.flush()
+
+	start = timeit.default_timer()
+	results = run_verify(expand_frames(args.patterns, frames), min(args.workers, len(frames)),
+						args.tolerance, args.band_height, report)
+	print("")
+	print(format_summary(results, timeit.default_timer() - start))
+
+	if args.heatmaps and not os.path.isdir(args.heatmaps):
+		os.makedirs(args.heatmaps)
+	for result in results:
+		heatmaps = result.pop("heatmaps") or {}
+		if args.heatmaps:
+			for name, heatmap in heatmaps.items():
+				file_name = "{}.{}.pfm".format(name.replace("/", "_"), result["frame"])
+				write_heatmap(os.path.join(args.heatmaps, file_name), heatmap)
+
+	if args.json:
+		with open(args.json, "w") as json_file:
+			json.dump(results, json_file, indent=2)
+	return 0 if all(result["ok"] and result["passed"] for result in results) else 1
+
+
+if __name__ == '__main__':
+	sys.exit(main())
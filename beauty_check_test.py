@@ -0,0 +1,97 @@
+import unittest
+from beauty_check import NUMPY_AVAILABLE
+from beauty_check import expand_frames
+from beauty_check import group_passes
+from beauty_check import layers_from_channels
+from beauty_check import parse_frame_range
+from beauty_check import plan_checks
+from lpe import AOV_PASSES
+
+if NUMPY_AVAILABLE:
+	import numpy as np
+	from beauty_check import ArrayFrame
+	from beauty_check import verify_frame
+
+
+def pass_layers(group_name, level):
+	return ["{}_{}".format(group_name, render_pass) for render_pass in AOV_PASSES[level]]
+
+
+class PlanChecksTest(unittest.TestCase):
+	"""Test class for finding what a rendered frame can be checked with"""
+
+	def test_finds_rgb_layers(self):
+		channels = ["R", "G", "B", "A", "warm_direct.R", "warm_direct.G", "warm_direct.B", "Z", "N.R"]
+		self.assertEqual(layers_from_channels(channels), set(["", "warm_direct"]))
+
+	def test_prefers_the_longest_pass_name(self):
+		groups = group_passes(["warm_diffuse_direct", "key_rim_direct", "warm_beauty"])
+		self.assertEqual(groups["warm"], set(["diffuse_direct", "beauty"]))
+		self.assertEqual(groups["key_rim"], set(["direct"]))
+
+	def test_checks_every_complete_level(self):
+		layers = set(pass_layers("warm", "fine") + pass_layers("warm", "coarse") + ["warm_beauty", ""] +
+					pass_layers("cold", "coarse"))
+		names = [check.name for check in plan_checks(layers)]
+		self.assertEqual(names, ["warm/coarse", "all/coarse", "warm/fine"])
+
+	def test_skips_the_total_without_a_beauty(self):
+		names = [check.name for check in plan_checks(set(pass_layers("warm", "coarse")))]
+		self.assertEqual(names, [])
+
+
+class FrameRangeTest(unittest.TestCase):
+	"""Test class for frame ranges and paths"""
+
+	def test_parses_ranges_steps_and_lists(self):
+		self.assertEqual(parse_frame_range("1001-1003"), [1001, 1002, 1003])
+		self.assertEqual(parse_frame_range("1-9x4,12"), [1, 5, 9, 12])
+
+	def test_rejects_bad_ranges(self):
+		self.assertRaises(ValueError, parse_frame_range, "10-1")
+		self.assertRaises(ValueError, parse_frame_range, "first")
+
+	def test_pads_frame_numbers(self):
+		frame_paths = expand_frames(["shot.####.exr", "shot_lpe.#.exr"], [7])
+		self.assertEqual(frame_paths[7], ["shot.0007.exr", "shot_lpe.7.exr"])
+
+
+@unittest.skipUnless(NUMPY_AVAILABLE, "verifying frames needs numpy")
+class VerifyFrameTest(unittest.TestCase):
+	"""Test class for verifying frames band by band"""
+
+	def setUp(self):
+		random = np.random.RandomState(1)
+		self.layers = {}
+		for group_name in ["warm", "cold"]:
+			for layer in pass_layers(group_name, "coarse"):
+				self.layers[layer] = random.uniform(0, 2, (40, 50, 3)).astype(np.float32)
+			self.layers[group_name + "_beauty"] = sum(self.layers[layer] for layer in pass_layers(group_name, "coarse"))
+		self.layers[""] = self.layers["warm_beauty"] + self.layers["cold_beauty"]
+
+	def test_passes_when_the_passes_add_up(self):
+		stats = verify_frame([ArrayFrame(self.layers)], band_height=16, block=8)
+		self.assertEqual(list(stats), ["cold/coarse", "warm/coarse", "all/coarse"])
+		for check in stats.values():
+			self.assertTrue(check.result()["passed"])
+			self.assertEqual(check.result()["pixels"], 2000)
+
+	def test_reports_where_passes_overlap(self):
+		self.layers["warm_indirect"][20:24, 30:32] += 1.0
+		stats = verify_frame([ArrayFrame(self.layers)], band_height=16, block=8)
+		result = stats["warm/coarse"].result()
+		self.assertEqual(result["bad_pixels"], 8)
+		self.assertAlmostEqual(result["max"], 1.0, places=4)
+		self.assertTrue(stats["cold/coarse"].result()["passed"])
+		self.assertFalse(stats["all/coarse"].result()["passed"])
+		heatmap = stats["warm/coarse"].heatmap
+		self.assertEqual(heatmap.shape, (5, 7))
+		self.assertEqual(list(zip(*np.nonzero(heatmap > 0.5))), [(2, 3)])
+
+	def test_reads_no_more_than_a_band(self):
+		frame = ArrayFrame(self.layers)
+		rows = []
+		read = frame.read
+		frame.read = lambda layer, start, end: rows.append(end - start) or read(layer, start, end)
+		verify_frame([frame], band_height=20, block=8)
+		self.assertEqual(max(rows), 16)
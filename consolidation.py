@@ -0,0 +1,85 @@
+"""
+Smaller AOV setups.
+
+Every LPE AOV is evaluated for every camera sample and gets its own frame
+buffer, so AOVs that comp never needs separately are pure render cost.
+Two kinds can go:
+- Light groups that are only ever used together can be merged into one
+  group whose AOVs match all of its members: <L.('key'|'fill')>.
+- A pass that other passes of the same group add up to is redundant, like
+  a group's beauty next to its fine breakdown, or its diffuse next to
+  diffuse_direct and diffuse_indirect.
+
+LPEManager.plan_consolidation() turns both into a ReconcilePlan. The
+merged groups a scene uses are stored in its fileInfo, so they're
+registered again whenever a manager attaches to the scene, in Maya or in a
+batch worker.
+"""
+import base64
+import json
+from collections import OrderedDict
+from lpe import AOV_PASSES
+
+MERGES_KEY = "lpeManagerMergedGroups"
+
+# Passes that each list of other passes adds up to, most detailed first
+PASS_BREAKDOWNS = OrderedDict([
+	("beauty", sorted(AOV_PASSES.values(), key=len, reverse=True)),
+	("diffuse", [["diffuse_direct", "diffuse_indirect"]]),
+	("specular", [["specular_direct", "specular_indirect", "coat"]])
+])
+
+
+def redundant_passes(passes):
+	"""
+	Map every pass the other passes add up to, to the passes that replace it.
+	A pass that replaces another one is never reported as redundant itself,
+	so dropping every reported pass keeps the sum intact.
+	"""
+	present = set(passes)
+	redundant = OrderedDict()
+	required = set()
+	for render_pass, breakdowns in PASS_BREAKDOWNS.items():
+		if render_pass not in present or render_pass in required:
+			continue
+		for parts in breakdowns:
+			if all(part in present and part not in redundant for part in parts):
+				redundant[render_pass] = list(parts)
+				required.update(parts)
+				break
+	return redundant
+
+
+def merge_spec(spec, merges):
+	"""
+	Replace the member groups of each merge with the merged group, which
+	gets every pass any of its members had, in the order they came.
+	"""
+	merged_into = {}
+	for merged_name, members in merges.items():
+		for member in members:
+			merged_into[member] = merged_name
+
+	merged = OrderedDict()
+	for group_name, passes in spec.items():
+		if not isinstance(passes, (list, tuple)):
+			passes = AOV_PASSES[passes]
+		target = merged.setdefault(merged_into.get(group_name, group_name), [])
+		target.extend(render_pass for render_pass in passes if render_pass not in target)
+	return merged
+
+
+def encode_merges(merges):
+	# Base64, so fileInfo quoting can't damage the JSON
+	data = json.dumps(merges, separators=(",", ":")).encode("utf-8")
+	return base64.b64encode(data).decode("ascii")
+
+
+def decode_merges(text):
+	"""Decode stored merged groups, or return an empty dict when they're missing or damaged"""
+	if not text:
+		return OrderedDict()
+	try:
+		return json.loads(base64.b64decode(text).decode("utf-8"), object_pairs_hook=OrderedDict)
+	except (TypeError, ValueError):
+		return OrderedDict()
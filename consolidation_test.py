@@ -0,0 +1,51 @@
+import unittest
+from consolidation import decode_merges
+from consolidation import encode_merges
+from consolidation import merge_spec
+from consolidation import redundant_passes
+from lpe import AOV_PASSES
+
+
+class RedundantPassesTest(unittest.TestCase):
+	"""Test class for redundant_passes"""
+
+	def test_finds_beauty_next_to_a_breakdown(self):
+		redundant = redundant_passes(["beauty"] + AOV_PASSES["fine"])
+		self.assertEqual(list(redundant.keys()), ["beauty"])
+		self.assertEqual(redundant["beauty"], AOV_PASSES["fine"])
+
+	def test_keeps_beauty_without_a_full_breakdown(self):
+		self.assertEqual(redundant_passes(["beauty", "direct", "indirect"]), {})
+
+	def test_finds_diffuse_next_to_its_parts(self):
+		redundant = redundant_passes(["diffuse", "diffuse_direct", "diffuse_indirect"])
+		self.assertEqual(list(redundant.keys()), ["diffuse"])
+
+	def test_never_drops_a_pass_another_one_relies_on(self):
+		# Beauty is rebuilt from medium, so medium's diffuse has to stay
+		passes = ["beauty"] + AOV_PASSES["medium"] + ["diffuse_direct", "diffuse_indirect"]
+		redundant = redundant_passes(passes)
+		self.assertEqual(list(redundant.keys()), ["beauty"])
+
+
+class MergeSpecTest(unittest.TestCase):
+	"""Test class for merge_spec"""
+
+	def test_merges_member_passes(self):
+		spec = {"key": ["direct", "indirect"], "fill": ["indirect", "emission"], "rim": "coarse"}
+		merged = merge_spec(spec, {"keyfill": ["key", "fill"]})
+		self.assertEqual(sorted(merged.keys()), ["keyfill", "rim"])
+		self.assertEqual(sorted(merged["keyfill"]), ["direct", "emission", "indirect"])
+		self.assertEqual(merged["rim"], AOV_PASSES["coarse"])
+
+
+class MergesTest(unittest.TestCase):
+	"""Test class for storing merged groups"""
+
+	def test_round_trips_merges(self):
+		merges = {"key_fill": ["fill", "key"]}
+		self.assertEqual(dict(decode_merges(encode_merges(merges))), merges)
+
+	def test_ignores_damaged_text(self):
+		self.assertEqual(dict(decode_merges("not base64!")), {})
+		self.assertEqual(dict(decode_merges(None)), {})
@@ -0,0 +1,307 @@
+"""
+How much every rendered light group AOV adds to a shot.
+
+Many light groups with fine passes render AOVs that stay black for the
+whole shot, like sss or volume for a rim light, and each still costs LPE
+evaluation, frame buffer memory and disk. This reads the rendered frames a
+band of scanlines at a time and keeps, per layer, its peak value and its
+energy: the sum of its RGB over every pixel. Summed over a frame range,
+every light group AOV gets its peak and its share of the beauty's energy.
+
+LPEManager.plan_pruning() turns the AOVs whose peak stayed under a
+threshold into a ReconcilePlan that deletes them. Removing them keeps every
+level's sum intact, since they add nothing to it. Only AOVs found in every
+frame of the range count as dead: a frame that's missing or failed to read
+could be the one where they light something. Pruned AOVs are stored in the
+scene, so reconciling a spec or preset doesn't build them again.
+
+The stats of every file are cached on disk with its modification time and
+size, so analyzing a growing frame range only reads the new frames:
+	python contribution.py "renders/shot010.####.exr" --frames 1001-1100 --cache shot010_stats.json --json shot010_contributions.json
+and in Maya:
+	manager.prune(contribution.load_contributions("shot010_contributions.json"), dry_run=True).describe()
+"""
+import argparse
+import base64
+import json
+import multiprocessing
+import os
+import sys
+import timeit
+import traceback
+from collections import OrderedDict
+from beauty_check import BEAUTY_LAYER
+from beauty_check import DEFAULT_BAND_HEIGHT
+from beauty_check import ExrFrame
+from beauty_check import NUMPY_AVAILABLE
+from beauty_check import OPENEXR_AVAILABLE
+from beauty_check import expand_frames
+from beauty_check import group_passes
+from beauty_check import parse_frame_range
+
+if NUMPY_AVAILABLE:
+	import numpy as np
+
+CACHE_VERSION = 2
+
+PRUNED_KEY = "lpeManagerPrunedAOVs"
+
+# Brightest an AOV may get over the whole frame range and still be pruned
+DEFAULT_PEAK = 1e-4
+
+
+def frame_stats(frame, band_height=DEFAULT_BAND_HEIGHT):
+	"""[peak, energy] of every layer of a frame, read a band at a time"""
+	stats = OrderedDict((layer, [0.0, 0.0]) for layer in sorted(frame.layers))
+	for start in range(0, frame.height, band_height):
+		end = min(frame.height, start + band_height)
+		for layer, layer_stats in stats.items():
+			band = np.abs(frame.read(layer, start, end))
+			layer_stats[0] = max(layer_stats[0], float(band.max()))
+			layer_stats[1] += float(band.sum(dtype=np.float64))
+	return stats
+
+
+def file_stamp(path):
+	stat = os.stat(path)
+	return [stat.st_mtime, stat.st_size]
+
+
+class StatsCache(object):
+	"""Stats read from rendered files, kept while a file is unchanged"""
+
+	def __init__(self, path=None):
+		super(StatsCache, self).__init__()
+		self.path = path
+		self._files = {}
+		if path and os.path.exists(path):
+			try:
+				with open(path) as cache_file:
+					data = json.load(cache_file)
+			except ValueError:
+				data = {}
+			if data.get("version") == CACHE_VERSION:
+				self._files = data.get("files", {})
+
+	def __len__(self):
+		return len(self._files)
+
+	def get(self, path):
+		"""The stats of a file, or None when it isn't cached or has changed since"""
+		entry = self._files.get(os.path.abspath(path))
+		if entry is None:
+			return None
+		try:
+			if entry["stamp"] != file_stamp(path):
+				return None
+		except OSError:
+			return None
+		return entry["stats"]
+
+	def put(self, path, stamp, stats):
+		self._files[os.path.abspath(path)] = {"stamp": stamp, "stats": stats}
+
+	def save(self):
+		if self.path:
+			with open(self.path, "w") as cache_file:
+				json.dump({"version": CACHE_VERSION, "files": self._files}, cache_file)
+
+
+def analyze_job(job):
+	"""Read the layer stats of one file, returning a result dict"""
+	path, band_height = job
+	result = {"path": path, "frame": None, "ok": False, "cached": False, "seconds": 0.0, "stamp": None,
+			"layers": None, "error": None}
+	start = timeit.default_timer()
+	try:
+		# Stamped before reading, so a file rewritten meanwhile is read again next time
+		result["stamp"] = file_stamp(path)
+		frame = ExrFrame(path)
+		try:
+			result["layers"] = frame_stats(frame, band_height)
+		finally:
+			frame.close()
+		result["ok"] = True
+	except Exception:
+		result["error"] = traceback.format_exc()
+	result["seconds"] = timeit.default_timer() - start
+	return result
+
+
+def run_analysis(frame_paths, workers=1, band_height=DEFAULT_BAND_HEIGHT, cache=None, report=None):
+	"""
+	Get the layer stats of every file of every frame, calling report(result)
+	as each file finishes. Cached files aren't read again, and the files that
+	were read are added to the cache.
+	"""
+	if cache is None:
+		cache = StatsCache()
+	results = []
+	jobs = []
+	path_frames = {}
+	for frame, paths in frame_paths.items():
+		if not paths:
+			results.append({"path": None, "frame": frame, "ok": False, "cached": False, "seconds": 0.0,
+							"stamp": None, "layers": None, "error": "No files for frame {}".format(frame)})
+			if report:
+				report(results[-1])
+		for path in paths:
+			path_frames[path] = frame
+			layers = cache.get(path)
+			if layers is None:
+				jobs.append((path, band_height))
+			else:
+				results.append({"path": path, "frame": frame, "ok": True, "cached": True, "seconds": 0.0,
+								"stamp": None, "layers": layers, "error": None})
+				if report:
+					report(results[-1])
+
+	def finished(result):
+		result["frame"] = path_frames[result["path"]]
+		results.append(result)
+		if result["ok"]:
+			cache.put(result["path"], result["stamp"], result["layers"])
+		if report:
+			report(result)
+
+	if workers <= 1 or len(jobs) <= 1:
+		for job in jobs:
+			finished(analyze_job(job))
+	else:
+		pool = multiprocessing.Pool(processes=workers)
+		try:
+			for result in pool.imap_unordered(analyze_job, jobs):
+				finished(result)
+		finally:
+			pool.close()
+			pool.join()
+	cache.save()
+	return results
+
+
+def aggregate(results):
+	"""
+	Sum the stats of every file into one dict per layer with its peak, its
+	energy, its share of the beauty's energy, the number of frames it was
+	found in, and whether that's complete: every frame, with none failed.
+	"""
+	totals = OrderedDict()
+	layer_frames = {}
+	frames = set()
+	failed = False
+	for result in results:
+		frame = result.get("frame", result["path"])
+		frames.add(frame)
+		if not result["ok"]:
+			failed = True
+			continue
+		for layer, (peak, energy) in result["layers"].items():
+			total = totals.setdefault(layer, {"peak": 0.0, "energy": 0.0, "share": None})
+			total["peak"] = max(total["peak"], peak)
+			total["energy"] += energy
+			layer_frames.setdefault(layer, set()).add(frame)
+
+	beauty = totals.get(BEAUTY_LAYER)
+	for layer, total in totals.items():
+		if beauty is not None and beauty["energy"] > 0:
+			total["share"] = total["energy"] / beauty["energy"]
+		total["frames"] = len(layer_frames[layer])
+		total["complete"] = not failed and total["frames"] == len(frames)
+	return totals
+
+
+def dead_aovs(contributions, peak=DEFAULT_PEAK):
+	"""
+	Names of the light group AOVs whose peak never got over peak, in every
+	frame. AOVs whose totals aren't complete are never dead.
+	"""
+	groups = group_passes(contributions)
+	names = set("{}_{}".format(group_name, render_pass)
+				for group_name, passes in groups.items() for render_pass in passes)
+	return sorted(name for name in names
+				if contributions[name]["peak"] <= peak and contributions[name].get("complete", True))
+
+
+def encode_pruned(names):
+	# Base64, so fileInfo quoting can't damage the JSON
+	data = json.dumps(sorted(names), separators=(",", ":")).encode("utf-8")
+	return base64.b64encode(data).decode("ascii")
+
+
+def decode_pruned(text):
+	"""Decode the stored names of pruned AOVs, or return an empty set when they're missing or damaged"""
+	if not text:
+		return set()
+	try:
+		return set(json.loads(base64.b64decode(text).decode("utf-8")))
+	except (TypeError, ValueError):
+		return set()
+
+
+def load_contributions(path):
+	with open(path) as contributions_file:
+		return json.load(contributions_file)["contributions"]
+
+
+def format_contributions(contributions, peak=DEFAULT_PEAK):
+	dead = set(dead_aovs(contributions, peak))
+	lines = ["{:<32} {:>12} {:>10}".format("AOV", "peak", "share")]
+	for name in sorted(contributions, key=lambda name: contributions[name]["energy"]):
+		total = contributions[name]
+		share = "-" if total["share"] is None else "{:.3%}".format(total["share"])
+		if name in dead:
+			note = "  dead"
+		elif not total.get("complete", True):
+			note = "  partial"
+		else:
+			note = ""
+		lines.append("{:<32} {:>12.4g} {:>10}{}".format(name or "(beauty)", total["peak"], share, note))
+	return "\n".join(lines)
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Measure how much every rendered light group AOV contributes")
+	parser.add_argument("patterns", nargs="+", help="EXR paths with #### for the frame number, may be globs")
+	parser.add_argument("--frames", required=True, help="frame range like 1001-1100, 1001-1100x5 or 1001,1005")
+	parser.add_argument("--workers", type=int, default=max(1, multiprocessing.cpu_count() // 2),
+						help="number of worker processes")
+	parser.add_argument("--band-height", type=int, default=DEFAULT_BAND_HEIGHT,
+						help="scanlines read at once (default 64)")
+	parser.add_argument("--cache", help="JSON file that keeps the stats of files already read")
+	parser.add_argument("--peak", type=float, default=DEFAULT_PEAK,
+						help="AOVs that never get brighter than this are dead (default 1e-4)")
+	parser.add_argument("--json", help="write the contributions and dead AOVs to this JSON file")
+	args = parser.parse_args(argv)
+
+	if not (NUMPY_AVAILABLE and OPENEXR_AVAILABLE):
+		parser.error("the numpy and OpenEXR modules are required")
+	try:
+		frames = parse_frame_range(args.frames)
+	except ValueError as error:
+		parser.error(str(error))
+
+	def report(result):
+		if not result["ok"]:
+			print("FAILED  {}\n{}".format(result["path"] or result["frame"], result["error"].rstrip()))
+		sys.stdout.flush()
+
+	start = timeit.default_timer()
+	cache = StatsCache(args.cache)
+	results = run_analysis(expand_frames(args.patterns, frames), args.workers, args.band_height, cache, report)
+	contributions = aggregate(results)
+	print(format_contributions(contributions, args.peak))
+	failures = [result for result in results if not result["ok"]]
+	cached = sum(1 for result in results if result["cached"])
+	print("")
+	print("{} files, {} cached, {} failed, {:.2f}s".format(
+		len(results), cached, len(failures), timeit.default_timer() - start))
+
+	if args.json:
+		with open(args.json, "w") as json_file:
+			json.dump({"contributions": contributions, "dead": dead_aovs(contributions, args.peak)},
+					json_file, indent=2)
+	return 0 if not failures else 1
+
+
+if __name__ == '__main__':
+	sys.exit(main())
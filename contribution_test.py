@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+import unittest
+from contribution import NUMPY_AVAILABLE
+from contribution import StatsCache
+from contribution import aggregate
+from contribution import dead_aovs
+from contribution import decode_pruned
+from contribution import encode_pruned
+from contribution import run_analysis
+
+if NUMPY_AVAILABLE:
+	import numpy as np
+	from beauty_check import ArrayFrame
+	from contribution import frame_stats
+
+
+def file_result(layers, frame=1001):
+	return {"path": "", "frame": frame, "ok": True, "cached": False, "seconds": 0.0, "stamp": None,
+			"layers": layers, "error": None}
+
+
+class ContributionTest(unittest.TestCase):
+	"""Test class for adding up the contributions of rendered AOVs"""
+
+	def test_adds_up_frames(self):
+		contributions = aggregate([
+			file_result({"": [4.0, 100.0], "rim_direct": [1.0, 20.0], "rim_sss": [0.0, 0.0]}),
+			file_result({"": [5.0, 100.0], "rim_direct": [2.0, 30.0], "rim_sss": [0.00001, 0.01]}, 1002)
+		])
+		self.assertEqual(contributions["rim_direct"], {"peak": 2.0, "energy": 50.0, "share": 0.25,
+													"frames": 2, "complete": True})
+		self.assertEqual(contributions["rim_sss"]["peak"], 0.00001)
+
+	def test_finds_dead_light_group_aovs(self):
+		contributions = aggregate([file_result({
+			"": [0.0, 0.0], "Z": [0.0, 0.0], "rim_sss": [0.0, 0.0], "rim_volume": [0.5, 1.0]})])
+		self.assertEqual(dead_aovs(contributions), ["rim_sss"])
+
+	def test_skips_failed_files(self):
+		failed = file_result(None)
+		failed["ok"] = False
+		self.assertEqual(aggregate([failed]), {})
+
+	def test_finds_nothing_dead_when_a_file_failed(self):
+		failed = file_result(None, 1002)
+		failed["ok"] = False
+		contributions = aggregate([file_result({"": [1.0, 1.0], "rim_sss": [0.0, 0.0]}), failed])
+		self.assertFalse(contributions["rim_sss"]["complete"])
+		self.assertEqual(dead_aovs(contributions), [])
+
+	def test_needs_every_frame_to_find_dead_aovs(self):
+		contributions = aggregate([
+			file_result({"": [1.0, 1.0], "rim_sss": [0.0, 0.0], "rim_direct": [1.0, 1.0]}, 1001),
+			file_result({"": [1.0, 1.0], "rim_direct": [1.0, 1.0]}, 1002)
+		])
+		self.assertEqual(contributions["rim_sss"]["frames"], 1)
+		self.assertEqual(dead_aovs(contributions), [])
+
+	def test_reports_frames_without_files_as_failed(self):
+		results = run_analysis({1001: []})
+		self.assertFalse(results[0]["ok"])
+		self.assertEqual(results[0]["frame"], 1001)
+
+	def test_stores_pruned_aovs(self):
+		self.assertEqual(decode_pruned(encode_pruned(set(["rim_sss", "key_volume"]))), set(["rim_sss", "key_volume"]))
+		self.assertEqual(decode_pruned("not base64!"), set())
+		self.assertEqual(decode_pruned(None), set())
+
+
+class StatsCacheTest(unittest.TestCase):
+	"""Test class for the stats cache of rendered files"""
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.frame_path = os.path.join(self.directory, "shot.1001.exr")
+		with open(self.frame_path, "w") as frame_file:
+			frame_file.write("frame")
+		self.cache_path = os.path.join(self.directory, "stats.json")
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def cached_stats(self):
+		cache = StatsCache(self.cache_path)
+		cache.put(self.frame_path, [os.stat(self.frame_path).st_mtime, 5], {"rim_sss": [0.0, 0.0]})
+		cache.save()
+		return StatsCache(self.cache_path)
+
+	def test_keeps_stats_between_runs(self):
+		self.assertEqual(self.cached_stats().get(self.frame_path), {"rim_sss": [0.0, 0.0]})
+
+	def test_forgets_changed_files(self):
+		cache = self.cached_stats()
+		with open(self.frame_path, "w") as frame_file:
+			frame_file.write("rendered again")
+		self.assertEqual(cache.get(self.frame_path), None)
+
+	def test_doesnt_read_cached_files_again(self):
+		results = run_analysis({1001: [self.frame_path]}, cache=self.cached_stats())
+		self.assertEqual(len(results), 1)
+		self.assertTrue(results[0]["cached"])
+
+	def test_writes_the_cache_on_a_cold_start(self):
+		# An empty cache is falsy, it still has to be the one that's saved
+		cache = StatsCache(self.cache_path)
+		self.assertEqual(len(cache), 0)
+		results = run_analysis({1001: [self.frame_path]}, cache=cache)
+		self.assertFalse(results[0]["cached"])
+		self.assertTrue(os.path.exists(self.cache_path))
+
+	def test_ignores_a_damaged_cache(self):
+		with open(self.cache_path, "w") as cache_file:
+			cache_file.write("{")
+		self.assertEqual(len(StatsCache(self.cache_path)), 0)
+
+
+@unittest.skipUnless(NUMPY_AVAILABLE, "reading frames needs numpy")
+class FrameStatsTest(unittest.TestCase):
+	"""Test class for the stats of a single frame"""
+
+	def test_reads_peak_and_energy_by_band(self):
+		layers = {"rim_direct": np.zeros((10, 4, 3), dtype=np.float32), "rim_sss": np.zeros((10, 4, 3), np.float32)}
+		layers["rim_direct"][9, 3] = [-3.0, 1.0, 0.5]
+		stats = frame_stats(ArrayFrame(layers), band_height=4)
+		self.assertEqual(stats["rim_direct"], [3.0, 4.5])
+		self.assertEqual(stats["rim_sss"], [0.0, 0.0])
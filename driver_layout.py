@@ -0,0 +1,113 @@
+"""
+How light group AOVs are written to disk.
+
+By default every aiAOV is written through defaultArnoldDriver at full
+precision. A DriverLayout sends the light group AOVs to their own EXR
+drivers instead:
+- "default" leaves the AOVs on defaultArnoldDriver.
+- "per_group" writes one multilayer EXR per light group.
+- "single" writes every light group AOV into one multipart EXR.
+The drivers share the layout's precision and compression, and the AOVs
+get the layout's data type. LPEManager applies a layout to every AOV it
+builds, with one batch of scene edits. The layout is stored in the scene,
+so AOVs built after a reopen go to the same drivers, and drivers left
+without AOVs are deleted.
+"""
+import base64
+import json
+from collections import OrderedDict
+from render_budget import COMPRESSION_RATIOS
+
+MODES = ["default", "per_group", "single"]
+
+# Arnold data types an aiAOV can be written as
+DATA_TYPES = {"float": 4, "rgb": 5, "rgba": 6}
+DATA_CHANNELS = {"float": 1, "rgb": 3, "rgba": 4}
+# Channels of each Arnold data type, as an aiAOV's type attribute holds it
+TYPE_CHANNELS = dict((DATA_TYPES[data_type], DATA_CHANNELS[data_type]) for data_type in DATA_TYPES)
+
+DEFAULT_DRIVER = "defaultArnoldDriver"
+DRIVER_PREFIX = "aiAOVDriver_lpe"
+LAYOUT_KEY = "lpeManagerDriverLayout"
+
+# DriverLayout arguments stored in the scene
+_SETTINGS = ["mode", "half_precision", "compression", "data_type", "prefix"]
+
+
+class DriverLayout(object):
+	"""Output drivers and data types for light group AOVs"""
+
+	def __init__(self, mode="per_group", half_precision=True, compression="zip", data_type="rgb",
+				prefix="<Scene>_lpe"):
+		super(DriverLayout, self).__init__()
+		if mode not in MODES:
+			raise ValueError("Unknown driver layout '{}', expected one of {}".format(mode, ", ".join(MODES)))
+		if compression not in COMPRESSION_RATIOS:
+			raise ValueError("Unknown EXR compression '{}'".format(compression))
+		if data_type not in DATA_TYPES:
+			raise ValueError("Unknown AOV data type '{}'".format(data_type))
+		self.mode = mode
+		self.half_precision = half_precision
+		self.compression = compression
+		self.data_type = data_type
+		self.prefix = prefix
+
+	@property
+	def channels(self):
+		return DATA_CHANNELS[self.data_type]
+
+	def output_bytes(self):
+		"""Bytes per channel on disk, or None when defaultArnoldDriver decides"""
+		if self.mode == "default":
+			return None
+		return 2 if self.half_precision else 4
+
+	def driver_settings(self, group_name=None):
+		"""Attributes for the driver of a light group, or of the shared driver"""
+		prefix = self.prefix if group_name is None else "{}_{}".format(self.prefix, group_name)
+		return {
+			"half_precision": self.half_precision,
+			"compression": self.compression,
+			"merge_aovs": True,
+			"multipart": self.mode == "single",
+			"prefix": prefix
+		}
+
+	def assign(self, aov_list):
+		"""
+		Group AOVs by the driver they're written through.
+		Returns an OrderedDict of driver name -> (settings, AOVs). The default
+		driver's settings are None, since they belong to the render settings.
+		"""
+		drivers = OrderedDict()
+		if self.mode == "default":
+			if aov_list:
+				drivers[DEFAULT_DRIVER] = (None, list(aov_list))
+			return drivers
+
+		for aov in aov_list:
+			if self.mode == "single":
+				driver_name, group_name = DRIVER_PREFIX, None
+			else:
+				driver_name, group_name = "{}_{}".format(DRIVER_PREFIX, aov.light_group), aov.light_group
+			if driver_name not in drivers:
+				drivers[driver_name] = (self.driver_settings(group_name), [])
+			drivers[driver_name][1].append(aov)
+		return drivers
+
+
+def encode_layout(layout):
+	# Base64, so fileInfo quoting can't damage the JSON
+	data = json.dumps(dict((name, getattr(layout, name)) for name in _SETTINGS), separators=(",", ":"))
+	return base64.b64encode(data.encode("utf-8")).decode("ascii")
+
+
+def decode_layout(text):
+	"""Decode a stored DriverLayout, or return None when it's missing or damaged"""
+	if not text:
+		return None
+	try:
+		settings = json.loads(base64.b64decode(text).decode("utf-8"))
+		return DriverLayout(**dict((name, settings[name]) for name in _SETTINGS))
+	except (TypeError, ValueError, KeyError):
+		return None
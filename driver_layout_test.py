@@ -0,0 +1,50 @@
+import unittest
+from driver_layout import DriverLayout
+from driver_layout import decode_layout
+from driver_layout import encode_layout
+
+
+class LayoutAOV(object):
+	"""Stands in for an AOV, with only the light group a layout looks at"""
+
+	def __init__(self, light_group):
+		self.light_group = light_group
+
+
+class DriverLayoutTest(unittest.TestCase):
+	"""Test class for DriverLayout"""
+
+	def setUp(self):
+		self.aovs = [LayoutAOV("warm"), LayoutAOV("cold"), LayoutAOV("warm")]
+
+	def test_writes_one_exr_per_light_group(self):
+		drivers = DriverLayout("per_group").assign(self.aovs)
+		self.assertEqual(list(drivers.keys()), ["aiAOVDriver_lpe_warm", "aiAOVDriver_lpe_cold"])
+		settings, aovs = drivers["aiAOVDriver_lpe_warm"]
+		self.assertEqual(aovs, [self.aovs[0], self.aovs[2]])
+		self.assertEqual(settings["prefix"], "<Scene>_lpe_warm")
+		self.assertFalse(settings["multipart"])
+
+	def test_writes_one_multipart_exr(self):
+		drivers = DriverLayout("single", compression="dwaa").assign(self.aovs)
+		settings, aovs = drivers["aiAOVDriver_lpe"]
+		self.assertEqual(len(aovs), 3)
+		self.assertTrue(settings["multipart"])
+		self.assertTrue(settings["half_precision"])
+		self.assertEqual(settings["compression"], "dwaa")
+
+	def test_default_layout_keeps_the_default_driver(self):
+		drivers = DriverLayout("default").assign(self.aovs)
+		self.assertEqual(list(drivers.items()), [("defaultArnoldDriver", (None, self.aovs))])
+
+	def test_rejects_unknown_settings(self):
+		self.assertRaises(ValueError, DriverLayout, "per_light")
+		self.assertRaises(ValueError, DriverLayout, compression="lzma")
+		self.assertRaises(ValueError, DriverLayout, data_type="half")
+
+	def test_round_trips_through_the_scene(self):
+		layout = decode_layout(encode_layout(DriverLayout("single", False, "dwaa", "rgba", "<Scene>_lights")))
+		self.assertEqual((layout.mode, layout.half_precision, layout.compression, layout.data_type, layout.prefix),
+						("single", False, "dwaa", "rgba", "<Scene>_lights"))
+		self.assertEqual(decode_layout("not base64!"), None)
+		self.assertEqual(decode_layout(None), None)
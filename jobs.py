@@ -0,0 +1,70 @@
+"""
+Long scene edits split into chunks.
+
+A ChunkedJob holds a list of work items and a function that handles a
+chunk of them. Each step() runs one chunk, so the UI can schedule the
+steps through Maya's idle queue, show progress between them and stay
+responsive. Cancelling stops the job between two chunks. Every chunk is
+a complete manager operation with its own undo chunk, so a cancelled job
+leaves the registry and the scene in step, holding whatever the chunks
+that already ran did.
+"""
+
+DEFAULT_CHUNK_SIZE = 25
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+
+class ChunkedJob(object):
+	"""Work items handled a chunk at a time"""
+
+	def __init__(self, name, items, run_chunk, chunk_size=DEFAULT_CHUNK_SIZE):
+		"""run_chunk(items) handles one chunk and returns a list of results"""
+		super(ChunkedJob, self).__init__()
+		self.name = name
+		self.chunk_size = max(1, chunk_size)
+		self.state = PENDING
+		self.done = 0
+		self.results = []
+		self.error = None
+		self._items = list(items)
+		self._run_chunk = run_chunk
+
+	@property
+	def total(self):
+		return len(self._items)
+
+	def is_finished(self):
+		return self.state in (DONE, CANCELLED, FAILED)
+
+	def cancel(self):
+		if not self.is_finished():
+			self.state = CANCELLED
+
+	def step(self):
+		"""Run the next chunk. Returns True while there are chunks left."""
+		if self.is_finished():
+			return False
+
+		self.state = RUNNING
+		chunk = self._items[self.done:self.done + self.chunk_size]
+		try:
+			self.results.extend(self._run_chunk(chunk) or [])
+		except Exception as error:
+			self.state = FAILED
+			self.error = error
+			raise
+		self.done += len(chunk)
+		if self.done >= self.total:
+			self.state = DONE
+		return not self.is_finished()
+
+	def run(self):
+		"""Run every remaining chunk right away"""
+		while self.step():
+			pass
+		return self.results
@@ -0,0 +1,43 @@
+import unittest
+from jobs import CANCELLED
+from jobs import ChunkedJob
+from jobs import DONE
+from jobs import FAILED
+
+
+class ChunkedJobTest(unittest.TestCase):
+	"""Test class for ChunkedJob"""
+
+	def setUp(self):
+		self.chunks = []
+		self.job = ChunkedJob("test", range(10), self.run_chunk, chunk_size=4)
+
+	def run_chunk(self, items):
+		self.chunks.append(items)
+		return [item * 2 for item in items]
+
+	def test_runs_a_chunk_per_step(self):
+		self.assertTrue(self.job.step())
+		self.assertEqual(self.job.done, 4)
+		self.assertTrue(self.job.step())
+		self.assertFalse(self.job.step())
+		self.assertEqual(self.chunks, [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]])
+		self.assertEqual(self.job.state, DONE)
+
+	def test_collects_results(self):
+		self.assertEqual(self.job.run(), [item * 2 for item in range(10)])
+
+	def test_stops_between_chunks_when_cancelled(self):
+		self.job.step()
+		self.job.cancel()
+		self.assertFalse(self.job.step())
+		self.assertEqual(self.job.state, CANCELLED)
+		self.assertEqual(self.job.done, 4)
+
+	def test_records_failures(self):
+		def fail(items):
+			raise RuntimeError("chunk failed")
+		job = ChunkedJob("test", range(3), fail)
+		self.assertRaises(RuntimeError, job.step)
+		self.assertEqual(job.state, FAILED)
+		self.assertFalse(job.step())
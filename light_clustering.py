@@ -0,0 +1,189 @@
+"""
+Light groups picked automatically for scenes with many lights.
+
+The light groups come from the aiAov attribute artists set on each light.
+With hundreds of practicals, that is either one group per light, far more
+AOVs than a render can afford, or nothing at all. This puts the lights into
+at most K groups of lights that look alike in comp:
+- where they are, relative to the spread of all the lights,
+- how bright they are, as log2 of intensity x 2^exposure x luminance,
+- their color, without its brightness,
+- their light type.
+Every light is a row of these features, weighted by block, and k-means in
+NumPy groups the rows. The groups are named <prefix>01, <prefix>02 and so
+on from the brightest group down, so they're also in priority order for
+render_budget.pick_levels().
+
+LPEManager.plan_light_clusters() takes K from a memory or disk cap with
+render_budget.max_groups(), and returns a ClusterPlan with the light group
+of every light that moves and the AOVs to build and delete. Nothing is
+written until it's applied, so the plan doubles as a preview:
+	manager.cluster_lights(level="coarse", memory_cap=8 * 1024 ** 3, dry_run=True).describe()
+Clustering is seeded, so the same lights give the same groups every time.
+"""
+from collections import OrderedDict
+
+try:
+	import numpy as np
+	NUMPY_AVAILABLE = True
+except ImportError:
+	NUMPY_AVAILABLE = False
+
+DEFAULT_PREFIX = "cluster"
+DEFAULT_ITERATIONS = 100
+
+# How much each block of features counts in the distance between lights
+DEFAULT_WEIGHTS = {"position": 1.0, "energy": 0.5, "color": 0.25, "type": 1.0}
+
+# Rec. 709 luminance of linear RGB
+LUMINANCE = (0.2126, 0.7152, 0.0722)
+
+
+def light_energy(attributes):
+	"""Linear brightness of every light, from backend light_attributes()"""
+	intensity = np.array([light["intensity"] for light in attributes], dtype=np.float64)
+	exposure = np.array([light["exposure"] for light in attributes], dtype=np.float64)
+	colors = np.array([light["color"] for light in attributes], dtype=np.float64).reshape(-1, 3)
+	return np.abs(intensity) * np.exp2(exposure) * np.maximum(colors.dot(LUMINANCE), 0.0)
+
+
+def _standardize(values):
+	deviation = values.std()
+	return (values - values.mean()) / (deviation if deviation > 0 else 1.0)
+
+
+def feature_matrix(attributes, weights=None):
+	"""One row of weighted features per light, from backend light_attributes()"""
+	weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+	positions = np.array([light["position"] for light in attributes], dtype=np.float64).reshape(-1, 3)
+	colors = np.array([light["color"] for light in attributes], dtype=np.float64).reshape(-1, 3)
+	types = sorted(set(light["type"] for light in attributes))
+
+	# Positions are scaled by their spread, so a set and a city cluster alike
+	positions = positions - positions.mean(axis=0)
+	spread = np.sqrt((positions ** 2).sum(axis=1).mean())
+	if spread > 0:
+		positions /= spread
+	energy = _standardize(np.log2(np.maximum(light_energy(attributes), 1e-6)))
+	chroma = np.abs(colors) / np.maximum(np.abs(colors).sum(axis=1), 1e-6)[:, None]
+	# Two lights of different types end up 1 apart
+	type_index = dict((light_type, index) for index, light_type in enumerate(types))
+	one_hot = np.zeros((len(attributes), len(types)))
+	one_hot[np.arange(len(attributes)), [type_index[light["type"]] for light in attributes]] = np.sqrt(0.5)
+
+	return np.hstack([
+		positions * weights["position"],
+		energy[:, None] * weights["energy"],
+		chroma * weights["color"],
+		one_hot * weights["type"]
+	])
+
+
+def _squared_distances(points, centers):
+	distances = ((points ** 2).sum(axis=1)[:, None] - 2.0 * points.dot(centers.T) +
+				(centers ** 2).sum(axis=1)[None, :])
+	return np.maximum(distances, 0.0)
+
+
+def kmeans(points, k, iterations=DEFAULT_ITERATIONS, seed=0):
+	"""
+	Group the rows of points into at most k clusters. Returns the cluster of
+	every row and the cluster centers. There are fewer than k clusters when
+	there are fewer than k distinct rows.
+	"""
+	count = len(points)
+	random = np.random.RandomState(seed)
+
+	# k-means++: every next center is a row picked with odds by how far it is
+	centers = [points[random.randint(count)]]
+	nearest = ((points - centers[0]) ** 2).sum(axis=1)
+	while len(centers) < min(k, count):
+		total = nearest.sum()
+		if total <= 0:
+			break
+		centers.append(points[random.choice(count, p=nearest / total)])
+		nearest = np.minimum(nearest, ((points - centers[-1]) ** 2).sum(axis=1))
+	centers = np.array(centers)
+
+	labels = None
+	for _ in range(iterations):
+		distances = _squared_distances(points, centers)
+		new_labels = distances.argmin(axis=1)
+		if labels is not None and np.array_equal(labels, new_labels):
+			break
+		labels = new_labels
+
+		counts = np.bincount(labels, minlength=len(centers))
+		sums = np.zeros_like(centers)
+		np.add.at(sums, labels, points)
+		filled = counts > 0
+		centers[filled] = sums[filled] / counts[filled][:, None]
+		# An empty cluster starts again from the row farthest from its center
+		own = distances[np.arange(count), labels]
+		for index in np.flatnonzero(~filled):
+			farthest = own.argmax()
+			centers[index] = points[farthest]
+			own[farthest] = 0.0
+	return labels, centers
+
+
+def group_names(count, prefix=DEFAULT_PREFIX):
+	width = max(2, len(str(count)))
+	return ["{}{:0{}d}".format(prefix, index + 1, width) for index in range(count)]
+
+
+def cluster_lights(lights, attributes, max_groups, weights=None, prefix=DEFAULT_PREFIX, seed=0):
+	"""
+	Put lights into at most max_groups light groups, given their backend
+	light_attributes(). Returns an OrderedDict of group name -> lights, from
+	the brightest group down.
+	"""
+	if not NUMPY_AVAILABLE:
+		raise ImportError("Clustering lights needs the numpy module")
+	if max_groups < 1:
+		raise ValueError("Lights need at least one light group, got {}".format(max_groups))
+	if not lights:
+		return OrderedDict()
+
+	labels, centers = kmeans(feature_matrix(attributes, weights), max_groups, seed=seed)
+	energy = np.bincount(labels, weights=light_energy(attributes), minlength=len(centers))
+	# Brightest first, and clusters of equal energy in the order they were found
+	order = [index for index in sorted(range(len(centers)), key=lambda index: (-energy[index], index))
+			if (labels == index).any()]
+	groups = OrderedDict()
+	for group_name, index in zip(group_names(len(order), prefix), order):
+		groups[group_name] = [light for light, label in zip(lights, labels) if label == index]
+	return groups
+
+
+class ClusterPlan(object):
+	"""The scene edits that move lights into clustered light groups"""
+
+	def __init__(self, plan, groups, spec):
+		super(ClusterPlan, self).__init__()
+		# ReconcilePlan that builds the AOVs of the new groups and deletes the emptied ones
+		self.plan = plan
+		# group -> lights, and group -> level, from the brightest group down
+		self.groups = groups
+		self.spec = spec
+		# light -> (current group, new group) of the lights that move
+		self.assignments = OrderedDict()
+
+	def __len__(self):
+		return len(self.plan) + len(self.assignments)
+
+	def is_empty(self):
+		return len(self) == 0
+
+	def summary(self):
+		summary = self.plan.summary()
+		summary["groups"] = len(self.groups)
+		summary["lights"] = len(self.assignments)
+		return summary
+
+	def describe(self):
+		lines = ["{}: {} lights".format(group_name, len(lights)) for group_name, lights in self.groups.items()]
+		lines.extend("move {}: {} -> {}".format(light, current, group)
+					for light, (current, group) in self.assignments.items())
+		lines.extend(self.plan.describe())
+		return lines
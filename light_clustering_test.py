@@ -0,0 +1,77 @@
+import unittest
+from light_clustering import ClusterPlan
+from light_clustering import NUMPY_AVAILABLE
+from light_clustering import cluster_lights
+from light_clustering import feature_matrix
+from light_clustering import group_names
+from light_clustering import kmeans
+from reconciler import ReconcilePlan
+
+if NUMPY_AVAILABLE:
+	import numpy as np
+
+
+def light(position, intensity=1.0, light_type="pointLight", color=(1.0, 1.0, 1.0), exposure=0.0):
+	return {"type": light_type, "position": position, "intensity": intensity, "exposure": exposure, "color": color}
+
+
+@unittest.skipUnless(NUMPY_AVAILABLE, "clustering lights needs numpy")
+class KMeansTest(unittest.TestCase):
+	"""Test class for kmeans"""
+
+	def test_finds_separate_blobs(self):
+		random = np.random.RandomState(1)
+		points = np.vstack([random.normal(center, 0.1, (20, 2)) for center in [(0, 0), (10, 0), (0, 10)]])
+		labels, centers = kmeans(points, 3)
+		self.assertEqual(len(centers), 3)
+		for start in range(0, 60, 20):
+			self.assertEqual(len(set(labels[start:start + 20])), 1)
+		self.assertEqual(len(set(labels)), 3)
+
+	def test_gives_fewer_clusters_for_fewer_distinct_points(self):
+		labels, centers = kmeans(np.array([[1.0, 1.0], [1.0, 1.0], [2.0, 2.0]]), 3)
+		self.assertEqual(len(centers), 2)
+		self.assertEqual(labels[0], labels[1])
+
+	def test_is_repeatable(self):
+		points = np.random.RandomState(2).uniform(size=(200, 3))
+		self.assertTrue(np.array_equal(kmeans(points, 8)[0], kmeans(points, 8)[0]))
+
+
+@unittest.skipUnless(NUMPY_AVAILABLE, "clustering lights needs numpy")
+class ClusterLightsTest(unittest.TestCase):
+	"""Test class for cluster_lights"""
+
+	def test_scales_features(self):
+		features = feature_matrix([light((0.0, 0.0, 0.0), 1.0), light((100.0, 0.0, 0.0), 4.0, "spotLight")])
+		# 3 position, 1 energy, 3 color and 2 type columns
+		self.assertEqual(features.shape, (2, 9))
+		self.assertAlmostEqual(abs(features[0, 0] - features[1, 0]), 2.0)
+
+	def test_groups_lights_by_place_and_type(self):
+		lights = ["lamp{}".format(index) for index in range(6)]
+		attributes = [light((0.0, 0.0, index * 0.1)) for index in range(3)]
+		attributes += [light((50.0, 0.0, index * 0.1), 10.0, "aiAreaLight") for index in range(3)]
+		groups = cluster_lights(lights, attributes, 2)
+		# The brighter area lights come first
+		self.assertEqual(list(groups.items()), [("cluster01", lights[3:]), ("cluster02", lights[:3])])
+
+	def test_rejects_zero_groups(self):
+		self.assertRaises(ValueError, cluster_lights, ["lamp"], [light((0.0, 0.0, 0.0))], 0)
+
+	def test_names_groups(self):
+		self.assertEqual(group_names(2, "auto"), ["auto01", "auto02"])
+		self.assertEqual(group_names(120)[-1], "cluster120")
+
+
+class ClusterPlanTest(unittest.TestCase):
+	"""Test class for ClusterPlan"""
+
+	def test_describes_moves(self):
+		plan = ClusterPlan(ReconcilePlan(), {"cluster01": ["lamp"]}, {"cluster01": "coarse"})
+		self.assertTrue(plan.is_empty())
+		plan.assignments["lamp"] = ("warm", "cluster01")
+		plan.plan.creates.append(("cluster01", "direct"))
+		self.assertEqual(plan.summary(), {"create": 1, "delete": 0, "update": 0, "groups": 1, "lights": 1})
+		self.assertEqual(plan.describe(), ["cluster01: 1 lights", "move lamp: warm -> cluster01",
+										"create cluster01_direct"])
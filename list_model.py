@@ -0,0 +1,98 @@
+"""
+Models for the textScrollLists in LPEManagerUI.
+
+A ListModel remembers the rows a list currently shows. Setting new rows
+compares them with the old ones and sends the widget only the rows that
+were removed or inserted, batched into a single textScrollList edit,
+instead of clearing the list and appending every row again. Rows that stay
+put keep their selection, and the list keeps its scroll position. When the
+list has to be rebuilt, it's scrolled back to the selected row.
+
+Rows are labels, and every label is shown at most once.
+"""
+
+
+def diff_rows(old_rows, new_rows):
+	"""
+	Return (removed, inserted) turning old_rows into new_rows, or None when
+	the rows kept from old_rows changed order.
+	removed holds 1-based indices into old_rows, highest first, so they can
+	be removed one after the other. inserted holds (1-based index, row)
+	pairs into new_rows, lowest first, for the same reason.
+	"""
+	new_set = set(new_rows)
+	old_set = set(old_rows)
+	kept = [row for row in old_rows if row in new_set]
+	if kept != [row for row in new_rows if row in old_set]:
+		return None
+
+	removed = [index + 1 for index, row in enumerate(old_rows) if row not in new_set]
+	removed.reverse()
+	inserted = [(index + 1, row) for index, row in enumerate(new_rows) if row not in old_set]
+	return removed, inserted
+
+
+class ListModel(object):
+	"""Rows shown by one textScrollList"""
+
+	def __init__(self, edit):
+		"""edit(**flags) applies textScrollList edit flags to the widget"""
+		super(ListModel, self).__init__()
+		self._edit = edit
+		self.rows = []
+
+	def __contains__(self, row):
+		return row in self.rows
+
+	def __len__(self):
+		return len(self.rows)
+
+	def set_rows(self, rows, selected=None):
+		"""
+		Show rows, keeping selected selected if it's still one of them.
+		Returns True when the rows changed.
+		"""
+		rows = list(rows)
+		if rows == self.rows:
+			return False
+
+		diff = diff_rows(self.rows, rows) if self.rows and rows else None
+		if diff is None or len(diff[0]) + len(diff[1]) > len(rows):
+			# Rebuilding is cheaper than patching most of the list
+			anchor = self._anchor(rows, selected)
+			self._edit(removeAll=True)
+			if rows:
+				self._edit(append=rows)
+			if selected in rows:
+				self._edit(selectItem=selected, showIndexedItem=anchor)
+			elif anchor is not None:
+				self._edit(showIndexedItem=anchor)
+		else:
+			removed, inserted = diff
+			# One edit, the widget removes rows before it inserts the new ones
+			flags = {}
+			if removed:
+				flags["removeIndexedItem"] = removed
+			if inserted:
+				flags["appendPosition"] = inserted
+			self._edit(**flags)
+		self.rows = rows
+		return True
+
+	def _anchor(self, rows, selected):
+		# textScrollList can't report how far it's scrolled, so a rebuilt list
+		# is scrolled back to the selected row, or to the kept row nearest to
+		# where the selected row was. Returns a 1-based index into rows.
+		if selected in rows:
+			return rows.index(selected) + 1
+		if selected not in self.rows:
+			return None
+		row_set = set(rows)
+		start = self.rows.index(selected)
+		for row in self.rows[start:] + list(reversed(self.rows[:start])):
+			if row in row_set:
+				return rows.index(row) + 1
+		return None
+
+	def clear(self):
+		return self.set_rows([])
@@ -0,0 +1,50 @@
+import unittest
+from list_model import ListModel
+from list_model import diff_rows
+
+
+class DiffRowsTest(unittest.TestCase):
+	"""Test class for diff_rows"""
+
+	def test_finds_removed_and_inserted_rows(self):
+		removed, inserted = diff_rows(["a", "b", "c", "d"], ["a", "x", "c", "y"])
+		self.assertEqual(removed, [4, 2])
+		self.assertEqual(inserted, [(2, "x"), (4, "y")])
+
+	def test_gives_up_on_reordered_rows(self):
+		self.assertEqual(diff_rows(["a", "b"], ["b", "a"]), None)
+
+
+class ListModelTest(unittest.TestCase):
+	"""Test class for ListModel"""
+
+	def setUp(self):
+		self.edits = []
+		self.model = ListModel(lambda **flags: self.edits.append(flags))
+		self.model.set_rows(["a", "b", "c", "d", "e"])
+		self.edits = []
+
+	def test_fills_an_empty_list_at_once(self):
+		self.assertEqual(self.model.rows, ["a", "b", "c", "d", "e"])
+		self.model.clear()
+		self.model.set_rows(["a", "b"])
+		self.assertEqual(self.edits, [{"removeAll": True}, {"removeAll": True}, {"append": ["a", "b"]}])
+
+	def test_skips_unchanged_rows(self):
+		self.assertFalse(self.model.set_rows(["a", "b", "c", "d", "e"]))
+		self.assertEqual(self.edits, [])
+
+	def test_sends_only_changed_rows(self):
+		self.assertTrue(self.model.set_rows(["a", "c", "d", "e", "f"]))
+		self.assertEqual(self.edits, [{"removeIndexedItem": [2], "appendPosition": [(5, "f")]}])
+
+	def test_rebuilds_and_reselects_reordered_rows(self):
+		self.model.set_rows(["e", "d", "c", "b", "a"], "b")
+		self.assertEqual(self.edits, [
+			{"removeAll": True},
+			{"append": ["e", "d", "c", "b", "a"]},
+			{"selectItem": "b", "showIndexedItem": 4}])
+
+	def test_scrolls_a_rebuilt_list_back_near_a_removed_selection(self):
+		self.model.set_rows(["e", "d", "b", "a"], "c")
+		self.assertEqual(self.edits[-1], {"showIndexedItem": 2})
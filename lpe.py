@@ -0,0 +1,299 @@
+"""
+Light path expression engine.
+
+Expressions are assembled from named scatter events, tokenized and checked
+against the Arnold LPE grammar before they reach an aiAOV node:
+
+expression := sequence ('|' sequence)*
+sequence   := quantified+
+quantified := atom ('*' | '+' | '?' | '{n}' | '{n,m}')?
+atom       := symbol | label | '(' expression ')' | set | event
+set        := '[' '^'? (symbol | label | event)+ ']'
+event      := '<' field field? field? '>'
+field      := symbol | label | '[' '^'? (symbol | label)+ ']' | '(' field ('|' field)* ')'
+
+Formatted expressions are cached per (group, pass), so a build never
+derives or validates the same expression twice. Unknown passes raise
+LPEError, unless the caller asks for the beauty fallback with strict=False,
+which warns.
+
+Light groups that are always used together can be registered as a merged
+group. Its expressions match any of its member groups with alternation,
+<L.('key'|'fill')>, so one AOV replaces one per member.
+"""
+import re
+import warnings
+
+SCATTER_EVENTS = {
+	"background": "B",
+	"beauty": ".*",
+	"coat": "<RS'coat'>.*",
+	"diffuse": "<RD>.*",
+	"diffuse_direct": "<RD>",
+	"diffuse_indirect": "<RD>[DSVOB].*",
+	"direct": "[DSV]",
+	"emission": "[LO]",
+	"indirect": "[DSV][DSVOB].*",
+	"transmission": "<TS>.*",
+	"specular": "<RS>.*",
+	"specular_direct": "<RS[^'coat']>",
+	"specular_indirect": "<RS[^'coat']>[DSVOB].*",
+	"sss": "<TD>.*",
+	"volume": "V.*"
+}
+
+# Combinations of scatter events that each add up to the full beauty
+AOV_PASSES = {
+	"coarse": ["direct", "indirect", "emission", "background"],
+	"medium": ["diffuse", "specular", "coat", "transmission", "sss", "volume", "emission", "background"],
+	"fine": ["diffuse_direct", "diffuse_indirect", "specular_direct", "specular_indirect", "coat", "transmission", "sss", "volume", "emission", "background"]
+}
+
+# Single-character symbols, as documented for Arnold light path expressions
+EVENT_TYPES = "CRTVLOB"
+SCATTERING_TYPES = "DS"
+SYMBOLS = EVENT_TYPES + SCATTERING_TYPES + "."
+QUANTIFIERS = "*+?"
+
+_LPE_TEMPLATE = "C{}<L.{}>"
+_TOKEN_RE = re.compile(r"\s*(?:(?P<label>'[^']*'|\"[^\"]*\")|(?P<repeat>\{\d+(?:,\d*)?\})|(?P<char>\S))")
+_lpe_cache = {}
+_valid_expressions = set()
+
+# Merged group name -> the light groups it stands for
+MERGED_GROUPS = {}
+
+
+class LPEError(ValueError):
+	"""Raised for malformed light path expressions and unknown scatter events"""
+	pass
+
+
+def tokenize(expression):
+	"""Split an expression into (kind, value, position) tuples"""
+	tokens = []
+	position = 0
+	while position < len(expression):
+		match = _TOKEN_RE.match(expression, position)
+		if match is None:
+			break
+		if match.group("label") is not None:
+			tokens.append(("label", match.group("label"), match.start("label")))
+		elif match.group("repeat") is not None:
+			tokens.append(("quantifier", match.group("repeat"), match.start("repeat")))
+		else:
+			char = match.group("char")
+			if char in SYMBOLS:
+				kind = "symbol"
+			elif char in QUANTIFIERS:
+				kind = "quantifier"
+			elif char in "()[]<>|^":
+				kind = char
+			else:
+				raise LPEError("Unexpected character '{}' at position {} in {}".format(
+					char, match.start("char"), expression))
+			tokens.append((kind, char, match.start("char")))
+		position = match.end()
+	return tokens
+
+
+class _Parser(object):
+	"""Recursive descent parser over the tokens of one expression"""
+
+	def __init__(self, expression):
+		super(_Parser, self).__init__()
+		self.expression = expression
+		self.tokens = tokenize(expression)
+		self.index = 0
+
+	def parse(self):
+		if not self.tokens:
+			raise LPEError("Empty light path expression")
+		if self.tokens[0][:2] != ("symbol", "C"):
+			raise LPEError("Light path expression has to start at the camera: {}".format(self.expression))
+		self._expression()
+		if self._peek() is not None:
+			self._fail("Unexpected")
+
+	def _peek(self):
+		if self.index < len(self.tokens):
+			return self.tokens[self.index][0]
+		return None
+
+	def _take(self, kind):
+		if self._peek() != kind:
+			self._fail("Expected '{}', found".format(kind))
+		self.index += 1
+
+	def _fail(self, message):
+		if self.index < len(self.tokens):
+			kind, value, position = self.tokens[self.index]
+			raise LPEError("{} '{}' at position {} in {}".format(message, value, position, self.expression))
+		raise LPEError("{} end of expression in {}".format(message, self.expression))
+
+	def _expression(self):
+		self._sequence()
+		while self._peek() == "|":
+			self._take("|")
+			self._sequence()
+
+	def _sequence(self):
+		count = 0
+		while self._peek() in ("symbol", "label", "(", "[", "<"):
+			self._atom()
+			if self._peek() == "quantifier":
+				self._take("quantifier")
+			count += 1
+		if not count:
+			self._fail("Expected an event, found")
+
+	def _atom(self):
+		kind = self._peek()
+		if kind in ("symbol", "label"):
+			self._take(kind)
+		elif kind == "(":
+			self._take("(")
+			self._expression()
+			self._take(")")
+		elif kind == "[":
+			self._set(allow_events=True)
+		else:
+			self._event()
+
+	def _set(self, allow_events=False):
+		self._take("[")
+		if self._peek() == "^":
+			self._take("^")
+		count = 0
+		while self._peek() in ("symbol", "label") or (allow_events and self._peek() == "<"):
+			if self._peek() == "<":
+				self._event()
+			else:
+				self._take(self._peek())
+			count += 1
+		if not count:
+			self._fail("Expected a set member, found")
+		self._take("]")
+
+	def _event(self):
+		self._take("<")
+		fields = 0
+		while self._peek() != ">" and fields < 3:
+			self._field(fields)
+			fields += 1
+		if not fields:
+			self._fail("Expected an event type, found")
+		self._take(">")
+
+	def _field(self, field_index):
+		kind = self._peek()
+		if kind == "symbol":
+			value = self.tokens[self.index][1]
+			allowed = (EVENT_TYPES, SCATTERING_TYPES, "")[field_index] + "."
+			if value not in allowed:
+				self._fail("Unexpected event field")
+			self._take("symbol")
+		elif kind == "label":
+			self._take("label")
+		elif kind == "[":
+			self._set()
+		elif kind == "(":
+			self._take("(")
+			self._field(field_index)
+			while self._peek() == "|":
+				self._take("|")
+				self._field(field_index)
+			self._take(")")
+		else:
+			self._fail("Unexpected")
+
+
+def validate(expression):
+	"""Raise LPEError if the expression isn't a well-formed light path expression"""
+	if expression in _valid_expressions:
+		return
+	_Parser(expression).parse()
+	_valid_expressions.add(expression)
+
+
+def is_valid(expression):
+	try:
+		validate(expression)
+	except LPEError:
+		return False
+	return True
+
+
+def register_scatter_event(name, events, replace=False):
+	"""Add a render pass whose LPE is C, then the events, then <L.'group'>"""
+	if name in SCATTER_EVENTS and not replace:
+		raise LPEError("Scatter event '{}' is already registered".format(name))
+	validate(_LPE_TEMPLATE.format(events, "'group'"))
+	SCATTER_EVENTS[name] = events
+	_lpe_cache.clear()
+
+
+def unregister_scatter_event(name):
+	SCATTER_EVENTS.pop(name, None)
+	_lpe_cache.clear()
+
+
+def register_merged_group(name, groups, replace=False):
+	"""Let the name stand for several light groups in formatted expressions"""
+	if name in MERGED_GROUPS and not replace:
+		raise LPEError("Merged group '{}' is already registered".format(name))
+	groups = sorted(set(groups))
+	if len(groups) < 2:
+		raise LPEError("Merged group '{}' needs at least two light groups".format(name))
+	for group in [name] + groups:
+		if not group or "'" in group:
+			raise LPEError("Light group name can't be used as an LPE label: {}".format(group))
+	MERGED_GROUPS[name] = groups
+	_lpe_cache.clear()
+
+
+def unregister_merged_group(name):
+	MERGED_GROUPS.pop(name, None)
+	_lpe_cache.clear()
+
+
+def _group_label(group):
+	merged = MERGED_GROUPS.get(group)
+	if merged is None:
+		return "'{}'".format(group)
+	return "({})".format("|".join("'{}'".format(member) for member in merged))
+
+
+def format_lpe(group, render_pass, strict=True):
+	"""
+	Return the validated LPE for a light group and render pass.
+	Unknown passes raise LPEError, or fall back to beauty with a warning
+	when strict is off.
+	"""
+	if strict and render_pass not in SCATTER_EVENTS:
+		raise LPEError("Unknown scatter event '{}'".format(render_pass))
+
+	key = (group, render_pass)
+	try:
+		return _lpe_cache[key]
+	except KeyError:
+		pass
+
+	if render_pass not in SCATTER_EVENTS:
+		warnings.warn("Unknown scatter event '{}', {}_{} matches the beauty".format(render_pass, group, render_pass),
+					stacklevel=2)
+	# The events are validated once with a placeholder label. Any group name
+	# without a quote is a valid label, so the full expression is valid too.
+	events = SCATTER_EVENTS.get(render_pass, SCATTER_EVENTS["beauty"])
+	validate(_LPE_TEMPLATE.format(events, "'group'"))
+	if not group or "'" in group:
+		raise LPEError("Light group name can't be used as an LPE label: {}".format(group))
+
+	expression = _LPE_TEMPLATE.format(events, _group_label(group))
+	_lpe_cache[key] = expression
+	return expression
+
+
+def clear_cache():
+	_lpe_cache.clear()
+	_valid_expressions.clear()
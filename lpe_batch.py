@@ -0,0 +1,212 @@
+"""
+Apply a light group AOV preset to many scene files without the UI.
+
+Run it with mayapy. The preset maps light groups to an AOV_PASSES level or
+a list of passes, either as a JSON file or as --group arguments:
+	mayapy lpe_batch.py --preset preset.json "shots/*/lighting/*.mb"
+	mayapy lpe_batch.py --group key=fine --group rim=coarse shot010.ma shot020.ma
+
+--layout also moves every light group AOV onto a DriverLayout, e.g. one
+half float EXR per light group:
+	mayapy lpe_batch.py --preset preset.json --layout per_group --compression dwaa shots/*.mb
+
+--layers takes a JSON file mapping render setup layers to their own specs.
+Every layer's AOVs are built once, and each layer turns off the ones it
+doesn't use, so rendering the layers rebuilds nothing:
+	mayapy lpe_batch.py --layers layers.json shots/*.mb
+
+Scenes are handed out to a pool of worker processes. Each worker starts
+one standalone Maya session and reuses it for every file it gets. Every
+scene is opened, reconciled against the preset, saved when something
+changed, and reported with its timing. A summary of the failures follows
+at the end, and the exit status is 1 if any scene failed.
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import timeit
+import traceback
+from driver_layout import DriverLayout
+from driver_layout import MODES
+from reconciler import resolve_spec
+from render_budget import COMPRESSION_RATIOS
+
+
+def parse_group_args(group_args):
+	"""Turn ["key=fine", "fill=diffuse,specular"] into a spec"""
+	spec = {}
+	for group_arg in group_args:
+		group_name, _, passes = group_arg.partition("=")
+		if not group_name or not passes:
+			raise ValueError("Expected GROUP=LEVEL or GROUP=PASS,PASS, got '{}'".format(group_arg))
+		spec[group_name] = passes.split(",") if "," in passes else passes
+	return spec
+
+
+def load_preset(path):
+	with open(path) as preset_file:
+		return json.load(preset_file)
+
+
+def expand_scenes(patterns):
+	"""Expand globs, keeping the order they were given in and dropping duplicates"""
+	scenes = []
+	seen = set()
+	for pattern in patterns:
+		matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+		for path in matches:
+			path = os.path.abspath(path)
+			if path not in seen:
+				seen.add(path)
+				scenes.append(path)
+	return scenes
+
+
+def initialize_worker():
+	"""Start one standalone Maya session per worker process"""
+	import maya.standalone
+	maya.standalone.initialize("python")
+	import maya.cmds as cmds
+	cmds.loadPlugin("mtoa", quiet=True)
+	# Batch edits are never undone, so skip recording them
+	cmds.undoInfo(state=False)
+
+
+def process_scene(job):
+	"""Open, reconcile and save one scene, returning a result dict"""
+	path, spec, dry_run, layout, layer_specs = job
+	result = {"path": path, "ok": False, "seconds": 0.0, "plan": None, "error": None}
+	start = timeit.default_timer()
+	try:
+		from lpe_manager import LPEManager
+		from scene_backend import get_backend
+		backend = get_backend()
+		backend.open_scene(path)
+
+		manager = LPEManager(backend)
+		plan = manager.reconcile(spec, dry_run)
+		summary = plan.summary()
+		changed = not plan.is_empty()
+		if layer_specs:
+			for layer_name, layer_spec in layer_specs.items():
+				manager.set_layer_spec(layer_name, layer_spec)
+			layer_plan = manager.apply_layers(dry_run)
+			for key, count in layer_plan.plan.summary().items():
+				summary[key] += count
+			changed = changed or not layer_plan.is_empty()
+		if not dry_run and layout is not None:
+			# New and existing AOVs are moved onto the layout in one pass
+			manager.set_layout(layout)
+		if not dry_run and (layout is not None or changed):
+			manager.save_index()
+			backend.save_scene()
+		result["plan"] = summary
+		result["ok"] = True
+	except Exception:
+		result["error"] = traceback.format_exc()
+	result["seconds"] = timeit.default_timer() - start
+	return result
+
+
+def run_batch(scenes, spec, workers=1, dry_run=False, report=None, layout=None, layer_specs=None):
+	"""Process every scene, calling report(result) as each one finishes"""
+	jobs = [(path, spec, dry_run, layout, layer_specs) for path in scenes]
+	results = []
+	if workers <= 1:
+		initialize_worker()
+		for job in jobs:
+			results.append(process_scene(job))
+			if report:
+				report(results[-1])
+		return results
+
+	pool = multiprocessing.Pool(processes=workers, initializer=initialize_worker)
+	try:
+		for result in pool.imap_unordered(process_scene, jobs):
+			results.append(result)
+			if report:
+				report(result)
+	finally:
+		pool.close()
+		pool.join()
+	return results
+
+
+def format_result(result):
+	if not result["ok"]:
+		return "FAILED  {:>8.2f}s  {}".format(result["seconds"], result["path"])
+	plan = result["plan"]
+	return "ok      {:>8.2f}s  {}  (+{} -{} ~{})".format(
+		result["seconds"], result["path"], plan["create"], plan["delete"], plan["update"])
+
+
+def format_summary(results, elapsed):
+	failures = [result for result in results if not result["ok"]]
+	lines = ["{} scenes, {} failed, {:.2f}s".format(len(results), len(failures), elapsed)]
+	for result in failures:
+		lines.append("")
+		lines.append("FAILED {}".format(result["path"]))
+		lines.append(result["error"].rstrip())
+	return "\n".join(lines)
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Apply a light group AOV preset to scene files")
+	parser.add_argument("scenes", nargs="+", help="scene files or glob patterns")
+	parser.add_argument("--preset", help="JSON file mapping light groups to a level or list of passes")
+	parser.add_argument("--group", action="append", default=[], metavar="GROUP=LEVEL",
+						help="light group and level or comma separated passes, may be repeated")
+	parser.add_argument("--workers", type=int, default=max(1, multiprocessing.cpu_count() // 2),
+						help="number of Maya worker processes")
+	parser.add_argument("--layout", choices=MODES, help="move the light group AOVs onto this driver layout")
+	parser.add_argument("--precision", choices=["half", "full"], default="half",
+						help="EXR precision of the layout's drivers (default half)")
+	parser.add_argument("--compression", choices=sorted(COMPRESSION_RATIOS), default="zip",
+						help="EXR compression of the layout's drivers (default zip)")
+	parser.add_argument("--layers", help="JSON file mapping render layers to their own presets")
+	parser.add_argument("--dry-run", action="store_true", help="report the changes without saving")
+	parser.add_argument("--json", help="also write the per-scene results to this JSON file")
+	args = parser.parse_args(argv)
+
+	try:
+		spec = load_preset(args.preset) if args.preset else {}
+		spec.update(parse_group_args(args.group))
+		layer_specs = load_preset(args.layers) if args.layers else {}
+		# Bad presets fail here, before any Maya session is started
+		resolve_spec(spec)
+		for layer_spec in layer_specs.values():
+			resolve_spec(layer_spec)
+	except (IOError, ValueError) as error:
+		parser.error(str(error))
+	if not spec and not layer_specs:
+		parser.error("a preset, layer presets or at least one --group is required")
+
+	layout = None
+	if args.layout:
+		layout = DriverLayout(args.layout, args.precision == "half", args.compression)
+
+	scenes = expand_scenes(args.scenes)
+	if not scenes:
+		parser.error("no scenes matched")
+
+	def report(result):
+		print(format_result(result))
+		sys.stdout.flush()
+
+	start = timeit.default_timer()
+	results = run_batch(scenes, spec, min(args.workers, len(scenes)), args.dry_run, report, layout,
+						layer_specs)
+	print("")
+	print(format_summary(results, timeit.default_timer() - start))
+
+	if args.json:
+		with open(args.json, "w") as json_file:
+			json.dump(results, json_file, indent=2)
+	return 0 if all(result["ok"] for result in results) else 1
+
+
+if __name__ == '__main__':
+	sys.exit(main())
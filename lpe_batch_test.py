@@ -0,0 +1,80 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from lpe_batch import expand_scenes
+from lpe_batch import format_result
+from lpe_batch import format_summary
+from lpe_batch import load_preset
+from lpe_batch import parse_group_args
+
+
+class PresetTest(unittest.TestCase):
+	"""Test class for reading batch presets"""
+
+	def test_parses_levels_and_pass_lists(self):
+		spec = parse_group_args(["warm=fine", "cold=diffuse,specular"])
+		self.assertEqual(spec, {"warm": "fine", "cold": ["diffuse", "specular"]})
+
+	def test_rejects_group_without_level(self):
+		self.assertRaises(ValueError, parse_group_args, ["warm"])
+		self.assertRaises(ValueError, parse_group_args, ["=fine"])
+
+	def test_loads_json_preset(self):
+		handle, path = tempfile.mkstemp(suffix=".json")
+		os.close(handle)
+		try:
+			with open(path, "w") as preset_file:
+				json.dump({"warm": "coarse"}, preset_file)
+			self.assertEqual(load_preset(path), {"warm": "coarse"})
+		finally:
+			os.remove(path)
+
+
+class ExpandScenesTest(unittest.TestCase):
+	"""Test class for expand_scenes"""
+
+	def setUp(self):
+		self.root = tempfile.mkdtemp()
+		for name in ["shot020.ma", "shot010.ma", "notes.txt"]:
+			open(os.path.join(self.root, name), "w").close()
+
+	def tearDown(self):
+		shutil.rmtree(self.root)
+
+	def test_expands_globs_in_order(self):
+		scenes = expand_scenes([os.path.join(self.root, "*.ma")])
+		self.assertEqual([os.path.basename(path) for path in scenes], ["shot010.ma", "shot020.ma"])
+
+	def test_drops_duplicates(self):
+		path = os.path.join(self.root, "shot020.ma")
+		scenes = expand_scenes([path, os.path.join(self.root, "*.ma")])
+		self.assertEqual([os.path.basename(path) for path in scenes], ["shot020.ma", "shot010.ma"])
+
+	def test_keeps_plain_paths_without_matching(self):
+		scenes = expand_scenes(["missing.ma"])
+		self.assertEqual(scenes, [os.path.abspath("missing.ma")])
+
+
+class ReportTest(unittest.TestCase):
+	"""Test class for the batch report"""
+
+	def setUp(self):
+		self.results = [
+			{"path": "shot010.ma", "ok": True, "seconds": 1.5, "error": None,
+			"plan": {"create": 3, "delete": 1, "update": 0}},
+			{"path": "shot020.ma", "ok": False, "seconds": 0.25, "plan": None,
+			"error": "Traceback (most recent call last):\nRuntimeError: bad file\n"}
+		]
+
+	def test_formats_plan_counts(self):
+		self.assertIn("(+3 -1 ~0)", format_result(self.results[0]))
+		self.assertTrue(format_result(self.results[1]).startswith("FAILED"))
+
+	def test_summarizes_failures(self):
+		summary = format_summary(self.results, 2.0)
+		self.assertTrue(summary.startswith("2 scenes, 1 failed"))
+		self.assertIn("FAILED shot020.ma", summary)
+		self.assertIn("RuntimeError: bad file", summary)
+		self.assertNotIn("FAILED shot010.ma", summary)
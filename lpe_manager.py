@@ -8,45 +8,133 @@ Create an AOV with LPE for each group and desired channel
 Class structure:
 LPEManager_UI
 |-LPEManager
-|--AOV
+|--AOVRegistry
+|---AOV
 """
-import pymel.core as pm
-import re
+from collections import OrderedDict
+import consolidation
+import contribution
+import driver_layout
+import light_clustering
+import lpe
+from jobs import ChunkedJob
+from jobs import DEFAULT_CHUNK_SIZE
+import render_budget
+import render_layers
+import render_stats
+import scene_index
 from aov import AOV
+from aov import resolve_nodes
+from aov_registry import AOVRegistry
+from reconciler import ReconcilePlan
+from reconciler import resolve_spec
+from scene_backend import AOV_NODE_PREFIX
+from scene_backend import get_backend
 
 
 class LPEManager(object):
 	"""Class for managing Arnold AOV light groups and light path expressions"""
 
-	def __init__(self):
+	def __init__(self, backend=None, layout=None):
 		super(LPEManager, self).__init__()
-		self.aov_list = []
+		self._backend = backend or get_backend()
+		self.layout = (layout or driver_layout.decode_layout(self._backend.read_file_info(driver_layout.LAYOUT_KEY)) or
+					driver_layout.DriverLayout("default"))
+		self._registry = AOVRegistry()
+		self._pruned = contribution.decode_pruned(self._backend.read_file_info(contribution.PRUNED_KEY))
+		self._layer_specs = render_layers.decode_layer_specs(
+			self._backend.read_file_info(render_layers.LAYERS_KEY))
+		self._update_layer_diffs()
+		# Merged groups only live in the session, so the scene's are registered
+		# again and the ones left over from an earlier scene are dropped
+		self._merged_groups = consolidation.decode_merges(self._backend.read_file_info(consolidation.MERGES_KEY))
+		for merged_name in set(lpe.MERGED_GROUPS).difference(self._merged_groups):
+			lpe.unregister_merged_group(merged_name)
+		for merged_name, members in self._merged_groups.items():
+			lpe.register_merged_group(merged_name, members, replace=True)
+		self._light_groups = self.getSceneLightGroups()
+		scan_groups = self._light_groups.union(self._merged_groups)
+		if not self._load_index(scan_groups):
+			self._initialize_aov_list(scan_groups)
 
-		for group in self.getSceneLightGroups():
-			self._initialize_group_list(group)
+	@property
+	def aov_list(self):
+		return self._registry.get_all()
 
 	def getSceneLights(self):
-		return pm.ls(type=["aiAreaLight", "aiSkyDomeLight"])
+		return self._backend.list_lights()
 
 	def getSceneLightGroups(self):
-		groups = set()
-		for light in self.getSceneLights():
-			groups.add(light.getAttr("aiAov"))
-		return groups
+		return set(self.getSceneLightGroupMap().keys())
+
+	def getSceneLightGroupMap(self):
+		"""Map every light group to the lights in it"""
+		return self._backend.light_group_map()
 
 	def aov_exists(self, group_name, render_pass):
-		for aov in self.aov_list:
-			if(aov.light_group == group_name and aov.render_pass == render_pass):
-				return True
-		return False
+		return (group_name, render_pass) in self._registry
 
 	def add_aov(self, group_name, render_pass, make_node=True):
 		if(self.aov_exists(group_name, render_pass)):
 			return None
-		new_aov = AOV(group_name, render_pass, make_node)
-		self.aov_list.append(new_aov)
+		new_aov = AOV(group_name, render_pass, make_node, backend=self._backend)
+		self._registry.add(new_aov)
 		return new_aov
 
+	def add_aovs_bulk(self, group_names, render_pass_list):
+		"""
+		Create the AOVs for every group and pass that doesn't exist yet.
+		All nodes are made by the backend inside a single undo chunk,
+		and their LPEs are set in one pass once every node exists. If any node
+		fails, the ones already made and their drivers are deleted and the
+		registry is untouched.
+		Returns the newly created AOVs.
+		"""
+		keys = OrderedDict()
+		for group_name in group_names:
+			for render_pass in render_pass_list:
+				if not self.aov_exists(group_name, render_pass):
+					keys[(group_name, render_pass)] = None
+		return self._create_aovs(list(keys))
+
+	def _create_aovs(self, keys):
+		if not keys:
+			return []
+
+		backend = self._backend
+		# Unknown passes raise here, before anything is added to the scene
+		aovs = [AOV(group_name, render_pass, False, backend=backend, strict=True) for group_name, render_pass in keys]
+		new_aovs = []
+		with backend.edit("lpeManagerAddAOVs"):
+			try:
+				for aov in aovs:
+					aov._aov_node = backend.create_aov_node(aov.nice_name())
+					new_aovs.append(aov)
+				backend.set_lpes([(aov._aov_node, aov.lpe) for aov in new_aovs])
+				if self.layout.mode != "default":
+					# New nodes are already on the default driver
+					self._apply_layout(new_aovs)
+			except Exception:
+				backend.delete_nodes([aov._aov_node for aov in new_aovs if backend.node_exists(aov._aov_node)])
+				if self.layout.mode != "default":
+					# Drivers made for the deleted nodes are left without AOVs
+					backend.delete_drivers(backend.unused_drivers(driver_layout.DRIVER_PREFIX))
+				raise
+
+		for aov in new_aovs:
+			self._registry.add(aov)
+		return new_aovs
+
+	def add_aovs_job(self, group_names, render_pass_list, chunk_size=DEFAULT_CHUNK_SIZE):
+		"""add_aovs_bulk() as a ChunkedJob"""
+		keys = [(group_name, render_pass) for group_name in group_names for render_pass in render_pass_list
+				if not self.aov_exists(group_name, render_pass)]
+		return ChunkedJob("Build AOVs", keys, self._create_missing_aovs, chunk_size)
+
+	def _create_missing_aovs(self, keys):
+		# The scene may have changed between two chunks
+		return self._create_aovs([key for key in keys if not self.aov_exists(*key)])
+
 	def add_aovs(self, group_name, render_pass_list):
 		aov_list = []
 		for render_pass in render_pass_list:
@@ -55,48 +143,500 @@ class LPEManager(object):
 		return aov_list
 
 	def get_aov(self, search_name):
-		for aov in self.aov_list:
-			if aov.nice_name() == search_name:
-				return aov
-		return None
+		return self._registry.get_by_name(search_name)
+
+	def select_aovs(self, aov_list):
+		"""Select the aiAOV nodes of AOVs in the scene"""
+		resolve_nodes(aov_list, self._backend)
+		self._backend.select_nodes([aov._aov_node for aov in aov_list if self._backend.node_exists(aov._aov_node)])
 
 	def get_aov_list(self, group_name=None):
 		if group_name is None:
-			return self.aov_list
-
-		return_list = []
-		for aov in self.aov_list:
-			if aov.light_group == group_name:
-				return_list.append(aov)
-		return return_list
+			return self._registry.get_all()
+		return self._registry.get_group(group_name)
 
 	def delete_aov(self, group_name, render_pass=None):
-		to_delete = None
-
 		if render_pass is None:
-			for index, aov in enumerate(self.aov_list):
-				if(group_name == aov.nice_name()):
-					to_delete = aov
-					break
+			to_delete = self._registry.get_by_name(group_name)
 		else:
-			for index, aov in enumerate(self.aov_list):
-				if(aov.light_group == group_name and aov.render_pass == render_pass):
-					to_delete = aov
-					break
+			to_delete = self._registry.get(group_name, render_pass)
+
+		if to_delete is None:
+			return
 		to_delete.delete_node()
-		self.aov_list.remove(to_delete)
+		self._registry.remove(to_delete)
+
+	def delete_aovs(self, group_name=None):
+		"""Delete the AOVs of a light group, or every AOV when no group is given"""
+		self.delete_aov_list(self.get_aov_list(group_name))
+
+	def delete_aov_list(self, aov_list):
+		"""
+		Delete several AOVs with one delete call inside a single undo chunk.
+		Nodes that were already removed outside of the tool are skipped, but
+		their AOVs are still dropped from the registry.
+		"""
+		resolve_nodes(aov_list, self._backend)
+		nodes = [aov._aov_node for aov in aov_list if self._backend.node_exists(aov._aov_node)]
+		if nodes:
+			with self._backend.edit("lpeManagerDeleteAOVs"):
+				self._backend.delete_nodes(nodes)
+		self._registry.remove_many(aov_list)
+
+	def set_layout(self, layout):
+		"""Use a DriverLayout for new AOVs and move every existing AOV onto it"""
+		self.layout = layout
+		self._backend.write_file_info(driver_layout.LAYOUT_KEY, driver_layout.encode_layout(layout))
+		aov_list = self._registry.get_all()
+		resolve_nodes(aov_list, self._backend)
+		with self._backend.edit("lpeManagerDriverLayout"):
+			self._apply_layout([aov for aov in aov_list if self._backend.node_exists(aov._aov_node)])
+
+	def _apply_layout(self, aov_list):
+		node_drivers = []
+		for driver_name, (settings, driver_aovs) in self.layout.assign(aov_list).items():
+			if settings is not None:
+				driver_name = self._backend.ensure_driver(driver_name, settings)
+			node_drivers.extend((aov._aov_node, driver_name) for aov in driver_aovs)
+		if node_drivers:
+			self._backend.set_aov_outputs(node_drivers, driver_layout.DATA_TYPES[self.layout.data_type])
+		# Drivers of an earlier layout, or of groups whose AOVs moved away
+		self._backend.delete_drivers(self._backend.unused_drivers(driver_layout.DRIVER_PREFIX))
+
+	def current_spec(self):
+		"""The existing AOVs as a spec of light group -> list of passes"""
+		return OrderedDict((group_name, [aov.render_pass for aov in self._registry.get_group(group_name)])
+						for group_name in self._registry.groups())
+
+	def estimate(self, spec=None):
+		"""Per-frame render cost of a spec without its pruned AOVs, or of the existing AOVs"""
+		spec = self.current_spec() if spec is None else self._without_pruned(resolve_spec(spec))
+		return render_budget.estimate(spec, self._backend.render_settings(), self.layout.channels,
+									self.layout.output_bytes())
+
+	def budget_spec(self, groups, memory_cap=None, disk_cap=None):
+		"""Levels for groups, highest priority first, that fit the caps in bytes"""
+		return render_budget.pick_levels(groups, self._backend.render_settings(), memory_cap, disk_cap,
+										self.layout.channels, self.layout.output_bytes())
+
+	def render_costs(self, totals, group_name=None):
+		"""
+		Share render stats totals from render_stats.aggregate() out to the
+		AOVs, or to the AOVs of one light group, by the channels of each
+		AOV's data type. Returns an OrderedDict of (light group, pass) ->
+		memory, time and disk per frame.
+		"""
+		aov_list = self._registry.get_all()
+		resolve_nodes(aov_list, self._backend)
+		aov_list = [aov for aov in aov_list if self._backend.node_exists(aov._aov_node)]
+		data_types = self._backend.get_aov_types([aov._aov_node for aov in aov_list])
+		channels = dict(((aov.light_group, aov.render_pass), driver_layout.TYPE_CHANNELS.get(data_type, self.layout.channels))
+						for aov, data_type in zip(aov_list, data_types))
+		keys = [(aov.light_group, aov.render_pass) for aov in self.get_aov_list(group_name)]
+		aov_channels = OrderedDict((key, channels[key]) for key in keys if key in channels)
+		return render_stats.attribute(totals, aov_channels, sum(channels.values()))
+
+	def delete_aovs_job(self, group_name=None, chunk_size=DEFAULT_CHUNK_SIZE):
+		"""delete_aovs() as a ChunkedJob"""
+		return ChunkedJob("Delete AOVs", self.get_aov_list(group_name), self._delete_chunk, chunk_size)
+
+	def _delete_chunk(self, aov_list):
+		self.delete_aov_list(aov_list)
+		return aov_list
+
+	def plan(self, spec):
+		"""
+		Compare a spec of light group -> level or passes with the existing AOVs.
+		Returns a ReconcilePlan with the AOVs to create and delete, and the
+		ones whose lightPathExpression in the scene is stale. Pruned AOVs are
+		left out of the spec.
+		"""
+		plan = ReconcilePlan()
+		existing_aovs = []
+		for group_name, passes in self._without_pruned(resolve_spec(spec)).items():
+			wanted = set(passes)
+			group_aovs = self._registry.get_group(group_name)
+			resolve_nodes(group_aovs, self._backend)
+			for aov in group_aovs:
+				if aov.render_pass not in wanted:
+					plan.deletes.append(aov)
+				elif self._backend.node_exists(aov._aov_node):
+					existing_aovs.append(aov)
+				else:
+					# The node was removed outside of the tool, so make it again
+					plan.deletes.append(aov)
+					plan.creates.append((group_name, aov.render_pass))
+
+			existing_passes = set(aov.render_pass for aov in group_aovs)
+			plan.creates.extend((group_name, render_pass) for render_pass in passes
+								if render_pass not in existing_passes)
+
+		expressions = self._backend.get_lpes([aov._aov_node for aov in existing_aovs])
+		for aov, expression in zip(existing_aovs, expressions):
+			if expression != aov.lpe:
+				plan.updates.append((aov, aov.lpe))
+		return plan
+
+	def apply_plan(self, plan):
+		"""Apply a ReconcilePlan inside a single undo chunk"""
+		with self._backend.edit("lpeManagerReconcile"):
+			self.delete_aov_list(plan.deletes)
+			self._create_aovs(plan.creates)
+			self._backend.set_lpes([(aov._aov_node, expression) for aov, expression in plan.updates])
+		return plan
+
+	def reconcile(self, spec, dry_run=False):
+		"""Bring the scene AOVs in line with a spec, or only plan it with dry_run"""
+		plan = self.plan(spec)
+		if not dry_run and not plan.is_empty():
+			self.apply_plan(plan)
+		return plan
+
+	def plan_consolidation(self, merges=None, drop_redundant=True):
+		"""
+		Plan a smaller set of AOVs with the same coverage.
+		merges maps new merged group names to the light groups they replace.
+		The members' AOVs are deleted and the merged group gets every pass
+		they had. With drop_redundant, passes that other passes of the same
+		group add up to are deleted too.
+		"""
+		merges = merges or {}
+		for merged_name, members in merges.items():
+			if merged_name in self._light_groups:
+				raise ValueError("Merged group '{}' is already a light group".format(merged_name))
+			if len(set(members)) < 2:
+				raise ValueError("Merged group '{}' needs at least two light groups".format(merged_name))
+
+		current_spec = self.current_spec()
+		target_spec = consolidation.merge_spec(current_spec, merges)
+		if drop_redundant:
+			for group_name, passes in target_spec.items():
+				redundant = consolidation.redundant_passes(passes)
+				target_spec[group_name] = [render_pass for render_pass in passes if render_pass not in redundant]
+
+		plan = self.plan(target_spec)
+		for group_name in current_spec:
+			if group_name not in target_spec:
+				plan.deletes.extend(self._registry.get_group(group_name))
+		return plan
+
+	def consolidate(self, merges=None, drop_redundant=True, dry_run=False):
+		"""Apply plan_consolidation(), or only plan it with dry_run"""
+		plan = self.plan_consolidation(merges, drop_redundant)
+		if not dry_run:
+			for merged_name, members in (merges or {}).items():
+				lpe.register_merged_group(merged_name, members, replace=True)
+				self._merged_groups[merged_name] = lpe.MERGED_GROUPS[merged_name]
+			if merges:
+				self._backend.write_file_info(consolidation.MERGES_KEY,
+											consolidation.encode_merges(self._merged_groups))
+			if not plan.is_empty():
+				self.apply_plan(plan)
+		return plan
+
+	@property
+	def merged_groups(self):
+		"""Merged group -> member light groups, of every merge stored in the scene"""
+		return OrderedDict(self._merged_groups)
+
+	@property
+	def layer_specs(self):
+		return OrderedDict(self._layer_specs)
+
+	def set_layer_spec(self, layer_name, spec):
+		"""Give a render setup layer its own spec of light group -> level or passes"""
+		if layer_name not in self._backend.list_render_layers():
+			raise ValueError("No render layer named '{}'".format(layer_name))
+		resolve_spec(spec)
+		self._layer_specs[layer_name] = spec
+		self._layer_specs_changed()
+
+	def remove_layer_spec(self, layer_name):
+		"""
+		Stop tracking a layer, apply_layers() turns its AOVs back on.
+		Light groups that no spec mentions any more keep their AOVs.
+		"""
+		if self._layer_specs.pop(layer_name, None) is not None:
+			self._layer_specs_changed()
+
+	def _layer_specs_changed(self):
+		text = render_layers.encode_layer_specs(self._layer_specs)
+		self._backend.write_file_info(render_layers.LAYERS_KEY, text)
+		self._update_layer_diffs()
+
+	def _update_layer_diffs(self, render_layers_now=None):
+		# Worked out once per spec change, not every time the layers are applied.
+		# Specs of layers that were deleted or renamed are kept, but left out.
+		if render_layers_now is None:
+			render_layers_now = self._backend.list_render_layers()
+		layer_names = set(render_layers_now)
+		live_specs = OrderedDict((layer_name, spec) for layer_name, spec in self._layer_specs.items()
+								if layer_name in layer_names)
+		self._stale_layers = [layer_name for layer_name in self._layer_specs if layer_name not in layer_names]
+		self._layer_union = self._without_pruned(render_layers.union_spec(live_specs))
+		self._layer_disabled = dict(
+			(layer_name, render_layers.disabled_nodes(spec, self._layer_union))
+			for layer_name, spec in live_specs.items())
+
+	def plan_layers(self):
+		"""
+		Plan the AOVs of every tracked render layer. Returns a LayerPlan with
+		a ReconcilePlan for the AOVs of all layers together, and the nodes
+		each layer's collection has to turn off or back on. Layers whose
+		collection already matches are left out. Specs of render layers that
+		no longer exist are skipped and listed in the plan's stale_layers.
+		"""
+		layer_names = self._backend.list_render_layers()
+		stale_layers = [layer_name for layer_name in self._layer_specs if layer_name not in layer_names]
+		if stale_layers != self._stale_layers:
+			self._update_layer_diffs(layer_names)
+
+		layer_plan = render_layers.LayerPlan(self.plan(self._layer_union))
+		layer_plan.stale_layers = list(self._stale_layers)
+		for layer_name in layer_names:
+			wanted = self._layer_disabled.get(layer_name, frozenset())
+			applied = set(self._backend.get_disabled_aovs(layer_name))
+			disable = sorted(wanted.difference(applied))
+			enable = sorted(applied.difference(wanted))
+			if disable or enable:
+				layer_plan.overrides[layer_name] = (disable, enable)
+		return layer_plan
+
+	def apply_layer_plan(self, layer_plan):
+		"""Apply a LayerPlan inside a single undo chunk"""
+		with self._backend.edit("lpeManagerRenderLayers"):
+			if not layer_plan.plan.is_empty():
+				self.apply_plan(layer_plan.plan)
+			for layer_name, (disable, enable) in layer_plan.overrides.items():
+				self._backend.set_disabled_aovs(layer_name, disable, enable)
+		return layer_plan
+
+	def apply_layers(self, dry_run=False):
+		"""Bring the scene in line with every layer spec, or only plan it with dry_run"""
+		layer_plan = self.plan_layers()
+		if not dry_run and not layer_plan.is_empty():
+			self.apply_layer_plan(layer_plan)
+		return layer_plan
+
+	def switch_layer(self, layer_name):
+		"""Show a render layer, its collection turns its unused AOVs off"""
+		self._backend.set_current_render_layer(layer_name)
+
+	def plan_pruning(self, contributions, peak=contribution.DEFAULT_PEAK):
+		"""
+		Plan deleting the AOVs that stayed black in the renders.
+		contributions map AOV names like "rim_sss" to their rendered stats, as
+		from contribution.aggregate(). AOVs whose peak never got over peak in
+		every frame are deleted. AOVs that weren't rendered are kept.
+		"""
+		dead = set(contribution.dead_aovs(contributions, peak))
+		plan = ReconcilePlan()
+		plan.deletes.extend(aov for aov in self._registry.get_all() if aov.nice_name() in dead)
+		return plan
+
+	def prune(self, contributions, peak=contribution.DEFAULT_PEAK, dry_run=False):
+		"""
+		Apply plan_pruning(), or only plan it with dry_run. The pruned AOVs
+		are stored in the scene, and plan() leaves them out from then on.
+		"""
+		plan = self.plan_pruning(contributions, peak)
+		if not dry_run and not plan.is_empty():
+			self.apply_plan(plan)
+			self._set_pruned(self._pruned.union(aov.nice_name() for aov in plan.deletes))
+		return plan
+
+	@property
+	def pruned_aovs(self):
+		return sorted(self._pruned)
+
+	def restore_pruned(self, names=None):
+		"""Let plan() build pruned AOVs again, all of them or the named ones"""
+		self._set_pruned(set() if names is None else self._pruned.difference(names))
+
+	def _set_pruned(self, names):
+		self._pruned = set(names)
+		self._backend.write_file_info(contribution.PRUNED_KEY, contribution.encode_pruned(self._pruned))
+		self._update_layer_diffs()
+
+	def _without_pruned(self, resolved_spec):
+		if not self._pruned:
+			return resolved_spec
+		return OrderedDict((group_name, [render_pass for render_pass in passes
+										if "{}_{}".format(group_name, render_pass) not in self._pruned])
+						for group_name, passes in resolved_spec.items())
+
+	def plan_light_clusters(self, max_groups=None, level="coarse", memory_cap=None, disk_cap=None, weights=None):
+		"""
+		Plan putting the scene's lights into at most max_groups light groups
+		by position, brightness, color and type. Without max_groups, it's the
+		most groups with level each that fit the caps in bytes. The lights
+		that move get new aiAov groups, the new groups get AOVs at level, and
+		the AOVs of groups left without lights are deleted.
+		"""
+		if max_groups is None:
+			max_groups = render_budget.max_groups(level, self._backend.render_settings(), memory_cap, disk_cap,
+												self.layout.channels, self.layout.output_bytes())
+		lights = self.getSceneLights()
+		groups = light_clustering.cluster_lights(lights, self._backend.light_attributes(lights), max_groups,
+												weights)
+		spec = OrderedDict((group_name, level) for group_name in groups)
+		cluster_plan = light_clustering.ClusterPlan(self.plan(spec), groups, spec)
+
+		group_map = self.getSceneLightGroupMap()
+		current = dict((light, group_name) for group_name, group_lights in group_map.items()
+					for light in group_lights)
+		for group_name, group_lights in groups.items():
+			for light in group_lights:
+				if current.get(light) != group_name:
+					cluster_plan.assignments[light] = (current.get(light), group_name)
+		for group_name in sorted(set(group_map) - set(groups)):
+			cluster_plan.plan.deletes.extend(self._registry.get_group(group_name))
+		return cluster_plan
+
+	def apply_cluster_plan(self, cluster_plan):
+		"""Apply a ClusterPlan inside a single undo chunk"""
+		with self._backend.edit("lpeManagerClusterLights"):
+			self.apply_plan(cluster_plan.plan)
+			self._backend.set_light_groups(OrderedDict(
+				(light, group_name) for light, (_, group_name) in cluster_plan.assignments.items()))
+		self._light_groups = self.getSceneLightGroups()
+		return cluster_plan
+
+	def cluster_lights(self, max_groups=None, level="coarse", memory_cap=None, disk_cap=None, weights=None,
+					dry_run=False):
+		"""Apply plan_light_clusters(), or only plan it with dry_run to preview the groups"""
+		cluster_plan = self.plan_light_clusters(max_groups, level, memory_cap, disk_cap, weights)
+		if not dry_run and not cluster_plan.is_empty():
+			self.apply_cluster_plan(cluster_plan)
+		return cluster_plan
+
+	def reconcile_job(self, spec, chunk_size=DEFAULT_CHUNK_SIZE):
+		"""reconcile() as a ChunkedJob, with the deletes running first"""
+		plan = self.plan(spec)
+		items = ([("delete", aov) for aov in plan.deletes] +
+				[("create", key) for key in plan.creates] +
+				[("update", update) for update in plan.updates])
+		return ChunkedJob("Reconcile AOVs", items, self._apply_plan_chunk, chunk_size)
+
+	def _apply_plan_chunk(self, items):
+		# Chunks run later, through evalDeferred in the UI, so the AOVs are
+		# checked again: ones deleted or replaced since the plan are skipped,
+		# and an update whose node was removed is made again like plan() does
+		plan = ReconcilePlan()
+		resolve_nodes([item if kind == "delete" else item[0] for kind, item in items if kind != "create"],
+					self._backend)
+		for kind, item in items:
+			if kind == "create":
+				if not self.aov_exists(*item):
+					plan.creates.append(item)
+				continue
+			aov = item if kind == "delete" else item[0]
+			if self._registry.get(aov.light_group, aov.render_pass) is not aov:
+				continue
+			if kind == "delete":
+				plan.deletes.append(aov)
+			elif self._backend.node_exists(aov._aov_node):
+				plan.updates.append(item)
+			else:
+				self._registry.remove(aov)
+				plan.creates.append((aov.light_group, aov.render_pass))
+		self.apply_plan(plan)
+		return items
+
+	def sync_scene(self, lights_changed=False, added_nodes=(), removed_nodes=()):
+		"""
+		Patch the registry after edits made to the scene outside of the manager.
+		lights_changed re-reads the light groups, and the node lists hold the
+		names of aiAOV nodes that were created or deleted. Only the affected
+		registry entries are touched. Returns a dict of what changed.
+		"""
+		changes = {"added_groups": [], "removed_groups": [], "added_aovs": [], "removed_aovs": []}
+
+		if lights_changed:
+			groups = self.getSceneLightGroups()
+			changes["added_groups"] = sorted(groups - self._light_groups)
+			changes["removed_groups"] = sorted(self._light_groups - groups)
+			self._light_groups = groups
+
+			for group_name in changes["removed_groups"]:
+				group_aovs = self._registry.get_group(group_name)
+				self._registry.remove_many(group_aovs)
+				changes["removed_aovs"].extend(group_aovs)
+			changes["added_aovs"].extend(self._initialize_aov_list(changes["added_groups"]))
+
+		known_groups = self._light_groups.union(self._registry.groups(), self._merged_groups)
+		for node_name in removed_nodes:
+			parsed = AOV.parse_node_name(node_name, known_groups)
+			aov = self._registry.get(*parsed) if parsed else None
+			# A node with the same name may have been recreated since
+			if aov is not None and not self._backend.node_exists(aov._aov_node):
+				self._registry.remove(aov)
+				changes["removed_aovs"].append(aov)
+
+		for node_name in added_nodes:
+			parsed = AOV.parse_node_name(node_name, known_groups)
+			if parsed is None or self.aov_exists(*parsed):
+				continue
+			node = self._backend.find_aov_node(node_name)
+			if node is None:
+				continue
+			new_aov = AOV(parsed[0], parsed[1], False, node, self._backend)
+			self._registry.add(new_aov)
+			changes["added_aovs"].append(new_aov)
+
+		return changes
+
+	def save_index(self):
+		"""Store the AOVs in the scene, so the next attach can skip the scan"""
+		groups = self.getSceneLightGroups().union(self._merged_groups)
+		aov_list = [aov for aov in self._registry.get_all() if aov.light_group in groups]
+		resolve_nodes(aov_list, self._backend)
+		aov_list = [aov for aov in aov_list if self._backend.node_exists(aov._aov_node)]
+		uuids = self._backend.node_uuids([aov._aov_node for aov in aov_list])
+		entries = [(aov.light_group, aov.render_pass, node_uuid, AOV.node_name(aov.light_group, aov.render_pass), aov.lpe)
+				for aov, node_uuid in zip(aov_list, uuids)]
+		text = scene_index.encode_index(groups, self._backend.count_aov_nodes(), entries)
+		self._backend.write_file_info(scene_index.INDEX_KEY, text)
+
+	def _load_index(self, group_names):
+		# The index is only used when it matches the scene exactly, see scene_index
+		index = scene_index.decode_index(self._backend.read_file_info(scene_index.INDEX_KEY))
+		if index is None or index["groups"] != sorted(group_names):
+			return False
+		# aiAOV nodes made outside of the tool since the save aren't indexed
+		if index["node_count"] != self._backend.count_aov_nodes():
+			return False
+
+		node_names = index["node_names"]
+		if sorted(self._backend.node_names_from_uuids(index["uuids"])) != sorted(node_names):
+			return False
+
+		# The stored names and LPEs are trusted. Nodes are bound lazily,
+		# or in bulk by the first operation that needs them.
+		prefix = len(AOV_NODE_PREFIX)
+		backend = self._backend
+		add = self._registry.add
+		for group_name, render_pass, node_name, expression in zip(
+				index["light_groups"], index["render_passes"], node_names, index["lpes"]):
+			add(AOV(group_name, render_pass, False, backend=backend, expression=expression), node_name[prefix:])
+		return True
 
-	def delete_aovs(self, group_name):
-		list_to_delete = self.get_aov_list(group_name)
+	def _initialize_aov_list(self, group_names):
+		# List the scene's aiAOV nodes once and parse each name once,
+		# binding the listed node so no AOV has to look itself up again.
+		groups = set(group_names)
+		new_aovs = []
+		if not groups:
+			return new_aovs
 
-		for aov in list_to_delete:
-			self.delete_aov(aov.light_group, aov.render_pass)
+		for node in self._backend.list_aov_nodes():
+			parsed = AOV.parse_node_name(self._backend.node_name(node), groups)
+			if parsed is None or self.aov_exists(*parsed):
+				continue
+			new_aov = AOV(parsed[0], parsed[1], False, node, self._backend)
+			self._registry.add(new_aov)
+			new_aovs.append(new_aov)
+		return new_aovs
 
 	def _initialize_group_list(self, group_name):
-		existing_list = pm.ls(type="aiAOV")
-		search_string = "aiAOV_{}_".format(group_name)
-		for item in existing_list:
-			item_string = str(item)
-			if re.search(search_string, item_string):
-				split_string = re.split(search_string, item_string)[1]
-				self.add_aov(group_name, split_string, False)
+		self._initialize_aov_list([group_name])
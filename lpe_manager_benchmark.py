@@ -0,0 +1,459 @@
+"""
+Benchmark suite for the LPE manager.
+
+Everything runs against synthetic scenes in the in-memory scene backend,
+so no Maya license is needed:
+	python lpe_manager_benchmark.py --output bench.json
+
+The UI refresh benchmark imports lpe_manager_ui. When PyMEL, mtoa or Maya
+can't be imported, empty stub modules stand in for them, and the UI's
+list widgets are replaced by plain Python lists.
+
+Memory use per AOV object is measured with tracemalloc where it's
+available, and reported in bytes rather than seconds.
+
+Results are written as JSON. Passing a previous result file as a baseline
+compares every timing against it, and the suite exits with status 1 when
+any of them got slower by more than the threshold:
+	python lpe_manager_benchmark.py --baseline bench.json --threshold 0.25
+"""
+import argparse
+import json
+import re
+import sys
+import timeit
+import types
+import lpe
+from aov import AOV
+from aov import resolve_nodes
+from aov_registry import AOVRegistry
+from list_model import ListModel
+from lpe import AOV_PASSES
+from lpe_manager import LPEManager
+from profiler import Profiler
+from scene_backend import MemoryBackend
+
+# AOV counts the registry is timed at, its time per AOV should stay flat
+REGISTRY_SIZES = [10, 100, 1000, 10000]
+LPE_EXPRESSIONS = 100000
+SCAN_NODES = 2000
+ATTACH_GROUPS = 1000
+PASSES_PER_GROUP = 10
+
+# (name, light count, light group count)
+SCENES = [
+	("small", 100, 20),
+	("large", 5000, 500),
+]
+
+# Timings shorter than this are too noisy to flag as regressions
+MIN_REGRESSION_TIME = 0.001
+STUB_MODULES = ["maya", "maya.api", "maya.api.OpenMaya", "maya.cmds", "maya.mel", "mtoa", "pymel", "pymel.core"]
+
+
+class BenchmarkAOV(object):
+	"""Lightweight record with the attributes AOVRegistry indexes"""
+
+	def __init__(self, light_group, render_pass):
+		self.light_group = light_group
+		self.render_pass = render_pass
+
+	def nice_name(self):
+		return "{}_{}".format(self.light_group, self.render_pass)
+
+
+class StubTextScrollList(object):
+	"""Stands in for a PyMEL textScrollList when timing UI updates"""
+
+	def __init__(self):
+		super(StubTextScrollList, self).__init__()
+		self.items = []
+		self.selection = []
+		self.enabled = True
+
+	def edit(self, removeAll=False, append=(), removeIndexedItem=(), appendPosition=(),
+			selectItem=None, showIndexedItem=None):
+		if removeAll:
+			self.items = []
+			self.selection = []
+		for index in removeIndexedItem:
+			item = self.items.pop(index - 1)
+			if item in self.selection:
+				self.selection.remove(item)
+		for index, item in appendPosition:
+			self.items.insert(index - 1, item)
+		self.items.extend(append)
+		if selectItem is not None:
+			self.selection = [selectItem]
+
+	def getSelectItem(self):
+		return list(self.selection)
+
+	def setEnable(self, enabled):
+		self.enabled = enabled
+
+	def setSelectItem(self, item):
+		self.selection = [item]
+
+
+class StubTextField(object):
+	"""Stands in for a PyMEL textField when timing UI updates"""
+
+	def __init__(self):
+		super(StubTextField, self).__init__()
+		self.text = ""
+
+	def setText(self, text):
+		self.text = text
+
+
+class StubText(object):
+	"""Stands in for a PyMEL text when timing UI updates"""
+
+	def __init__(self):
+		super(StubText, self).__init__()
+		self.label = ""
+
+	def setLabel(self, label):
+		self.label = label
+
+
+def install_stub_modules():
+	"""Register empty modules for the Maya packages that can't be imported"""
+	for name in STUB_MODULES:
+		try:
+			__import__(name)
+		except ImportError:
+			module = types.ModuleType(name)
+			sys.modules[name] = module
+			parent, _, child = name.rpartition(".")
+			if parent:
+				setattr(sys.modules[parent], child, module)
+
+
+def best_of(repeat, setup, run):
+	"""Run setup() untimed and run(state) timed, returning the fastest run"""
+	best = None
+	for _ in range(repeat):
+		state = setup()
+		start = timeit.default_timer()
+		run(state)
+		elapsed = timeit.default_timer() - start
+		if best is None or elapsed < best:
+			best = elapsed
+	return best
+
+
+def make_aovs(count):
+	return [BenchmarkAOV("group{}".format(index // PASSES_PER_GROUP),
+						"pass{}".format(index % PASSES_PER_GROUP))
+			for index in range(count)]
+
+
+def make_scene(light_count, group_count, existing_level=None):
+	"""In-memory scene with lights spread over groups and optional existing AOVs"""
+	backend = MemoryBackend()
+	groups = ["group{}".format(index) for index in range(group_count)]
+	for index in range(light_count):
+		backend.add_light("lightShape{}".format(index), group=groups[index % group_count])
+
+	if existing_level is not None:
+		for group in groups:
+			for render_pass in AOV_PASSES[existing_level]:
+				node = backend.create_aov_node("{}_{}".format(group, render_pass))
+				backend.set_lpe(node, lpe.format_lpe(group, render_pass))
+	return backend, groups
+
+
+def make_ui(manager):
+	install_stub_modules()
+	from lpe_manager_ui import LPEManagerUI
+
+	ui = LPEManagerUI.__new__(LPEManagerUI)
+	ui._manager = manager
+	ui._render_totals = None
+	ui.widgets = {
+		"lightGroupList": StubTextScrollList(),
+		"aovList": StubTextScrollList(),
+		"lpeField": StubTextField(),
+		"estimateText": StubText(),
+		"buildCostText": StubText()
+	}
+	ui.models = dict((name, ListModel(ui.widgets[name].edit)) for name in ["lightGroupList", "aovList"])
+	return ui
+
+
+def bench_registry(repeat):
+	results = {}
+	for size in REGISTRY_SIZES:
+		aovs = make_aovs(size)
+
+		def build(registry):
+			for aov in aovs:
+				if (aov.light_group, aov.render_pass) not in registry:
+					registry.add(aov)
+
+		def filled():
+			registry = AOVRegistry()
+			build(registry)
+			return registry
+
+		def lookup(registry):
+			for aov in aovs:
+				registry.get_by_name(aov.nice_name())
+
+		def delete(registry):
+			for aov in aovs:
+				registry.remove(aov)
+
+		results["registry.{}.build".format(size)] = best_of(repeat, AOVRegistry, build)
+		results["registry.{}.lookup".format(size)] = best_of(repeat, filled, lookup)
+		results["registry.{}.delete".format(size)] = best_of(repeat, filled, delete)
+	return results
+
+
+def bench_lpe(repeat):
+	passes = sorted(lpe.SCATTER_EVENTS.keys())
+	unique_keys = [("group{}".format(index), passes[index % len(passes)]) for index in range(LPE_EXPRESSIONS)]
+	# 150 groups x 10 passes, looked up over and over like a large build
+	repeated_keys = [("group{}".format(index % 150), passes[index % 10]) for index in range(LPE_EXPRESSIONS)]
+
+	def format_all(keys):
+		for group, render_pass in keys:
+			lpe.format_lpe(group, render_pass)
+
+	def parse_all(keys):
+		# Building and validating every expression, as before the cache
+		for group, render_pass in keys:
+			lpe._Parser("C{}<L.'{}'>".format(lpe.SCATTER_EVENTS[render_pass], group)).parse()
+
+	def warm_cache():
+		lpe.clear_cache()
+		format_all(repeated_keys)
+		return repeated_keys
+
+	results = {
+		"lpe.format_unique": best_of(repeat, lambda: lpe.clear_cache() or unique_keys, format_all),
+		"lpe.format_repeated": best_of(repeat, lambda: lpe.clear_cache() or repeated_keys, format_all),
+		"lpe.uncached": best_of(repeat, lambda: repeated_keys, parse_all),
+		"lpe.cached": best_of(repeat, warm_cache, format_all)
+	}
+	lpe.clear_cache()
+	return results
+
+
+def legacy_scene_scan(node_names, groups):
+	# The per-group regex scan LPEManager used before the single-pass parse
+	found = []
+	for group in groups:
+		search_string = "aiAOV_{}_".format(group)
+		for item_string in node_names:
+			if re.search(search_string, item_string):
+				found.append((group, re.split(search_string, item_string)[1]))
+	return found
+
+
+def bench_scene_scan(repeat):
+	groups = set("group{}".format(index) for index in range(SCAN_NODES // PASSES_PER_GROUP))
+	node_names = ["aiAOV_{}".format(aov.nice_name()) for aov in make_aovs(SCAN_NODES)]
+
+	def scan(names):
+		for node_name in names:
+			AOV.parse_node_name(node_name, groups)
+
+	return {
+		"scan.legacy": best_of(repeat, lambda: node_names, lambda names: legacy_scene_scan(names, sorted(groups))),
+		"scan.bulk": best_of(repeat, lambda: node_names, scan)
+	}
+
+
+def bench_attach(repeat):
+	"""
+	Attach AOV objects to a scene with 10k existing aiAOV nodes, by scanning
+	them (attach.construct) and through a saved scene index (attach.indexed)
+	"""
+	passes = AOV_PASSES["fine"]
+
+	def fine_scene():
+		backend, groups = make_scene(ATTACH_GROUPS, ATTACH_GROUPS, "fine")
+		return backend, [(group, render_pass) for group in groups for render_pass in passes]
+
+	def attach(state):
+		backend, keys = state
+		resolve_nodes([AOV(group, render_pass, False, backend=backend) for group, render_pass in keys], backend)
+
+	def indexed_scene():
+		backend = fine_scene()[0]
+		LPEManager(backend).save_index()
+		return backend
+
+	results = {
+		"attach.construct": best_of(repeat, lambda: fine_scene()[0], LPEManager),
+		"attach.indexed": best_of(repeat, indexed_scene, LPEManager),
+		"attach.resolve": best_of(repeat, fine_scene, attach)
+	}
+
+	try:
+		import tracemalloc
+	except ImportError:
+		return results
+
+	backend, keys = fine_scene()
+	tracemalloc.start()
+	start = tracemalloc.get_traced_memory()[0]
+	aovs = [AOV(group, render_pass, False, backend=backend) for group, render_pass in keys]
+	resolve_nodes(aovs, backend)
+	results["memory.aov_bytes"] = float(tracemalloc.get_traced_memory()[0] - start) / len(aovs)
+	tracemalloc.stop()
+	return results
+
+
+def bench_scene(name, light_count, group_count, repeat):
+	results = {}
+
+	def existing_scene():
+		return make_scene(light_count, group_count, "coarse")[0]
+
+	results[name + ".construct"] = best_of(repeat, existing_scene, LPEManager)
+
+	def empty_manager():
+		backend, groups = make_scene(light_count, group_count)
+		return LPEManager(backend), groups
+
+	for level in ["coarse", "medium", "fine"]:
+		passes = AOV_PASSES[level]
+		results["{}.add_{}".format(name, level)] = best_of(
+			repeat, empty_manager, lambda state: state[0].add_aovs_bulk(state[1], passes))
+
+	def fine_manager():
+		manager, groups = empty_manager()
+		manager.add_aovs_bulk(groups, AOV_PASSES["fine"])
+		return manager, groups
+
+	def get_every_aov(state):
+		manager, groups = state
+		for group in groups:
+			for render_pass in AOV_PASSES["fine"]:
+				manager.get_aov("{}_{}".format(group, render_pass))
+
+	def delete_every_group(state):
+		manager, groups = state
+		for group in groups:
+			manager.delete_aovs(group)
+
+	def ui_for_fine_manager():
+		manager, groups = fine_manager()
+		ui = make_ui(manager)
+		ui.update_light_groups()
+		ui.widgets["lightGroupList"].setSelectItem(groups[-1])
+		ui.update_aovs(groups[-1])
+		return ui, groups[-1]
+
+	def refresh_ui(state):
+		# A refresh of lists that are already shown, as on every click
+		ui, group = state
+		ui.update_light_groups()
+		ui.update_aovs(group)
+
+	results[name + ".get_aov"] = best_of(repeat, fine_manager, get_every_aov)
+	results[name + ".delete_aovs"] = best_of(repeat, fine_manager, delete_every_group)
+	results[name + ".ui_refresh"] = best_of(repeat, ui_for_fine_manager, refresh_ui)
+	return results
+
+
+def bench_profiler(repeat):
+	"""The largest fine build with every scene call profiled"""
+	_, light_count, group_count = SCENES[-1]
+
+	def profiled_manager():
+		backend, groups = make_scene(light_count, group_count)
+		profiler = Profiler()
+		profiler.enable(backend)
+		return LPEManager(backend), groups
+
+	return {"profiler.add_fine": best_of(
+		repeat, profiled_manager, lambda state: state[0].add_aovs_bulk(state[1], AOV_PASSES["fine"]))}
+
+
+def bench_layers(repeat):
+	"""The largest scene with a different level on each of four render layers"""
+	_, light_count, group_count = SCENES[-1]
+	levels = ["fine", "medium", "coarse", "coarse"]
+
+	def layered_manager():
+		backend, groups = make_scene(light_count, group_count)
+		manager = LPEManager(backend)
+		for index, level in enumerate(levels):
+			layer_name = backend.add_render_layer("layer{}".format(index))
+			manager.set_layer_spec(layer_name, dict((group, level) for group in groups))
+		return manager
+
+	def applied_manager():
+		manager = layered_manager()
+		manager.apply_layers()
+		return manager
+
+	return {
+		"layers.apply": best_of(repeat, layered_manager, lambda manager: manager.apply_layers()),
+		"layers.reapply": best_of(repeat, applied_manager, lambda manager: manager.apply_layers())
+	}
+
+
+def run_suite(repeat):
+	results = {}
+	results.update(bench_registry(repeat))
+	results.update(bench_lpe(repeat))
+	results.update(bench_scene_scan(repeat))
+	results.update(bench_attach(repeat))
+	results.update(bench_profiler(repeat))
+	results.update(bench_layers(repeat))
+	for name, light_count, group_count in SCENES:
+		results.update(bench_scene(name, light_count, group_count, repeat))
+	return results
+
+
+def find_regressions(results, baseline, threshold):
+	regressions = []
+	for metric, previous in sorted(baseline.items()):
+		current = results.get(metric)
+		if current is None or previous < MIN_REGRESSION_TIME:
+			continue
+		if current > previous * (1.0 + threshold):
+			regressions.append((metric, previous, current))
+	return regressions
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Benchmark the LPE manager on synthetic scenes")
+	parser.add_argument("--output", help="write the results to this JSON file")
+	parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+	parser.add_argument("--threshold", type=float, default=0.25,
+						help="allowed slowdown against the baseline, 0.25 is 25%% (default)")
+	parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark, the fastest is kept")
+	args = parser.parse_args(argv)
+
+	results = run_suite(args.repeat)
+	for metric in sorted(results):
+		if metric.startswith("memory."):
+			print("{:<28} {:>12.1f} B".format(metric, results[metric]))
+		else:
+			print("{:<28} {:>12.3f} ms".format(metric, results[metric] * 1e3))
+
+	if args.output:
+		with open(args.output, "w") as output_file:
+			json.dump({"version": 1, "python": sys.version.split()[0], "results": results},
+					output_file, indent=2, sort_keys=True)
+
+	if args.baseline:
+		with open(args.baseline) as baseline_file:
+			baseline = json.load(baseline_file)["results"]
+		regressions = find_regressions(results, baseline, args.threshold)
+		for metric, previous, current in regressions:
+			print("REGRESSION {}: {:.3f} ms -> {:.3f} ms".format(metric, previous * 1e3, current * 1e3))
+		if regressions:
+			return 1
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
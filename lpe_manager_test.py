@@ -1,9 +1,15 @@
 import os
 import unittest
-import pymel.core as pm
+import lpe
+from light_clustering import NUMPY_AVAILABLE
 from lpe_manager import LPEManager
 from aov import AOV
-from aov import arnold
+from driver_layout import DriverLayout
+from lpe import AOV_PASSES
+import render_budget
+from render_budget import aov_cost
+from scene_backend import MemoryBackend
+from scene_backend import get_backend
 
 # Test scene has 2 lights:
 # warmLightShape
@@ -11,8 +17,39 @@ from aov import arnold
 TEST_SCENE_PATH = "General\\scripts\\lpe_manager\\test_scene.mb"
 
 
-def openMayaFile(sceneName):
-	pm.system.openFile(sceneName, force=True)
+def openTestScene():
+	backend = get_backend()
+	if isinstance(backend, MemoryBackend):
+		backend.new_scene()
+		backend.add_light("warmLightShape", group="warm")
+		backend.add_light("coldLightShape", group="cold")
+	else:
+		backend.open_scene(os.path.join(os.getcwd(), TEST_SCENE_PATH))
+
+
+def add_render_layer(layer_name):
+	backend = get_backend()
+	if isinstance(backend, MemoryBackend):
+		return backend.add_render_layer(layer_name)
+	import maya.app.renderSetup.model.renderSetup as renderSetup
+	return renderSetup.instance().createRenderLayer(layer_name).name()
+
+
+def delete_render_layer(layer_name):
+	backend = get_backend()
+	if isinstance(backend, MemoryBackend):
+		return backend.delete_render_layer(layer_name)
+	import maya.app.renderSetup.model.renderLayer as renderLayer
+	import maya.app.renderSetup.model.renderSetup as renderSetup
+	renderLayer.delete(renderSetup.instance().getRenderLayer(layer_name))
+
+
+def aov_node_count():
+	return len(get_backend().list_aov_nodes())
+
+
+def setUpModule():
+	openTestScene()
 
 
 class LPEManagerTest(unittest.TestCase):
@@ -20,9 +57,13 @@ class LPEManagerTest(unittest.TestCase):
 
 	def setUp(self):
 		self.manager = LPEManager()
-		dirPath = os.getcwd()
-		filePath = os.path.join(dirPath, TEST_SCENE_PATH)
-		openMayaFile(filePath)
+		self.backend = get_backend()
+		openTestScene()
+
+	def tearDown(self):
+		lpe.unregister_merged_group("warm_cold")
+		# The next test's manager is made before it opens the scene
+		openTestScene()
 
 	def test_gets_lights_in_scene(self):
 		lights = self.manager.getSceneLights()
@@ -36,6 +77,19 @@ class LPEManagerTest(unittest.TestCase):
 		self.assertTrue("warm" in groups)
 		self.assertTrue("cold" in groups)
 
+	def test_gets_light_group_map(self):
+		group_map = self.manager.getSceneLightGroupMap()
+		self.assertEqual(group_map["warm"], ["warmLightShape"])
+		self.assertEqual(group_map["cold"], ["coldLightShape"])
+
+	def test_gets_maya_lights_in_light_groups(self):
+		self.backend.create_light("pointLight", "warm")
+		spot_light = self.backend.create_light("spotLight", "spot")
+
+		group_map = self.manager.getSceneLightGroupMap()
+		self.assertEqual(len(group_map["warm"]), 2)
+		self.assertEqual(group_map["spot"], [spot_light])
+
 	def test_adds_an_AOV(self):
 		new_aov = self.manager.add_aov("group_name", "diffuse")
 		self.assertTrue(type(new_aov) is AOV)
@@ -94,8 +148,7 @@ class LPEManagerTest(unittest.TestCase):
 		self.assertEqual(len(test_list), 0)
 
 		# check the actual Maya scene file
-		aov_list = pm.ls(type="aiAOV")
-		self.assertEqual(len(aov_list), 0)
+		self.assertEqual(aov_node_count(), 0)
 
 	def test_delete_aovs_of_group(self):
 		group_name = "group_1"
@@ -131,6 +184,555 @@ class LPEManagerTest(unittest.TestCase):
 
 	def test_gets_existing_aov_nodes(self):
 		aov_name = "test_group_test_pass"
-		arnold.aovs.AOVInterface().addAOV(aov_name)
+		self.backend.create_aov_node(aov_name)
 		self.manager._initialize_group_list("test_group")
 		self.assertEqual(len(self.manager.get_aov_list()), 1)
+
+	def test_gets_existing_aov_nodes_for_overlapping_groups(self):
+		self.backend.create_aov_node("key_diffuse")
+		self.backend.create_aov_node("key_fill_diffuse")
+		self.manager._initialize_aov_list(["key", "key_fill"])
+
+		self.assertEqual(len(self.manager.get_aov_list("key")), 1)
+		self.assertEqual(len(self.manager.get_aov_list("key_fill")), 1)
+		self.assertEqual(self.manager.get_aov_list("key_fill")[0].render_pass, "diffuse")
+
+	def test_bulk_adds_every_group_and_pass(self):
+		new_aovs = self.manager.add_aovs_bulk(["group_1", "group_2"], ["direct", "indirect"])
+		self.assertEqual(len(new_aovs), 4)
+		self.assertEqual(len(self.manager.get_aov_list("group_2")), 2)
+
+		aov_node = self.backend.find_aov_node("aiAOV_group_2_indirect")
+		self.assertEqual(self.backend.get_lpe(aov_node), AOV.format_lpe("group_2", "indirect"))
+
+	def test_bulk_add_skips_existing_aovs(self):
+		self.manager.add_aov("group_1", "direct")
+		new_aovs = self.manager.add_aovs_bulk(["group_1"], ["direct", "indirect"])
+		self.assertEqual(len(new_aovs), 1)
+		self.assertEqual(aov_node_count(), 2)
+
+	def test_bulk_add_is_a_single_undo(self):
+		self.manager.add_aovs_bulk(["group_1"], ["direct", "indirect", "emission"])
+		self.assertEqual(aov_node_count(), 3)
+		self.backend.undo()
+		self.assertEqual(aov_node_count(), 0)
+
+	def test_bulk_add_rolls_back_on_failure(self):
+		def failing_set_lpes(node_expressions):
+			raise RuntimeError("setAttr failed")
+
+		self.backend.set_lpes = failing_set_lpes
+		try:
+			self.assertRaises(RuntimeError, self.manager.add_aovs_bulk, ["group_1"], ["direct", "indirect"])
+		finally:
+			del self.backend.set_lpes
+
+		self.assertEqual(len(self.manager.get_aov_list()), 0)
+		self.assertEqual(aov_node_count(), 0)
+
+	def test_bulk_add_rejects_unknown_passes(self):
+		self.assertRaises(lpe.LPEError, self.manager.add_aovs_bulk, ["group_1"], ["direct", "fake pass"])
+		self.assertEqual(aov_node_count(), 0)
+
+	def test_delete_aovs_of_whole_scene(self):
+		self.manager.add_aovs_bulk(["group_1", "group_2"], ["beauty", "direct"])
+		self.manager.delete_aovs()
+
+		self.assertEqual(len(self.manager.get_aov_list()), 0)
+		self.assertEqual(aov_node_count(), 0)
+
+	def test_delete_aovs_is_a_single_undo(self):
+		self.manager.add_aovs_bulk(["group_1"], ["beauty", "direct", "indirect"])
+		self.manager.delete_aovs("group_1")
+		self.assertEqual(aov_node_count(), 0)
+		self.backend.undo()
+		self.assertEqual(aov_node_count(), 3)
+
+	def test_delete_aovs_skips_nodes_deleted_outside_the_tool(self):
+		self.manager.add_aovs("group_1", ["beauty", "direct"])
+		self.backend.delete_nodes([self.backend.find_aov_node("aiAOV_group_1_beauty")])
+		self.manager.delete_aovs("group_1")
+
+		self.assertEqual(len(self.manager.get_aov_list()), 0)
+		self.assertEqual(aov_node_count(), 0)
+
+	def test_sync_picks_up_new_aov_nodes(self):
+		manager = LPEManager()
+		self.backend.create_aov_node("warm_direct")
+		changes = manager.sync_scene(added_nodes=["aiAOV_warm_direct"])
+
+		self.assertEqual(len(changes["added_aovs"]), 1)
+		self.assertTrue(manager.aov_exists("warm", "direct"))
+
+	def test_sync_keeps_aovs_whose_node_was_recreated(self):
+		manager = LPEManager()
+		manager.add_aov("warm", "direct")
+		changes = manager.sync_scene(removed_nodes=["aiAOV_warm_direct"])
+
+		self.assertEqual(changes["removed_aovs"], [])
+		self.assertTrue(manager.aov_exists("warm", "direct"))
+
+	def test_reconcile_creates_missing_aovs(self):
+		manager = LPEManager()
+		plan = manager.reconcile({"warm": "coarse", "cold": ["diffuse"]})
+
+		self.assertEqual(plan.summary(), {"create": 5, "delete": 0, "update": 0})
+		self.assertEqual(len(manager.get_aov_list("warm")), 4)
+		self.assertEqual(aov_node_count(), 5)
+
+	def test_reconcile_switches_levels_with_minimal_edits(self):
+		manager = LPEManager()
+		manager.reconcile({"warm": "fine"})
+		plan = manager.reconcile({"warm": "medium"})
+
+		# coat, transmission, sss, volume, emission and background are shared
+		self.assertEqual(plan.summary(), {"create": 2, "delete": 4, "update": 0})
+		passes = set(aov.render_pass for aov in manager.get_aov_list("warm"))
+		self.assertEqual(passes, set(AOV_PASSES["medium"]))
+		self.assertEqual(aov_node_count(), len(AOV_PASSES["medium"]))
+
+	def test_reconcile_updates_stale_lpes(self):
+		manager = LPEManager()
+		manager.reconcile({"warm": ["diffuse"]})
+		aov = manager.get_aov("warm_diffuse")
+		self.backend.set_lpe(aov._aov_node, "C.*")
+
+		plan = manager.reconcile({"warm": ["diffuse"]})
+		self.assertEqual(plan.summary(), {"create": 0, "delete": 0, "update": 1})
+		self.assertEqual(self.backend.get_lpe(aov._aov_node), AOV.format_lpe("warm", "diffuse"))
+
+	def test_reconcile_recreates_nodes_deleted_outside_the_tool(self):
+		manager = LPEManager()
+		manager.reconcile({"warm": ["diffuse"]})
+		self.backend.delete_nodes([self.backend.find_aov_node("aiAOV_warm_diffuse")])
+
+		plan = manager.reconcile({"warm": ["diffuse"]})
+		self.assertEqual(plan.summary(), {"create": 1, "delete": 1, "update": 0})
+		self.assertEqual(aov_node_count(), 1)
+
+	def test_reconcile_leaves_other_groups_alone(self):
+		manager = LPEManager()
+		manager.reconcile({"warm": "coarse", "cold": "coarse"})
+		manager.reconcile({"warm": ["diffuse"]})
+		self.assertEqual(len(manager.get_aov_list("cold")), 4)
+
+	def test_reconcile_dry_run_does_not_touch_the_scene(self):
+		manager = LPEManager()
+		plan = manager.reconcile({"warm": "fine"}, dry_run=True)
+
+		self.assertEqual(len(plan.creates), 10)
+		self.assertEqual(aov_node_count(), 0)
+		self.assertEqual(manager.get_aov_list(), [])
+
+	def test_reconcile_is_a_single_undo(self):
+		manager = LPEManager()
+		manager.reconcile({"warm": "coarse"})
+		manager.reconcile({"warm": "medium"})
+		self.backend.undo()
+		self.assertEqual(aov_node_count(), 4)
+
+	def test_lists_existing_aovs_as_a_spec(self):
+		self.manager.add_aovs_bulk(["warm"], ["direct", "indirect"])
+		self.assertEqual(dict(self.manager.current_spec()), {"warm": ["direct", "indirect"]})
+
+	def test_estimates_existing_aovs(self):
+		self.manager.add_aovs_bulk(["warm", "cold"], AOV_PASSES["coarse"])
+		self.assertEqual(self.manager.estimate().aov_count, 2 * len(AOV_PASSES["coarse"]))
+
+	def test_estimates_with_the_layout_data_type(self):
+		rgb = self.manager.estimate({"warm": ["direct"]})
+		self.manager.set_layout(DriverLayout("per_group", half_precision=True, data_type="rgba"))
+		rgba = self.manager.estimate({"warm": ["direct"]})
+		settings = self.backend.render_settings()
+		pixels = settings["width"] * settings["height"]
+		self.assertEqual(rgba.memory - rgb.memory, pixels * 4)
+		self.assertEqual(self.manager.estimate({"warm": ["direct"]}).groups["warm"][2], int(
+			pixels * 4 * 2 * render_budget.COMPRESSION_RATIOS["zip"]))
+
+	def test_picks_levels_within_a_budget(self):
+		spec = self.manager.budget_spec(["warm", "cold"], memory_cap=1024 ** 4)
+		self.assertEqual(dict(spec), {"warm": "fine", "cold": "fine"})
+
+	def test_consolidation_merges_light_groups(self):
+		self.manager.add_aovs_bulk(["warm", "cold"], AOV_PASSES["coarse"])
+		plan = self.manager.consolidate({"warm_cold": ["warm", "cold"]})
+
+		self.assertEqual(plan.summary()["delete"], 8)
+		self.assertEqual(plan.summary()["create"], 4)
+		self.assertEqual(self.manager.get_aov_list("warm"), [])
+		merged = self.manager.get_aov("warm_cold_direct")
+		self.assertEqual(self.backend.get_lpe(merged._aov_node), "C[DSV]<L.('cold'|'warm')>")
+
+	def test_consolidation_drops_redundant_aovs(self):
+		self.manager.add_aovs_bulk(["warm"], ["beauty"] + AOV_PASSES["coarse"])
+		plan = self.manager.consolidate(dry_run=True)
+		self.assertEqual([aov.nice_name() for aov in plan.deletes], ["warm_beauty"])
+		self.assertEqual(aov_node_count(), 5)
+
+	def test_finds_merged_aovs_when_attaching(self):
+		self.manager.add_aovs_bulk(["warm", "cold"], ["direct"])
+		self.manager.consolidate({"warm_cold": ["warm", "cold"]})
+		manager = LPEManager()
+		self.assertTrue(manager.get_aov("warm_cold_direct") is not None)
+
+	def test_registers_stored_merged_groups_when_attaching(self):
+		self.manager.add_aovs_bulk(["warm", "cold"], ["direct"])
+		self.manager.consolidate({"warm_cold": ["warm", "cold"]})
+		# As in a new session, or a batch worker
+		lpe.unregister_merged_group("warm_cold")
+		manager = LPEManager()
+		self.assertEqual(dict(manager.merged_groups), {"warm_cold": ["cold", "warm"]})
+		self.assertEqual(manager.get_aov("warm_cold_direct").lpe, "C[DSV]<L.('cold'|'warm')>")
+
+	def test_drops_merged_groups_of_an_earlier_scene_when_attaching(self):
+		self.manager.add_aovs_bulk(["warm", "cold"], ["direct"])
+		self.manager.consolidate({"warm_cold": ["warm", "cold"]})
+		openTestScene()
+		self.backend.create_light("pointLight", "warm_cold")
+		manager = LPEManager()
+		self.assertEqual(dict(manager.merged_groups), {})
+		self.assertFalse("warm_cold" in lpe.MERGED_GROUPS)
+		self.assertEqual(manager.add_aov("warm_cold", "direct").lpe, "C[DSV]<L.'warm_cold'>")
+
+	def test_merged_group_cant_reuse_a_light_group(self):
+		self.assertRaises(ValueError, self.manager.plan_consolidation, {"warm": ["warm", "cold"]})
+
+	def test_builds_aovs_onto_the_driver_layout(self):
+		self.manager.layout = DriverLayout("per_group", half_precision=True, compression="dwaa")
+		new_aovs = self.manager.add_aovs_bulk(["warm", "cold"], AOV_PASSES["coarse"])
+
+		for aov in new_aovs:
+			driver, data_type = self.backend.get_aov_output(aov._aov_node)
+			self.assertEqual(driver, "aiAOVDriver_lpe_" + aov.light_group)
+			self.assertEqual(data_type, 5)
+		if isinstance(self.backend, MemoryBackend):
+			settings = self.backend.get_driver("aiAOVDriver_lpe_warm").attributes
+			self.assertTrue(settings["half_precision"])
+			self.assertEqual(settings["compression"], "dwaa")
+
+	def test_rolls_back_the_drivers_of_a_failed_build(self):
+		def failing_set_aov_outputs(node_drivers, data_type):
+			raise RuntimeError("connectAttr failed")
+
+		self.manager.layout = DriverLayout("per_group")
+		self.backend.set_aov_outputs = failing_set_aov_outputs
+		try:
+			self.assertRaises(RuntimeError, self.manager.add_aovs_bulk, ["warm", "cold"], ["direct"])
+		finally:
+			del self.backend.set_aov_outputs
+		self.assertEqual(aov_node_count(), 0)
+		self.assertEqual(self.backend.unused_drivers("aiAOVDriver_lpe"), [])
+
+	def test_moves_existing_aovs_to_a_new_layout(self):
+		self.manager.add_aovs_bulk(["warm", "cold"], ["direct"])
+		self.manager.set_layout(DriverLayout("single"))
+		drivers = set(self.backend.get_aov_output(aov._aov_node)[0] for aov in self.manager.get_aov_list())
+		self.assertEqual(drivers, set(["aiAOVDriver_lpe"]))
+
+		self.manager.set_layout(DriverLayout("default"))
+		aov = self.manager.get_aov("warm_direct")
+		self.assertEqual(self.backend.get_aov_output(aov._aov_node)[0], "defaultArnoldDriver")
+
+	def test_selects_aov_nodes(self):
+		aov = self.manager.add_aovs_bulk(["warm"], ["direct"])[0]
+		self.manager.select_aovs([aov])
+		if isinstance(self.backend, MemoryBackend):
+			self.assertEqual(self.backend.selection, [aov._aov_node])
+
+	def test_deletes_drivers_left_without_aovs(self):
+		self.manager.add_aovs_bulk(["warm", "cold"], ["direct"])
+		self.manager.set_layout(DriverLayout("per_group"))
+		self.manager.set_layout(DriverLayout("single"))
+		self.assertEqual(self.backend.unused_drivers("aiAOVDriver_lpe"), [])
+		if isinstance(self.backend, MemoryBackend):
+			self.assertEqual(self.backend.get_driver("aiAOVDriver_lpe_warm"), None)
+			self.assertTrue(self.backend.get_driver("aiAOVDriver_lpe") is not None)
+
+	def test_keeps_the_driver_layout_in_the_scene(self):
+		self.manager.set_layout(DriverLayout("per_group", data_type="rgba"))
+		manager = LPEManager()
+		self.assertEqual((manager.layout.mode, manager.layout.data_type), ("per_group", "rgba"))
+		new_aov = manager.add_aovs_bulk(["warm"], ["direct"])[0]
+		self.assertEqual(self.backend.get_aov_output(new_aov._aov_node)[0], "aiAOVDriver_lpe_warm")
+
+	def test_builds_aovs_in_chunks(self):
+		job = self.manager.add_aovs_job(["warm", "cold"], AOV_PASSES["fine"], chunk_size=6)
+		self.assertEqual(job.total, 20)
+		job.step()
+		self.assertEqual(len(self.manager.get_aov_list()), 6)
+		self.assertEqual(aov_node_count(), 6)
+		job.run()
+		self.assertEqual(len(self.manager.get_aov_list()), 20)
+
+	def test_cancelled_build_keeps_registry_and_scene_in_step(self):
+		job = self.manager.add_aovs_job(["warm", "cold"], AOV_PASSES["fine"], chunk_size=6)
+		job.step()
+		job.step()
+		job.cancel()
+		job.run()
+		self.assertEqual(len(self.manager.get_aov_list()), 12)
+		self.assertEqual(aov_node_count(), 12)
+
+	def test_deletes_aovs_in_chunks(self):
+		self.manager.add_aovs_bulk(["warm", "cold"], AOV_PASSES["coarse"])
+		self.manager.delete_aovs_job(chunk_size=3).run()
+		self.assertEqual(self.manager.get_aov_list(), [])
+		self.assertEqual(aov_node_count(), 0)
+
+	def test_reconciles_in_chunks(self):
+		self.manager.add_aovs_bulk(["warm"], AOV_PASSES["coarse"])
+		job = self.manager.reconcile_job({"warm": "fine"}, chunk_size=4)
+		job.run()
+		self.assertTrue(self.manager.plan({"warm": "fine"}).is_empty())
+		self.assertEqual(aov_node_count(), len(AOV_PASSES["fine"]))
+
+	def test_reconcile_chunks_skip_nodes_deleted_in_between(self):
+		self.manager.add_aovs_bulk(["warm", "cold"], ["direct", "indirect"])
+		for aov in self.manager.get_aov_list():
+			self.backend.set_lpe(aov._aov_node, "C.*")
+		job = self.manager.reconcile_job({"warm": ["direct"], "cold": ["direct", "indirect"]}, chunk_size=1)
+		# Deleted outside of the tool before their chunks run
+		self.backend.delete_nodes([self.manager.get_aov("warm_indirect")._aov_node,
+								self.manager.get_aov("cold_direct")._aov_node])
+		job.run()
+		self.assertTrue(self.manager.plan({"warm": ["direct"], "cold": ["direct", "indirect"]}).is_empty())
+		self.assertEqual(aov_node_count(), 3)
+
+	def reopen_without_scanning(self):
+		# A manager that can only attach through the stored index
+		def no_scan():
+			raise AssertionError("The scene was scanned")
+		self.backend.list_aov_nodes = no_scan
+		try:
+			return LPEManager()
+		finally:
+			del self.backend.list_aov_nodes
+
+	def test_attaches_through_a_saved_index(self):
+		self.manager.add_aovs_bulk(["warm", "cold"], AOV_PASSES["coarse"])
+		self.manager.save_index()
+
+		manager = self.reopen_without_scanning()
+		self.assertEqual(len(manager.get_aov_list()), 8)
+		aov = manager.get_aov("warm_direct")
+		self.assertEqual(self.backend.get_lpe(aov._aov_node), aov.lpe)
+
+	def test_trusts_the_indexed_lpes(self):
+		self.manager.add_aovs_bulk(["warm"], AOV_PASSES["coarse"])
+		self.manager.save_index()
+
+		def no_format(group, render_pass, strict=False):
+			raise AssertionError("The LPE of {}_{} was formatted again".format(group, render_pass))
+		format_lpe = AOV.format_lpe
+		AOV.format_lpe = staticmethod(no_format)
+		try:
+			manager = self.reopen_without_scanning()
+		finally:
+			AOV.format_lpe = format_lpe
+		aov = manager.get_aov("warm_direct")
+		self.assertEqual(aov.lpe, lpe.format_lpe("warm", "direct"))
+		self.assertEqual(manager.get_aov_list("warm")[0].render_pass, AOV_PASSES["coarse"][0])
+
+	def test_rescans_when_a_node_was_deleted(self):
+		self.manager.add_aovs_bulk(["warm"], AOV_PASSES["coarse"])
+		self.manager.save_index()
+		self.backend.delete_nodes([self.backend.find_aov_node("aiAOV_warm_direct")])
+		self.backend.create_aov_node("unrelated")
+
+		manager = LPEManager()
+		self.assertEqual(len(manager.get_aov_list()), 3)
+		self.assertEqual(manager.get_aov("warm_direct"), None)
+
+	def test_rescans_when_a_node_was_added_outside_of_the_tool(self):
+		self.manager.add_aov("warm", "direct")
+		self.manager.save_index()
+		self.backend.create_aov_node("warm_indirect")
+
+		manager = LPEManager()
+		self.assertTrue(manager.get_aov("warm_indirect") is not None)
+		self.assertEqual(manager.add_aov("warm", "indirect"), None)
+		self.assertEqual(aov_node_count(), 2)
+
+	def test_rescans_when_the_lpe_inputs_changed(self):
+		self.manager.add_aovs_bulk(["warm"], ["direct"])
+		self.manager.save_index()
+		events = lpe.SCATTER_EVENTS["direct"]
+		lpe.register_scatter_event("direct", "<RD>", replace=True)
+		try:
+			manager = LPEManager()
+			self.assertEqual(manager.get_aov("warm_direct").lpe, "C<RD><L.'warm'>")
+			self.assertFalse(manager.plan({"warm": ["direct"]}).is_empty())
+		finally:
+			lpe.register_scatter_event("direct", events, replace=True)
+
+	def test_rescans_when_light_groups_changed(self):
+		self.manager.add_aovs_bulk(["warm"], AOV_PASSES["coarse"])
+		self.manager.save_index()
+		self.backend.create_light("pointLight", "rim")
+		self.backend.create_aov_node("rim_direct")
+
+		manager = LPEManager()
+		self.assertTrue(manager.get_aov("rim_direct") is not None)
+
+	def apply_test_layers(self):
+		add_render_layer("char")
+		add_render_layer("env")
+		self.manager.set_layer_spec("char", {"warm": "coarse"})
+		self.manager.set_layer_spec("env", {"warm": ["direct"], "cold": ["diffuse"]})
+		return self.manager.apply_layers()
+
+	def test_builds_the_aovs_of_every_layer_once(self):
+		layer_plan = self.apply_test_layers()
+		self.assertEqual(len(layer_plan.plan.creates), 5)
+		self.assertEqual(aov_node_count(), 5)
+		self.assertEqual(sorted(self.backend.get_disabled_aovs("char")), ["aiAOV_cold_diffuse"])
+		self.assertEqual(sorted(self.backend.get_disabled_aovs("env")), [
+			"aiAOV_warm_background", "aiAOV_warm_emission", "aiAOV_warm_indirect"])
+
+	def test_applying_layers_again_changes_nothing(self):
+		self.apply_test_layers()
+		self.assertTrue(self.manager.plan_layers().is_empty())
+
+	def test_changing_a_layer_spec_only_edits_its_collection(self):
+		self.apply_test_layers()
+		self.manager.set_layer_spec("env", {"warm": ["direct", "indirect"], "cold": ["diffuse"]})
+		layer_plan = self.manager.plan_layers()
+		self.assertTrue(layer_plan.plan.is_empty())
+		self.assertEqual(list(layer_plan.overrides.items()), [("env", ([], ["aiAOV_warm_indirect"]))])
+
+	def test_switching_layers_rebuilds_nothing(self):
+		self.apply_test_layers()
+		self.manager.switch_layer("env")
+		self.assertEqual(self.backend.current_render_layer(), "env")
+		self.assertEqual(aov_node_count(), 5)
+		self.assertTrue(self.manager.plan_layers().is_empty())
+
+	def test_removing_a_layer_spec_turns_its_aovs_back_on(self):
+		self.apply_test_layers()
+		self.manager.remove_layer_spec("env")
+		self.manager.apply_layers()
+		self.assertEqual(self.backend.get_disabled_aovs("env"), [])
+		# Light groups no spec mentions are left alone, like with reconcile()
+		self.assertTrue(self.manager.aov_exists("cold", "diffuse"))
+		self.assertEqual(self.backend.get_disabled_aovs("char"), [])
+
+	def test_stores_layer_specs_in_the_scene(self):
+		self.apply_test_layers()
+		self.assertEqual(list(LPEManager().layer_specs), ["char", "env"])
+
+	def test_skips_specs_of_deleted_layers(self):
+		add_render_layer("char")
+		add_render_layer("env")
+		self.manager.set_layer_spec("char", {"warm": "coarse"})
+		self.manager.set_layer_spec("env", {"warm": ["direct"], "cold": ["diffuse"]})
+		delete_render_layer("env")
+
+		layer_plan = self.manager.apply_layers()
+		self.assertEqual(layer_plan.stale_layers, ["env"])
+		self.assertTrue("skip the spec of missing layer env" in layer_plan.describe())
+		self.assertFalse(self.manager.aov_exists("cold", "diffuse"))
+		self.assertEqual(aov_node_count(), len(AOV_PASSES["coarse"]))
+		# The spec is kept for when the layer comes back
+		self.assertEqual(list(self.manager.layer_specs), ["char", "env"])
+
+	def test_picks_up_a_layer_again_when_it_comes_back(self):
+		self.apply_test_layers()
+		delete_render_layer("env")
+		self.manager.apply_layers()
+		add_render_layer("env")
+		layer_plan = self.manager.plan_layers()
+		self.assertEqual(layer_plan.stale_layers, [])
+		self.assertEqual(list(layer_plan.overrides), ["char", "env"])
+
+	def test_rejects_specs_for_unknown_layers(self):
+		self.assertRaises(ValueError, self.manager.set_layer_spec, "missing", {"warm": "coarse"})
+
+	def test_prunes_aovs_that_stayed_black(self):
+		self.manager.add_aovs_bulk(["warm", "cold"], ["direct", "sss"])
+		contributions = {
+			"warm_direct": {"peak": 2.5, "energy": 10.0, "share": 0.5},
+			"warm_sss": {"peak": 0.0, "energy": 0.0, "share": 0.0},
+			"cold_direct": {"peak": 0.00001, "energy": 0.001, "share": 0.0},
+		}
+		plan = self.manager.prune(contributions, peak=0.0001)
+		self.assertEqual(sorted(aov.nice_name() for aov in plan.deletes), ["cold_direct", "warm_sss"])
+		self.assertEqual(sorted(aov.nice_name() for aov in self.manager.get_aov_list()), ["cold_sss", "warm_direct"])
+		self.assertEqual(aov_node_count(), 2)
+
+	def test_doesnt_build_pruned_aovs_again(self):
+		self.manager.add_aovs_bulk(["warm"], ["direct", "sss"])
+		self.manager.prune({"warm_sss": {"peak": 0.0, "energy": 0.0, "share": None}})
+		self.assertEqual(self.manager.pruned_aovs, ["warm_sss"])
+		self.assertTrue(self.manager.plan({"warm": ["direct", "sss"]}).is_empty())
+
+		# The pruned AOVs are stored in the scene
+		manager = LPEManager()
+		self.assertEqual(manager.pruned_aovs, ["warm_sss"])
+		manager.reconcile({"warm": ["direct", "sss"]})
+		self.assertFalse(manager.aov_exists("warm", "sss"))
+
+	def test_doesnt_build_pruned_aovs_for_layers(self):
+		self.manager.add_aovs_bulk(["cold"], ["diffuse"])
+		self.manager.prune({"cold_diffuse": {"peak": 0.0, "energy": 0.0, "share": None}})
+		self.apply_test_layers()
+		self.assertFalse(self.manager.aov_exists("cold", "diffuse"))
+		self.assertEqual(self.backend.get_disabled_aovs("char"), [])
+
+	def test_restores_pruned_aovs(self):
+		self.manager.add_aovs_bulk(["warm"], ["sss"])
+		self.manager.prune({"warm_sss": {"peak": 0.0, "energy": 0.0, "share": None}})
+		self.manager.restore_pruned(["warm_sss"])
+		self.assertEqual(self.manager.pruned_aovs, [])
+		self.assertEqual(self.manager.plan({"warm": ["sss"]}).creates, [("warm", "sss")])
+
+	def test_pruning_dry_run_leaves_the_scene_alone(self):
+		self.manager.add_aovs_bulk(["warm"], ["sss"])
+		plan = self.manager.prune({"warm_sss": {"peak": 0.0, "energy": 0.0, "share": None}}, dry_run=True)
+		self.assertEqual(len(plan.deletes), 1)
+		self.assertEqual(aov_node_count(), 1)
+		self.assertEqual(self.manager.pruned_aovs, [])
+
+	def test_shares_render_stats_out_to_aovs(self):
+		self.manager.add_aovs_bulk(["warm", "cold"], ["direct", "indirect"])
+		totals = {"aov_memory": 160.0, "output_bytes": 80.0, "aov_time": 2.0, "aov_times": {"warm_direct": 0.25}}
+		costs = self.manager.render_costs(totals, "warm")
+		self.assertEqual(list(costs), [("warm", "direct"), ("warm", "indirect")])
+		self.assertEqual(costs[("warm", "direct")], {"memory": 30.0, "disk": 15.0, "time": 0.25})
+		self.assertEqual(costs[("warm", "indirect")]["time"], None)
+
+	def test_shares_render_stats_by_each_aovs_data_type(self):
+		self.manager.add_aovs_bulk(["warm"], ["direct", "indirect"])
+		aov_node = self.manager.get_aov("warm_indirect")._aov_node
+		self.backend.set_aov_outputs([(aov_node, "defaultArnoldDriver")], 4)
+		costs = self.manager.render_costs({"aov_memory": 80.0, "output_bytes": None, "aov_time": None})
+		# 3 rgb channels and 1 float channel next to the RGBA beauty
+		self.assertEqual(costs[("warm", "direct")]["memory"], 30.0)
+		self.assertEqual(costs[("warm", "indirect")]["memory"], 10.0)
+
+	@unittest.skipUnless(NUMPY_AVAILABLE, "clustering lights needs numpy")
+	def test_clusters_lights_into_new_groups(self):
+		self.manager.add_aovs_bulk(["warm"], ["direct"])
+		plan = self.manager.cluster_lights(max_groups=1)
+		self.assertEqual(list(plan.groups), ["cluster01"])
+		self.assertEqual(plan.assignments["warmLightShape"], ("warm", "cluster01"))
+		self.assertEqual(list(self.manager.getSceneLightGroupMap()), ["cluster01"])
+		self.assertEqual(sorted(aov.nice_name() for aov in self.manager.get_aov_list()),
+						sorted("cluster01_" + render_pass for render_pass in AOV_PASSES["coarse"]))
+		self.assertEqual(aov_node_count(), len(AOV_PASSES["coarse"]))
+
+	@unittest.skipUnless(NUMPY_AVAILABLE, "clustering lights needs numpy")
+	def test_previews_light_clusters(self):
+		plan = self.manager.cluster_lights(max_groups=1, level="fine", dry_run=True)
+		self.assertEqual(plan.summary()["lights"], 2)
+		self.assertEqual(plan.summary()["create"], len(AOV_PASSES["fine"]))
+		self.assertEqual(self.manager.getSceneLightGroups(), set(["warm", "cold"]))
+		self.assertEqual(aov_node_count(), 0)
+
+	@unittest.skipUnless(NUMPY_AVAILABLE, "clustering lights needs numpy")
+	def test_takes_the_cluster_count_from_the_budget(self):
+		memory, _ = aov_cost(self.backend.render_settings())
+		beauty, _ = aov_cost(self.backend.render_settings(), 4)
+		# Room for a single coarse group
+		cap = beauty + (len(AOV_PASSES["coarse"]) + 1) * memory
+		plan = self.manager.cluster_lights(memory_cap=cap, dry_run=True)
+		self.assertEqual(len(plan.groups), 1)
@@ -9,14 +9,18 @@ A full beauty pass can be represented by a few different combinations of AOVs
 Each light group should have the option of which combination to use.
 """
 from functools import partial
+import os
 import pymel.core as pm
+from jobs import CANCELLED
+from list_model import ListModel
+from lpe import AOV_PASSES
+from lpe_batch import load_preset
 from lpe_manager import LPEManager
-
-AOV_PASSES = {
-	"coarse": ["direct", "indirect", "emission", "background"],
-	"medium": ["diffuse", "specular", "coat", "transmission", "sss", "volume", "emission", "background"],
-	"fine": ["diffuse_direct", "diffuse_indirect", "specular_direct", "specular_indirect", "coat", "transmission", "sss", "volume", "emission", "background"]
-}
+from profiler import get_profiler
+from profiler import profiled_action
+from render_budget import format_bytes
+import render_stats
+from scene_sync import SceneSync
 
 
 class LPEManagerUI(object):
@@ -29,7 +33,12 @@ class LPEManagerUI(object):
 		self._WINNAME = "lpe_win"
 		self._TITLE = "LPE Manager v{}".format(self._VERSION)
 		self.widgets = {}
+		self.models = {}
+		self._job = None
+		self._render_totals = None
+		self._sync = SceneSync(self._manager, self.scene_changed)
 		self.build_UI()
+		self._sync.start()
 
 	def build_UI(self):
 		if(pm.window(self._WINNAME, exists=True)):
@@ -40,6 +49,7 @@ class LPEManagerUI(object):
 		tripleColumnWidth = windowWidth / 3 - columnSpacing
 
 		self.widgets["mainWindow"] = pm.window(self._WINNAME, t=self._TITLE, rtf=True)
+		pm.scriptJob(uiDeleted=[self._WINNAME, self._sync.stop], runOnce=True)
 		with self.widgets["mainWindow"]:
 			self.widgets["mainLayout"] = pm.columnLayout(w=windowWidth)
 			self.widgets["mainLayout"].adjustableColumn()
@@ -48,13 +58,13 @@ class LPEManagerUI(object):
 				self.widgets["lightGroupList"] = pm.textScrollList(w=windowWidth, h=100)
 				self.widgets["lightGroupList"].setAllowMultiSelection(False)
 				self.widgets["lightGroupList"].selectCommand(self.clicked_light_group)
+				self.models["lightGroupList"] = self.list_model("lightGroupList")
 
 				pm.text("Light Group AOVs")
 				self.widgets["aovList"] = pm.textScrollList(w=windowWidth, h=100)
 				self.widgets["aovList"].setAllowMultiSelection(False)
 				self.widgets["aovList"].selectCommand(self.clicked_aov)
-
-				self.update_light_groups()
+				self.models["aovList"] = self.list_model("aovList")
 
 				with pm.rowColumnLayout(numberOfColumns=2, columnWidth=[(1, 120), (2, 160)]):
 					pm.text("Light Path Expression: ")
@@ -62,6 +72,7 @@ class LPEManagerUI(object):
 					self.widgets["lpeField"].setEnable(False)
 
 				pm.text("Build AOVs")
+				self.widgets["allGroupsCheckBox"] = pm.checkBox(label="All light groups", value=False)
 				with pm.rowColumnLayout(numberOfColumns=3,
 										columnSpacing=[(2, columnSpacing), (3, columnSpacing)],
 										columnWidth=[(1, tripleColumnWidth), (2, tripleColumnWidth), (3, tripleColumnWidth)]):
@@ -73,72 +84,273 @@ class LPEManagerUI(object):
 								w=windowWidth - columnSpacing)
 					pm.button("Remove Selected AOV", c=self.remove_aov,
 								w=windowWidth - columnSpacing)
+					pm.button("Apply Preset...", c=self.apply_preset,
+								w=windowWidth - columnSpacing)
+				with pm.rowColumnLayout(numberOfColumns=2, columnWidth=[(1, windowWidth - 70), (2, 60)]):
+					self.widgets["jobProgress"] = pm.progressBar(maxValue=1)
+					self.widgets["cancelButton"] = pm.button("Cancel", c=self.cancel_job, enable=False)
 
-	def add_list_entry(self, label, parent):
-		self.widgets[parent].append(label)
+				pm.text("Render Cost")
+				self.widgets["estimateText"] = pm.text(label="", align="left")
+				self.widgets["buildCostText"] = pm.text(label="", align="left")
+				self.widgets["renderStatsText"] = pm.text(label="", align="left")
+				pm.button("Load Render Stats...", c=self.load_render_stats, w=windowWidth - columnSpacing)
+
+				with pm.frameLayout(label="Profile", collapsable=True, collapse=True):
+					with pm.columnLayout(adjustableColumn=True):
+						self.widgets["profileCheckBox"] = pm.checkBox(
+							label="Record scene calls", value=get_profiler().enabled,
+							changeCommand=self.toggle_profiling)
+						self.widgets["profileField"] = pm.scrollField(editable=False, wordWrap=False,
+																	font="fixedWidthFont", h=120)
+					with pm.rowColumnLayout(numberOfColumns=4):
+						pm.button("Refresh", c=self.update_profile)
+						pm.button("Reset", c=self.reset_profile)
+						pm.button("Export JSON", c=partial(self.export_profile, False))
+						pm.button("Export Trace", c=partial(self.export_profile, True))
+
+				self.update_light_groups()
 
+	@profiled_action("Build AOVs")
 	def build_aovs(self, level, *args):
-		selection = self.widgets["lightGroupList"].getSelectItem()
-		if not selection:
+		groups = self.target_groups()
+		if not groups:
 			pm.warning("Please make a selection before building AOVs")
 			return
 
-		group = selection[0]
-		self._manager.add_aovs(group, AOV_PASSES[level])
-		self.update_aovs(group)
+		self.run_job(self._manager.add_aovs_job(groups, AOV_PASSES[level]))
+
+	@profiled_action("Apply preset")
+	def apply_preset(self, *args):
+		"""Reconcile the AOVs with a JSON preset, like lpe_batch does, a chunk at a time"""
+		paths = pm.fileDialog2(fileMode=1, caption="Apply Preset", fileFilter="AOV presets (*.json)")
+		if not paths:
+			return
+		try:
+			job = self._manager.reconcile_job(load_preset(paths[0]))
+		except (IOError, ValueError) as error:
+			pm.warning("Can't apply the preset: {}".format(error))
+			return
+		self.run_job(job)
+
+	def cancel_job(self, *args):
+		if self._job is not None:
+			self._job.cancel()
 
 	def clear_lpe(self):
 		self.widgets["lpeField"].setText("")
 
 	def clear_text_list(self, list_name):
-		self.widgets[list_name].removeAll()
+		self.models[list_name].clear()
 
+	@profiled_action("Select AOV")
 	def clicked_aov(self):
-		aov_name = self.widgets["aovList"].getSelectItem()[0]
-		aov = self._manager.get_aov(aov_name)
+		aov = self._manager.get_aov(self.selected_aov())
 		self.widgets["lpeField"].setText(aov.lpe)
-		pm.select(aov._aov_node)
+		self._manager.select_aovs([aov])
 
+	@profiled_action("Select light group")
 	def clicked_light_group(self):
 		item = self.widgets["lightGroupList"].getSelectItem()[0]
 		self.update_aovs(item)
 
+	@profiled_action("Remove AOV")
 	def remove_aov(self, *args):
 		selected_group = self.widgets["lightGroupList"].getSelectItem()[0]
-		selected_aov = self.widgets["aovList"].getSelectItem()[0]
-
-		self._manager.delete_aov(selected_aov)
+		self._manager.delete_aov(self.selected_aov())
 		self.update_aovs(selected_group)
 
+	@profiled_action("Remove AOVs")
 	def remove_aovs(self, *args):
+		if self.widgets["allGroupsCheckBox"].getValue():
+			self.run_job(self._manager.delete_aovs_job())
+			return
+
 		selection = self.widgets["lightGroupList"].getSelectItem()
 		if not selection:
 			pm.warning("Please make a selection before deleting AOVs")
 			return
+		self.run_job(self._manager.delete_aovs_job(selection[0]))
 
-		group = selection[0]
-		self._manager.delete_aovs(group)
-		self.update_aovs(group)
+	def run_job(self, job):
+		"""
+		Run a ChunkedJob. Jobs that fit in one chunk run right away, larger
+		ones run a chunk at a time whenever Maya is idle, with progress shown.
+		"""
+		if self._job is not None:
+			pm.warning("Please wait for '{}' to finish or cancel it".format(self._job.name))
+			return
 
-	def update_aovs(self, group):
-		self.clear_text_list("aovList")
-		self.clear_lpe()
+		if job.total <= job.chunk_size:
+			job.run()
+			self.job_finished(job)
+			return
+
+		self._job = job
+		self.widgets["jobProgress"].setMaxValue(job.total)
+		self.widgets["jobProgress"].setProgress(0)
+		self.widgets["cancelButton"].setEnable(True)
+		pm.evalDeferred(self.step_job, lowestPriority=True)
+
+	@profiled_action("Background job")
+	def step_job(self):
+		job = self._job
+		if job is None:
+			return
+		if not pm.window(self._WINNAME, exists=True):
+			job.cancel()
+		try:
+			job.step()
+		except Exception as error:
+			pm.warning("'{}' failed: {}".format(job.name, error))
+
+		if not job.is_finished():
+			self.widgets["jobProgress"].setProgress(job.done)
+			pm.evalDeferred(self.step_job, lowestPriority=True)
+			return
+
+		self._job = None
+		if pm.window(self._WINNAME, exists=True):
+			self.widgets["jobProgress"].setProgress(0)
+			self.widgets["cancelButton"].setEnable(False)
+			self.job_finished(job)
 
-		group = self.widgets["lightGroupList"].getSelectItem()[0]
+	def job_finished(self, job):
+		if job.state == CANCELLED:
+			pm.warning("'{}' cancelled after {} of {} AOVs".format(job.name, job.done, job.total))
+		selected_group = self.selected_item("lightGroupList")
+		if selected_group is not None:
+			self.update_aovs(selected_group)
+		else:
+			self.update_estimate()
+
+	def target_groups(self):
+		"""Every light group with All light groups checked, or the selected one"""
+		if self.widgets["allGroupsCheckBox"].getValue():
+			return list(self.models["lightGroupList"].rows)
+		selected_group = self.selected_item("lightGroupList")
+		return [selected_group] if selected_group is not None else []
+
+	@profiled_action("Scene edit")
+	def scene_changed(self, changes):
+		if not pm.window(self._WINNAME, exists=True):
+			return
+
+		selected_group = self.selected_item("lightGroupList")
+		removed_groups = set(changes["removed_groups"])
+		groups = [group for group in self.models["lightGroupList"].rows if group not in removed_groups]
+		self.models["lightGroupList"].set_rows(sorted(groups + changes["added_groups"]), selected_group)
+
+		if selected_group is None:
+			return
+		if selected_group in removed_groups:
+			self.clear_text_list("aovList")
+			self.clear_lpe()
+			self.update_estimate()
+			return
+
+		changed_aovs = changes["added_aovs"] + changes["removed_aovs"]
+		if any(aov.light_group == selected_group for aov in changed_aovs):
+			self.update_aovs(selected_group)
+
+	def export_profile(self, trace, *args):
+		file_filter = "Chrome Trace (*.json)" if trace else "JSON (*.json)"
+		paths = pm.fileDialog2(fileFilter=file_filter, fileMode=0, caption="Export Profile")
+		if paths:
+			get_profiler().export(paths[0], trace)
+
+	def reset_profile(self, *args):
+		get_profiler().reset()
+		self.update_profile()
+
+	def toggle_profiling(self, enabled):
+		profiler = get_profiler()
+		if enabled:
+			profiler.enable(self._manager._backend)
+		else:
+			profiler.disable()
+		self.update_profile()
+
+	def update_profile(self, *args):
+		self.widgets["profileField"].setText(get_profiler().report())
+
+	def list_model(self, list_name):
+		return ListModel(partial(pm.textScrollList, self.widgets[list_name], edit=True))
+
+	def selected_item(self, list_name):
+		selection = self.widgets[list_name].getSelectItem()
+		return selection[0] if selection else None
+
+	def selected_aov(self):
+		"""Name of the selected AOV, without the render cost shown next to it"""
+		row = self.selected_item("aovList")
+		return row.split()[0] if row else None
+
+	def update_aovs(self, group):
 		aov_list = self._manager.get_aov_list(group)
+		selected_aov = self.selected_aov()
+		rows = [aov.nice_name() for aov in aov_list]
+		selected_row = selected_aov if selected_aov in rows else None
+
+		if self._render_totals is not None:
+			costs = self._manager.render_costs(self._render_totals, group)
+			for index, aov in enumerate(aov_list):
+				cost = costs.get((aov.light_group, aov.render_pass))
+				cost = render_stats.format_cost(cost) if cost else None
+				if cost:
+					rows[index] = "{}   {}".format(rows[index], cost)
+				if aov.nice_name() == selected_aov:
+					selected_row = rows[index]
 
-		self.widgets["aovList"].setEnable(True)
-		if not aov_list:
-			self.widgets["aovList"].append("No AOVs for this group")
-			self.widgets["aovList"].setEnable(False)
+		self.widgets["aovList"].setEnable(bool(rows))
+		if not rows:
+			rows = ["No AOVs for this group"]
+		self.models["aovList"].set_rows(rows, selected_row)
+		if selected_row is None:
+			self.clear_lpe()
+		self.update_estimate(group)
+
+	def update_estimate(self, group=None):
+		"""Show the render cost of the scene's AOVs, and what each build adds to it"""
+		self.widgets["estimateText"].setLabel("Scene: " + self._manager.estimate().summary())
+
+		build_costs = []
+		if group is not None:
+			existing = set(aov.render_pass for aov in self._manager.get_aov_list(group))
+			for level in ["coarse", "medium", "fine"]:
+				added = [render_pass for render_pass in AOV_PASSES[level] if render_pass not in existing]
+				memory = self._manager.estimate({group: added}).groups[group][1]
+				build_costs.append("{} +{}".format(level.capitalize(), format_bytes(memory)))
+		self.widgets["buildCostText"].setLabel(", ".join(build_costs))
+
+	@profiled_action("Load render stats")
+	def load_render_stats(self, *args):
+		"""Read Arnold stats files, profiles and logs, and show what each AOV costs"""
+		paths = pm.fileDialog2(fileMode=4, caption="Load Render Stats",
+							fileFilter="Arnold stats, profiles and logs (*.json *.log);;All files (*.*)")
+		if not paths:
+			return
+
+		# Kept next to the stats, so loading them again only reads new frames
+		cache = render_stats.StatsCache(os.path.join(os.path.dirname(paths[0]), render_stats.CACHE_NAME))
+		frames = render_stats.load_frames(render_stats.group_by_frame(paths), cache)
+		if not frames:
+			pm.warning("No render stats found in the selected files")
+			return
 
-		for aov in aov_list:
-			self.add_list_entry(aov.nice_name(), "aovList")
+		self._render_totals = render_stats.aggregate(frames)
+		self.widgets["renderStatsText"].setLabel(render_stats.summary(self._render_totals))
+		selected_group = self.selected_item("lightGroupList")
+		if selected_group is not None:
+			self.update_aovs(selected_group)
 
 	def update_light_groups(self):
-		self.clear_text_list("lightGroupList")
-		self.clear_text_list("aovList")
+		selected_group = self.selected_item("lightGroupList")
+		# Merged groups are listed with the light groups, their AOVs are managed the same way
+		light_groups = sorted(self._manager.getSceneLightGroups().union(self._manager.merged_groups))
+		self.models["lightGroupList"].set_rows(light_groups, selected_group)
 
-		light_groups = self._manager.getSceneLightGroups()
-		for group in light_groups:
-			self.add_list_entry(group, "lightGroupList")
+		if selected_group not in light_groups:
+			self.clear_text_list("aovList")
+			self.clear_lpe()
+			self.update_estimate()
@@ -1,8 +1,10 @@
 import unittest
 import os
-import pymel.core as pm
-from lpe_manager_ui import LPEManagerUI
 from lpe_manager import LPEManager
+from scene_backend import MAYA_AVAILABLE
+if MAYA_AVAILABLE:
+	import pymel.core as pm
+	from lpe_manager_ui import LPEManagerUI
 
 # Test scene has 2 lights:
 # warmLightShape
@@ -14,6 +16,7 @@ def openMayaFile(sceneName):
 	pm.system.openFile(sceneName, force=True)
 
 
+@unittest.skipUnless(MAYA_AVAILABLE, "LPEManagerUI needs Maya")
 class LPEManagerUITest(unittest.TestCase):
 	"""LPEManagerUI Test class"""
 	pass
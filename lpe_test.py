@@ -0,0 +1,91 @@
+import unittest
+import warnings
+import lpe
+from lpe import LPEError
+
+
+class LPETest(unittest.TestCase):
+	"""Test class for the lpe module"""
+
+	def tearDown(self):
+		lpe.unregister_scatter_event("test_pass")
+		lpe.unregister_merged_group("warm_cold")
+
+	def test_tokenizes_labels_as_one_token(self):
+		tokens = lpe.tokenize("C<RS'coat'>")
+		self.assertEqual([token[0] for token in tokens], ["symbol", "<", "symbol", "symbol", "label", ">"])
+
+	def test_validates_every_scatter_event(self):
+		for render_pass in lpe.SCATTER_EVENTS:
+			self.assertTrue(lpe.is_valid(lpe.format_lpe("group_name", render_pass)))
+
+	def test_accepts_negated_label_sets(self):
+		self.assertTrue(lpe.is_valid("C<RS[^'coat''sheen']><L.'group_name'>"))
+
+	def test_accepts_label_alternation(self):
+		self.assertTrue(lpe.is_valid("C.*<L.('warm'|'cold')>"))
+
+	def test_rejects_unbalanced_expressions(self):
+		self.assertFalse(lpe.is_valid("C(.*<L.'group_name'>"))
+		self.assertFalse(lpe.is_valid("C<RD.*"))
+		self.assertFalse(lpe.is_valid("C[DSV.*"))
+
+	def test_rejects_unknown_symbols(self):
+		self.assertFalse(lpe.is_valid("C<RX>.*"))
+		self.assertFalse(lpe.is_valid("C<QD>.*"))
+
+	def test_rejects_expressions_not_starting_at_camera(self):
+		self.assertFalse(lpe.is_valid("<RD>.*<L.'group_name'>"))
+
+	def test_rejects_misplaced_quantifiers(self):
+		self.assertFalse(lpe.is_valid("C.**"))
+		self.assertFalse(lpe.is_valid("C|*"))
+
+	def test_rejects_group_names_that_break_the_label(self):
+		self.assertRaises(LPEError, lpe.format_lpe, "it's", "diffuse")
+
+	def test_rejects_unknown_pass(self):
+		self.assertRaises(LPEError, lpe.format_lpe, "group_name", "fake pass")
+
+	def test_warns_when_falling_back_to_beauty(self):
+		with warnings.catch_warnings(record=True) as caught:
+			warnings.simplefilter("always")
+			self.assertEqual(lpe.format_lpe("group_name", "test_pass", strict=False), "C.*<L.'group_name'>")
+		self.assertEqual(len(caught), 1)
+		self.assertRaises(LPEError, lpe.format_lpe, "group_name", "test_pass")
+
+	def test_caches_formatted_expressions(self):
+		first = lpe.format_lpe("group_name", "diffuse")
+		self.assertTrue(lpe.format_lpe("group_name", "diffuse") is first)
+
+	def test_registers_scatter_event(self):
+		lpe.register_scatter_event("test_pass", "<RD>[SV].*")
+		self.assertEqual(lpe.format_lpe("group_name", "test_pass"), "C<RD>[SV].*<L.'group_name'>")
+
+	def test_registering_invalidates_cached_fallback(self):
+		with warnings.catch_warnings():
+			warnings.simplefilter("ignore")
+			self.assertEqual(lpe.format_lpe("group_name", "test_pass", strict=False), "C.*<L.'group_name'>")
+		lpe.register_scatter_event("test_pass", "<RD>")
+		self.assertEqual(lpe.format_lpe("group_name", "test_pass"), "C<RD><L.'group_name'>")
+
+	def test_rejects_invalid_scatter_event(self):
+		self.assertRaises(LPEError, lpe.register_scatter_event, "test_pass", "<RD.*")
+
+	def test_does_not_replace_scatter_event_by_default(self):
+		self.assertRaises(LPEError, lpe.register_scatter_event, "diffuse", "<RD>")
+
+	def test_formats_merged_groups_with_alternation(self):
+		lpe.register_merged_group("warm_cold", ["warm", "cold"])
+		expression = lpe.format_lpe("warm_cold", "diffuse")
+		self.assertEqual(expression, "C<RD>.*<L.('cold'|'warm')>")
+		self.assertTrue(lpe.is_valid(expression))
+
+	def test_rejects_merging_a_single_group(self):
+		self.assertRaises(LPEError, lpe.register_merged_group, "warm_cold", ["warm", "warm"])
+
+	def test_unregistering_a_merged_group_restores_its_label(self):
+		lpe.register_merged_group("warm_cold", ["warm", "cold"])
+		lpe.format_lpe("warm_cold", "beauty")
+		lpe.unregister_merged_group("warm_cold")
+		self.assertEqual(lpe.format_lpe("warm_cold", "beauty"), "C.*<L.'warm_cold'>")
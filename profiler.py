@@ -0,0 +1,166 @@
+"""
+Optional instrumentation of every scene call the tool makes.
+
+All of the manager's, AOVs' and UI's scene access goes through a scene
+backend, so the profiler wraps every public method of the backend:
+listing (pm.ls), reading attributes (getAttr), creating aiAOVs (addAOV),
+setting attributes, deleting nodes, selecting, fileInfo and render layers.
+The methods are found on the backend's class when profiling starts, so a
+new backend method is profiled without being listed anywhere. Every call
+is counted and timed, and attributed to the user action it happened in,
+like "Build fine" or "Select light group".
+
+The wrappers are only installed while profiling is enabled. Disabled,
+the backend's own methods are called directly, and an action costs a
+single flag check.
+
+The results can be read as stats, written out as JSON, or written as a
+Chrome trace to open in chrome://tracing or Perfetto.
+"""
+from contextlib import contextmanager
+from functools import wraps
+import json
+import timeit
+
+# Public backend methods that aren't scene calls themselves
+UNPROFILED_METHODS = frozenset(["edit"])
+
+# Calls outside of any action
+NO_ACTION = "(none)"
+
+# Trace events kept at most, the stats keep counting past it
+MAX_EVENTS = 100000
+
+_profiler = None
+
+
+def get_profiler():
+	global _profiler
+	if _profiler is None:
+		_profiler = Profiler()
+	return _profiler
+
+
+def scene_operations(backend):
+	"""Names of every backend method the profiler wraps"""
+	backend_type = type(backend)
+	return [name for name in sorted(dir(backend_type))
+			if not name.startswith("_") and name not in UNPROFILED_METHODS
+			and callable(getattr(backend_type, name))]
+
+
+def profiled_action(name):
+	"""Decorator that runs a method as a named user action"""
+	def decorator(method):
+		@wraps(method)
+		def wrapper(*args, **kwargs):
+			profiler = get_profiler()
+			if not profiler.enabled:
+				return method(*args, **kwargs)
+			with profiler.action(name):
+				return method(*args, **kwargs)
+		return wrapper
+	return decorator
+
+
+class Profiler(object):
+	"""Counts and times the scene calls of one backend"""
+
+	def __init__(self):
+		super(Profiler, self).__init__()
+		self.enabled = False
+		self._backend = None
+		self._operations = []
+		self._actions = []
+		self.reset()
+
+	def reset(self):
+		# (action, operation) -> [count, total seconds, max seconds]
+		self._stats = {}
+		self._events = []
+		self._start = timeit.default_timer()
+
+	def enable(self, backend):
+		"""Start wrapping the scene operations of a backend"""
+		if self.enabled:
+			self.disable()
+		self._operations = scene_operations(backend)
+		for operation in self._operations:
+			setattr(backend, operation, self._wrap(operation, getattr(backend, operation)))
+		self._backend = backend
+		self.enabled = True
+
+	def disable(self):
+		"""Put the backend's own methods back"""
+		if self._backend is not None:
+			for operation in self._operations:
+				self._backend.__dict__.pop(operation, None)
+		self._backend = None
+		self._operations = []
+		self.enabled = False
+
+	@contextmanager
+	def action(self, name):
+		"""Attribute the scene calls made inside to a user action"""
+		if not self.enabled:
+			yield
+			return
+		self._actions.append(name)
+		start = timeit.default_timer()
+		try:
+			yield
+		finally:
+			self._actions.pop()
+			self._add_event(name, "action", start, timeit.default_timer() - start, name)
+
+	def _wrap(self, operation, method):
+		def profiled(*args, **kwargs):
+			start = timeit.default_timer()
+			try:
+				return method(*args, **kwargs)
+			finally:
+				elapsed = timeit.default_timer() - start
+				action = self._actions[-1] if self._actions else NO_ACTION
+				stats = self._stats.get((action, operation))
+				if stats is None:
+					self._stats[(action, operation)] = [1, elapsed, elapsed]
+				else:
+					stats[0] += 1
+					stats[1] += elapsed
+					if elapsed > stats[2]:
+						stats[2] = elapsed
+				self._add_event(operation, "scene", start, elapsed, action)
+		return profiled
+
+	def _add_event(self, name, category, start, elapsed, action):
+		if len(self._events) < MAX_EVENTS:
+			self._events.append((name, category, start - self._start, elapsed, action))
+
+	def stats(self):
+		"""One dict per action and operation, the most time consuming first"""
+		rows = [{"action": action, "operation": operation, "count": count, "total": total, "max": longest}
+				for (action, operation), (count, total, longest) in self._stats.items()]
+		rows.sort(key=lambda row: row["total"], reverse=True)
+		return rows
+
+	def report(self):
+		lines = ["{:<24} {:<18} {:>7} {:>10} {:>10}".format("action", "operation", "calls", "total ms", "max ms")]
+		for row in self.stats():
+			lines.append("{:<24} {:<18} {:>7} {:>10.2f} {:>10.2f}".format(
+				row["action"], row["operation"], row["count"], row["total"] * 1e3, row["max"] * 1e3))
+		return "\n".join(lines)
+
+	def to_json(self):
+		return json.dumps({"stats": self.stats()}, indent=2)
+
+	def to_chrome_trace(self):
+		"""The recorded calls in the Chrome trace event format"""
+		events = [{
+			"name": name, "cat": category, "ph": "X", "pid": 1, "tid": 1,
+			"ts": start * 1e6, "dur": elapsed * 1e6, "args": {"action": action}
+		} for name, category, start, elapsed, action in self._events]
+		return json.dumps({"traceEvents": events, "displayTimeUnit": "ms"})
+
+	def export(self, path, trace=False):
+		with open(path, "w") as export_file:
+			export_file.write(self.to_chrome_trace() if trace else self.to_json())
@@ -0,0 +1,88 @@
+import json
+import unittest
+from profiler import Profiler
+from profiler import profiled_action
+from profiler import get_profiler
+from profiler import scene_operations
+from scene_backend import MemoryBackend
+
+
+class ProfiledWidget(object):
+	"""Stands in for the UI, with one profiled action"""
+
+	def __init__(self, backend):
+		self.backend = backend
+
+	@profiled_action("Build AOVs")
+	def build(self):
+		node = self.backend.create_aov_node("warm_direct")
+		self.backend.set_lpe(node, "C.*")
+		return node
+
+
+class ProfilerTest(unittest.TestCase):
+	"""Test class for Profiler"""
+
+	def setUp(self):
+		self.backend = MemoryBackend()
+		self.profiler = Profiler()
+
+	def tearDown(self):
+		self.profiler.disable()
+		get_profiler().disable()
+
+	def test_leaves_the_backend_alone_when_disabled(self):
+		self.profiler.enable(self.backend)
+		self.profiler.disable()
+		self.assertFalse("list_aov_nodes" in self.backend.__dict__)
+		self.backend.list_aov_nodes()
+		self.assertEqual(self.profiler.stats(), [])
+
+	def test_counts_and_times_scene_calls(self):
+		self.profiler.enable(self.backend)
+		for _ in range(3):
+			self.backend.list_aov_nodes()
+		stats = self.profiler.stats()
+		self.assertEqual(len(stats), 1)
+		self.assertEqual(stats[0]["operation"], "list_aov_nodes")
+		self.assertEqual(stats[0]["count"], 3)
+		self.assertTrue(stats[0]["max"] <= stats[0]["total"])
+
+	def test_attributes_calls_to_actions(self):
+		profiler = get_profiler()
+		profiler.reset()
+		profiler.enable(self.backend)
+		ProfiledWidget(self.backend).build()
+		self.backend.list_aov_nodes()
+
+		actions = dict((row["operation"], row["action"]) for row in profiler.stats())
+		self.assertEqual(actions["create_aov_node"], "Build AOVs")
+		self.assertEqual(actions["set_lpe"], "Build AOVs")
+		self.assertEqual(actions["list_aov_nodes"], "(none)")
+
+	def test_exports_a_chrome_trace(self):
+		self.profiler.enable(self.backend)
+		with self.profiler.action("Select light group"):
+			self.backend.light_group_map()
+		events = json.loads(self.profiler.to_chrome_trace())["traceEvents"]
+		self.assertEqual([event["name"] for event in events], ["light_group_map", "Select light group"])
+		self.assertTrue(all(event["ph"] == "X" for event in events))
+		self.assertEqual(events[0]["args"]["action"], "Select light group")
+
+	def test_exports_json_stats(self):
+		self.profiler.enable(self.backend)
+		self.backend.list_lights()
+		stats = json.loads(self.profiler.to_json())["stats"]
+		self.assertEqual(stats[0]["operation"], "list_lights")
+
+	def test_profiles_every_public_backend_method(self):
+		operations = scene_operations(self.backend)
+		for operation in ["count_aov_nodes", "node_uuids", "read_file_info", "set_disabled_aovs",
+						"set_light_groups", "select_nodes", "undo"]:
+			self.assertTrue(operation in operations, operation)
+		self.assertFalse("edit" in operations)
+		self.assertFalse("_record" in operations)
+
+		self.profiler.enable(self.backend)
+		self.backend.write_file_info("key", "value")
+		self.assertEqual(self.profiler.stats()[0]["operation"], "write_file_info")
@@ -0,0 +1,61 @@
+"""
+Declarative AOV setups.
+
+A spec maps light groups to the AOVs they should have, either as a level
+from AOV_PASSES or as an explicit list of passes:
+	{"key": "fine", "rim": "coarse", "fill": ["diffuse", "specular"]}
+
+LPEManager.plan(spec) compares a spec with the AOVs that already exist and
+returns a ReconcilePlan holding only the creates, deletes and LPE updates
+needed to get there. Groups missing from the spec are left alone.
+"""
+from collections import OrderedDict
+from lpe import AOV_PASSES
+from lpe import SCATTER_EVENTS
+from lpe import LPEError
+
+
+def resolve_spec(spec):
+	"""Turn a spec into an OrderedDict of light group -> list of passes"""
+	resolved = OrderedDict()
+	for group_name in sorted(spec):
+		passes = spec[group_name]
+		if not isinstance(passes, (list, tuple)):
+			if passes not in AOV_PASSES:
+				raise ValueError("Unknown AOV level '{}' for light group '{}'".format(passes, group_name))
+			passes = AOV_PASSES[passes]
+
+		for render_pass in passes:
+			if render_pass not in SCATTER_EVENTS:
+				raise LPEError("Unknown scatter event '{}' for light group '{}'".format(render_pass, group_name))
+		resolved[group_name] = list(OrderedDict.fromkeys(passes))
+	return resolved
+
+
+class ReconcilePlan(object):
+	"""The scene edits that bring existing AOVs in line with a spec"""
+
+	def __init__(self):
+		super(ReconcilePlan, self).__init__()
+		self.creates = []
+		self.deletes = []
+		self.updates = []
+
+	def __len__(self):
+		return len(self.creates) + len(self.deletes) + len(self.updates)
+
+	def is_empty(self):
+		return len(self) == 0
+
+	def summary(self):
+		return {"create": len(self.creates), "delete": len(self.deletes), "update": len(self.updates)}
+
+	def describe(self):
+		lines = []
+		for group_name, render_pass in self.creates:
+			lines.append("create {}_{}".format(group_name, render_pass))
+		for aov in self.deletes:
+			lines.append("delete {}".format(aov.nice_name()))
+		for aov, expression in self.updates:
+			lines.append("update {}: {}".format(aov.nice_name(), expression))
+		return lines
@@ -0,0 +1,38 @@
+import unittest
+from lpe import AOV_PASSES
+from lpe import LPEError
+from reconciler import ReconcilePlan
+from reconciler import resolve_spec
+
+
+class ResolveSpecTest(unittest.TestCase):
+	"""Test class for resolve_spec"""
+
+	def test_expands_levels(self):
+		resolved = resolve_spec({"warm": "coarse"})
+		self.assertEqual(resolved["warm"], AOV_PASSES["coarse"])
+
+	def test_keeps_explicit_passes_in_order(self):
+		resolved = resolve_spec({"warm": ["specular", "diffuse", "specular"]})
+		self.assertEqual(resolved["warm"], ["specular", "diffuse"])
+
+	def test_rejects_unknown_level(self):
+		self.assertRaises(ValueError, resolve_spec, {"warm": "ultra"})
+
+	def test_rejects_unknown_pass(self):
+		self.assertRaises(LPEError, resolve_spec, {"warm": ["diffuse", "fake pass"]})
+
+
+class ReconcilePlanTest(unittest.TestCase):
+	"""Test class for ReconcilePlan"""
+
+	def test_starts_empty(self):
+		plan = ReconcilePlan()
+		self.assertTrue(plan.is_empty())
+		self.assertEqual(plan.summary(), {"create": 0, "delete": 0, "update": 0})
+
+	def test_describes_creates(self):
+		plan = ReconcilePlan()
+		plan.creates.append(("warm", "direct"))
+		self.assertEqual(plan.describe(), ["create warm_direct"])
+		self.assertEqual(len(plan), 1)
@@ -0,0 +1,158 @@
+"""
+Render memory and disk estimates for light group AOVs.
+
+Every AOV adds a full frame buffer to the renderer's memory and an image
+to every frame written to disk, so the cost of a setup grows with the
+resolution and with the number of light groups times passes.
+
+The estimates are approximate:
+- Arnold accumulates every AOV in 32-bit float, whatever is written out,
+  so memory is width x height x channels x 4 bytes per AOV. Light group
+  AOVs are RGB unless the driver layout gives them another data type.
+- Disk is the same image at the output bit depth, scaled by a typical
+  ratio for the EXR compression.
+- The beauty RGBA is always rendered and counted once.
+
+pick_levels() turns a memory or disk cap into a spec for
+LPEManager.reconcile(): light groups get the finest level that still
+fits, in priority order. max_groups() turns it into the number of light
+groups a level leaves room for.
+"""
+from collections import OrderedDict
+from lpe import AOV_PASSES
+
+# Light group AOVs are RGB, the beauty is RGBA
+AOV_CHANNELS = 3
+BEAUTY_CHANNELS = 4
+BUFFER_BYTES_PER_CHANNEL = 4
+
+# Rough size of a compressed EXR relative to the raw pixels
+COMPRESSION_RATIOS = {
+	"none": 1.0,
+	"rle": 0.9,
+	"zips": 0.6,
+	"zip": 0.55,
+	"piz": 0.5,
+	"pxr24": 0.45,
+	"b44": 0.5,
+	"b44a": 0.45,
+	"dwaa": 0.2,
+	"dwab": 0.2
+}
+
+# From the cheapest level to the most detailed one
+LEVELS = sorted(AOV_PASSES, key=lambda level: len(AOV_PASSES[level]))
+
+
+class RenderEstimate(object):
+	"""Per-frame memory and disk cost of a set of light group AOVs"""
+
+	def __init__(self, aov_count, memory, disk, groups):
+		super(RenderEstimate, self).__init__()
+		self.aov_count = aov_count
+		self.memory = memory
+		self.disk = disk
+		self.groups = groups
+
+	def summary(self):
+		return "{} AOVs, {} in memory, {} on disk per frame".format(
+			self.aov_count, format_bytes(self.memory), format_bytes(self.disk))
+
+
+def format_bytes(size):
+	for unit in ["B", "KB", "MB"]:
+		if size < 1024:
+			return "{:.1f} {}".format(size, unit)
+		size /= 1024.0
+	return "{:.2f} GB".format(size)
+
+
+def aov_cost(render_settings, channels=AOV_CHANNELS, output_bytes=None):
+	"""
+	(memory, disk) bytes of one AOV for render settings from a scene backend.
+	output_bytes per channel on disk defaults to the render settings' precision.
+	"""
+	pixels = render_settings["width"] * render_settings["height"]
+	if output_bytes is None:
+		output_bytes = 2 if render_settings.get("half_precision") else 4
+	ratio = COMPRESSION_RATIOS.get(render_settings.get("compression", "zip"), 1.0)
+	return pixels * channels * BUFFER_BYTES_PER_CHANNEL, int(pixels * channels * output_bytes * ratio)
+
+
+def estimate(spec, render_settings, channels=AOV_CHANNELS, output_bytes=None):
+	"""
+	Estimate a spec of light group -> level or list of passes, with AOVs of
+	channels written at output_bytes per channel as in aov_cost().
+	Returns a RenderEstimate whose groups map each group to its
+	(aov count, memory, disk).
+	"""
+	memory, disk = aov_cost(render_settings, channels, output_bytes)
+	beauty_memory, beauty_disk = aov_cost(render_settings, BEAUTY_CHANNELS)
+
+	groups = OrderedDict()
+	for group_name in sorted(spec):
+		passes = spec[group_name]
+		if not isinstance(passes, (list, tuple, set)):
+			passes = AOV_PASSES[passes]
+		count = len(set(passes))
+		groups[group_name] = (count, count * memory, count * disk)
+
+	aov_count = sum(count for count, _, _ in groups.values())
+	return RenderEstimate(aov_count, beauty_memory + aov_count * memory,
+						beauty_disk + aov_count * disk, groups)
+
+
+def _caps(render_settings, memory_cap, disk_cap, channels, output_bytes):
+	# (cap, cost of one AOV, cost of the beauty) for every cap that's set
+	memory, disk = aov_cost(render_settings, channels, output_bytes)
+	beauty_memory, beauty_disk = aov_cost(render_settings, BEAUTY_CHANNELS)
+	return [(cap, cost, beauty) for cap, cost, beauty in
+			[(memory_cap, memory, beauty_memory), (disk_cap, disk, beauty_disk)] if cap is not None]
+
+
+def max_groups(passes, render_settings, memory_cap=None, disk_cap=None, channels=AOV_CHANNELS,
+			output_bytes=None):
+	"""
+	The most light groups with a level or list of passes each that stay
+	under the caps. Raises ValueError when no cap or no pass is given.
+	"""
+	caps = _caps(render_settings, memory_cap, disk_cap, channels, output_bytes)
+	if not caps:
+		raise ValueError("A memory or disk cap is needed")
+	if not isinstance(passes, (list, tuple, set)):
+		passes = AOV_PASSES[passes]
+	per_group = len(set(passes))
+	if not per_group:
+		raise ValueError("Light groups need at least one pass")
+	return max(0, min(int((cap - beauty) // (cost * per_group)) for cap, cost, beauty in caps))
+
+
+def pick_levels(groups, render_settings, memory_cap=None, disk_cap=None, channels=AOV_CHANNELS,
+				output_bytes=None):
+	"""
+	Pick a level for every light group so the estimate stays under the caps.
+	groups are ordered from the highest priority down. Every group gets the
+	cheapest level first, then each one in turn is raised to the finest
+	level the remaining budget allows. Returns an OrderedDict spec, and
+	raises ValueError when even the cheapest levels don't fit.
+	"""
+	caps = _caps(render_settings, memory_cap, disk_cap, channels, output_bytes)
+
+	def fits(aov_count):
+		return all(beauty + aov_count * cost <= cap for cap, cost, beauty in caps)
+
+	spec = OrderedDict((group_name, LEVELS[0]) for group_name in groups)
+	aov_count = len(groups) * len(AOV_PASSES[LEVELS[0]])
+	if not fits(aov_count):
+		raise ValueError("{} light groups don't fit the budget even at the '{}' level".format(
+			len(groups), LEVELS[0]))
+
+	for group_name in groups:
+		cheapest = len(AOV_PASSES[LEVELS[0]])
+		for level in reversed(LEVELS[1:]):
+			extra = len(AOV_PASSES[level]) - cheapest
+			if fits(aov_count + extra):
+				spec[group_name] = level
+				aov_count += extra
+				break
+	return spec
@@ -0,0 +1,98 @@
+import unittest
+from lpe import AOV_PASSES
+from render_budget import aov_cost
+from render_budget import estimate
+from render_budget import format_bytes
+from render_budget import max_groups
+from render_budget import pick_levels
+
+HD = {"width": 1920, "height": 1080, "half_precision": False, "compression": "none"}
+
+
+class EstimateTest(unittest.TestCase):
+	"""Test class for render cost estimates"""
+
+	def test_costs_a_float_rgb_buffer_per_aov(self):
+		memory, disk = aov_cost(HD)
+		self.assertEqual(memory, 1920 * 1080 * 3 * 4)
+		self.assertEqual(disk, memory)
+
+	def test_half_precision_and_compression_shrink_disk_only(self):
+		settings = dict(HD, half_precision=True, compression="dwaa")
+		memory, disk = aov_cost(settings)
+		self.assertEqual(memory, 1920 * 1080 * 3 * 4)
+		self.assertEqual(disk, int(1920 * 1080 * 3 * 2 * 0.2))
+
+	def test_counts_levels_and_pass_lists(self):
+		result = estimate({"warm": "fine", "cold": ["direct", "indirect", "direct"]}, HD)
+		self.assertEqual(result.aov_count, len(AOV_PASSES["fine"]) + 2)
+		self.assertEqual(result.groups["cold"][0], 2)
+
+	def test_includes_the_beauty(self):
+		result = estimate({}, HD)
+		self.assertEqual(result.aov_count, 0)
+		self.assertEqual(result.memory, 1920 * 1080 * 4 * 4)
+
+	def test_costs_the_data_type_and_output_precision(self):
+		memory, disk = aov_cost(HD, 4, 2)
+		self.assertEqual(memory, 1920 * 1080 * 4 * 4)
+		self.assertEqual(disk, 1920 * 1080 * 4 * 2)
+		self.assertEqual(estimate({"key": ["direct"]}, HD, 1).memory, aov_cost(HD, 4)[0] + 1920 * 1080 * 4)
+
+	def test_formats_bytes(self):
+		self.assertEqual(format_bytes(512), "512.0 B")
+		self.assertEqual(format_bytes(3 * 1024 * 1024), "3.0 MB")
+		self.assertEqual(format_bytes(2 * 1024 ** 3), "2.00 GB")
+
+
+class PickLevelsTest(unittest.TestCase):
+	"""Test class for pick_levels"""
+
+	def cap_for(self, aov_count):
+		memory, _ = aov_cost(HD)
+		beauty, _ = aov_cost(HD, 4)
+		return beauty + aov_count * memory
+
+	def test_gives_every_group_fine_without_pressure(self):
+		spec = pick_levels(["key", "fill"], HD, memory_cap=self.cap_for(100))
+		self.assertEqual(list(spec.items()), [("key", "fine"), ("fill", "fine")])
+
+	def test_favours_groups_by_priority(self):
+		# Room for fine on key, and coarse on fill
+		cap = self.cap_for(len(AOV_PASSES["fine"]) + len(AOV_PASSES["coarse"]))
+		spec = pick_levels(["key", "fill"], HD, memory_cap=cap)
+		self.assertEqual(list(spec.items()), [("key", "fine"), ("fill", "coarse")])
+
+	def test_falls_back_to_medium(self):
+		cap = self.cap_for(len(AOV_PASSES["medium"]) + len(AOV_PASSES["coarse"]))
+		spec = pick_levels(["key", "fill"], HD, memory_cap=cap)
+		self.assertEqual(spec["key"], "medium")
+
+	def test_stays_under_the_disk_cap(self):
+		spec = pick_levels(["key", "fill", "rim"], HD, disk_cap=self.cap_for(20))
+		self.assertTrue(estimate(spec, HD).disk <= self.cap_for(20))
+
+	def test_rejects_budgets_too_small_for_coarse(self):
+		self.assertRaises(ValueError, pick_levels, ["key", "fill"], HD, memory_cap=self.cap_for(4))
+
+
+class MaxGroupsTest(unittest.TestCase):
+	"""Test class for max_groups"""
+
+	def cap_for(self, aov_count):
+		memory, _ = aov_cost(HD)
+		beauty, _ = aov_cost(HD, 4)
+		return beauty + aov_count * memory
+
+	def test_counts_the_groups_a_level_fits(self):
+		self.assertEqual(max_groups("coarse", HD, memory_cap=self.cap_for(4 * 5 + 3)), 5)
+		self.assertEqual(max_groups(["diffuse", "specular"], HD, memory_cap=self.cap_for(10)), 5)
+
+	def test_takes_the_tighter_cap(self):
+		self.assertEqual(max_groups("coarse", HD, memory_cap=self.cap_for(40), disk_cap=self.cap_for(8)), 2)
+
+	def test_needs_a_cap(self):
+		self.assertRaises(ValueError, max_groups, "coarse", HD)
+
+	def test_needs_a_pass(self):
+		self.assertRaises(ValueError, max_groups, [], HD, memory_cap=self.cap_for(10))
@@ -0,0 +1,91 @@
+"""
+Light group AOVs per render layer.
+
+Render layers often need different light group breakdowns, like every
+pass on the character layer and only coarse ones on the environment.
+LPEManager keeps a spec per render setup layer. The scene gets the AOVs of
+all layers together once, and each layer gets a collection whose absolute
+override turns off the AOVs it doesn't use. Switching layers, or rendering
+every layer in a batch, only applies those overrides. No AOV is rebuilt.
+
+The AOVs each layer turns off are worked out when its spec changes and
+kept, together with what the scene's collections already hold, so applying
+the specs only edits the collections whose contents changed.
+
+Layers without a spec, and the master layer, render every AOV. Specs of
+layers that were deleted or renamed stay stored, but add no AOVs until a
+layer with that name exists again.
+"""
+import base64
+import json
+from collections import OrderedDict
+from aov import AOV
+from reconciler import resolve_spec
+
+LAYERS_KEY = "lpeManagerLayers"
+
+
+def union_spec(layer_specs):
+	"""Every pass any layer has, per light group, in the order they came"""
+	union = OrderedDict()
+	for spec in layer_specs.values():
+		for group_name, passes in resolve_spec(spec).items():
+			target = union.setdefault(group_name, [])
+			target.extend(render_pass for render_pass in passes if render_pass not in target)
+	return union
+
+
+def disabled_nodes(layer_spec, union):
+	"""Names of the aiAOV nodes in union that a layer's spec doesn't have"""
+	layer_spec = resolve_spec(layer_spec)
+	return frozenset(AOV.node_name(group_name, render_pass)
+					for group_name, passes in union.items()
+					for render_pass in passes if render_pass not in layer_spec.get(group_name, ()))
+
+
+def encode_layer_specs(layer_specs):
+	# Base64, so fileInfo quoting can't damage the JSON
+	data = json.dumps(layer_specs, separators=(",", ":")).encode("utf-8")
+	return base64.b64encode(data).decode("ascii")
+
+
+def decode_layer_specs(text):
+	"""Decode stored layer specs, or return an empty dict when they're missing or damaged"""
+	if not text:
+		return OrderedDict()
+	try:
+		return json.loads(base64.b64decode(text).decode("utf-8"), object_pairs_hook=OrderedDict)
+	except (TypeError, ValueError):
+		return OrderedDict()
+
+
+class LayerPlan(object):
+	"""The scene edits that give every render layer its own AOVs"""
+
+	def __init__(self, plan):
+		super(LayerPlan, self).__init__()
+		# ReconcilePlan that builds the AOVs of every layer
+		self.plan = plan
+		# layer -> (node names to turn off, node names to turn back on)
+		self.overrides = OrderedDict()
+		# Layers with a stored spec that aren't in the scene any more
+		self.stale_layers = []
+
+	def __len__(self):
+		return len(self.plan) + sum(len(disable) + len(enable) for disable, enable in self.overrides.values())
+
+	def is_empty(self):
+		return len(self) == 0
+
+	def summary(self):
+		summary = self.plan.summary()
+		summary["layers"] = len(self.overrides)
+		return summary
+
+	def describe(self):
+		lines = self.plan.describe()
+		lines.extend("skip the spec of missing layer {}".format(layer_name) for layer_name in self.stale_layers)
+		for layer_name, (disable, enable) in self.overrides.items():
+			lines.extend("{}: disable {}".format(layer_name, node_name) for node_name in disable)
+			lines.extend("{}: enable {}".format(layer_name, node_name) for node_name in enable)
+		return lines
@@ -0,0 +1,44 @@
+import unittest
+from reconciler import ReconcilePlan
+from render_layers import LayerPlan
+from render_layers import decode_layer_specs
+from render_layers import disabled_nodes
+from render_layers import encode_layer_specs
+from render_layers import union_spec
+
+
+class RenderLayersTest(unittest.TestCase):
+	"""Test class for the per render layer specs"""
+
+	def setUp(self):
+		self.layer_specs = {"char": {"warm": "coarse"}, "env": {"warm": ["direct", "diffuse"], "cold": ["direct"]}}
+
+	def test_unions_the_passes_of_every_layer(self):
+		union = union_spec(self.layer_specs)
+		self.assertEqual(union["warm"], ["direct", "indirect", "emission", "background", "diffuse"])
+		self.assertEqual(union["cold"], ["direct"])
+
+	def test_disables_what_a_layer_lacks(self):
+		union = union_spec(self.layer_specs)
+		self.assertEqual(disabled_nodes(self.layer_specs["char"], union),
+						frozenset(["aiAOV_warm_diffuse", "aiAOV_cold_direct"]))
+		self.assertEqual(disabled_nodes(self.layer_specs["env"], union), frozenset(
+			["aiAOV_warm_indirect", "aiAOV_warm_emission", "aiAOV_warm_background"]))
+
+	def test_round_trips_layer_specs(self):
+		text = encode_layer_specs(self.layer_specs)
+		self.assertFalse('"' in text)
+		self.assertEqual(decode_layer_specs(text), self.layer_specs)
+
+	def test_ignores_damaged_layer_specs(self):
+		self.assertEqual(decode_layer_specs(None), {})
+		self.assertEqual(decode_layer_specs("not specs"), {})
+
+	def test_counts_plan_and_overrides(self):
+		layer_plan = LayerPlan(ReconcilePlan())
+		self.assertTrue(layer_plan.is_empty())
+		layer_plan.plan.creates.append(("warm", "direct"))
+		layer_plan.overrides["char"] = (["aiAOV_warm_direct"], [])
+		self.assertEqual(len(layer_plan), 2)
+		self.assertEqual(layer_plan.summary(), {"create": 1, "delete": 0, "update": 0, "layers": 1})
+		self.assertEqual(layer_plan.describe(), ["create warm_direct", "char: disable aiAOV_warm_direct"])
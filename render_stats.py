@@ -0,0 +1,378 @@
+"""
+What the light group AOVs of a shot cost in the renders.
+
+Arnold reports what a frame cost in its stats JSON file (options.stats_file)
+and in its log, and where the time went in its profile (options.profile_file,
+a Chrome trace). This reads all three, a file at a time and logs a line at
+a time, and keeps per frame:
+- the frame time and the peak memory,
+- the memory of the AOV frame buffers ("output buffers"),
+- the time reported for AOVs and light path expressions, when it's there,
+- the time of the profile events of each AOV or light path expression,
+- the size of the images the log says were written.
+Summed over a frame range, the totals are attributed to the AOVs the
+manager knows of: memory and disk by their share of the channels written
+next to the beauty RGBA, given each AOV's own data type. Time is only
+given to an AOV whose profile events name it. Stats files and logs don't
+say which AOV took the time, so without a profile AOVs get no time.
+
+Reading a stats file is cached on disk with its modification time and size,
+so thousands of frames load in seconds once they were read before:
+	python render_stats.py "logs/shot010.####.log" "stats/shot010.####.json" --frames 1001-1100 --cache shot010_render_cache.json --json shot010_render_stats.json
+LPEManager.render_costs() attributes the totals, and the UI shows them
+next to each AOV.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+from collections import OrderedDict
+from beauty_check import expand_frames
+from beauty_check import parse_frame_range
+from contribution import StatsCache
+from contribution import file_stamp
+from render_budget import BEAUTY_CHANNELS
+from render_budget import format_bytes
+from scene_backend import AOV_NODE_PREFIX
+
+# Cache file the UI keeps next to the stats it loads
+CACHE_NAME = ".lpe_render_stats_cache.json"
+
+FIELDS = ["frame_time", "peak_memory", "aov_memory", "aov_time", "output_bytes"]
+
+# AOV name -> seconds, from the events of a profile
+AOV_TIMES = "aov_times"
+
+# Fields averaged over the frames, the others keep their peak
+PER_FRAME_FIELDS = ["frame_time", "aov_time", "output_bytes"]
+
+_UNITS = {"b": 1, "bytes": 1, "kb": 1024, "mb": 1024 ** 2, "gb": 1024 ** 3,
+		"microseconds": 1e-6, "milliseconds": 1e-3, "seconds": 1.0}
+
+_LOG_MEMORY = re.compile(r"\|\s*(peak CPU memory used|output buffers)\s+([\d.]+)\s*([KMG]?B)\b")
+_LOG_RENDER_DONE = re.compile(r"render done in (?:(\d+):)?(\d+):(\d+(?:\.\d+)?)")
+_LOG_WRITING = re.compile(r"writing file [`'\"]([^`'\"]+)['\"]")
+
+# Profile events of AOVs and light path expressions mention one of these
+_PROFILE_AOV = re.compile(r"\baovs?\b|\blpes?\b|light path", re.IGNORECASE)
+
+# Event args that name the AOV an event was for, most specific first
+_PROFILE_AOV_ARGS = ["aov", "lpe", "node"]
+
+# json gives unicode strings in Python 2 and str in Python 3
+_TEXT = type(u"")
+
+
+def empty_stats():
+	stats = dict((field, None) for field in FIELDS)
+	stats[AOV_TIMES] = None
+	return stats
+
+
+def _unit(key):
+	words = key.lower().split()
+	for word in reversed(words):
+		if word in _UNITS:
+			return _UNITS[word]
+	return None
+
+
+def _flatten(data, path=()):
+	# Yield (path, number) for every number in nested dicts
+	if isinstance(data, dict):
+		for key, value in data.items():
+			for item in _flatten(value, path + (key,)):
+				yield item
+	elif isinstance(data, (int, float)) and not isinstance(data, bool):
+		yield path, data
+
+
+def _add(stats, field, value):
+	stats[field] = value if stats[field] is None else stats[field] + value
+
+
+def parse_stats_json(data):
+	"""Frame stats from the parsed stats JSON of one frame"""
+	stats = empty_stats()
+	renders = sorted(key for key in data if key.startswith("render"))
+	# A stats file appended to by several renders holds the last one last
+	data = data[renders[-1]] if renders else data
+	for path, value in _flatten(data):
+		text = " ".join(path).lower()
+		scale = _unit(path[-1]) or _unit(text)
+		if scale is None:
+			continue
+		value *= scale
+		if "frame time" in text and stats["frame_time"] is None:
+			stats["frame_time"] = value
+		elif "peak" in text and "memory" in text:
+			stats["peak_memory"] = max(stats["peak_memory"] or 0, value)
+		elif "memory" in text and ("output buffers" in text or re.search(r"\baovs?\b", text)):
+			_add(stats, "aov_memory", value)
+		elif "seconds" in text and (re.search(r"\baovs?\b", text) or "light path" in text):
+			_add(stats, "aov_time", value)
+	return stats
+
+
+def _profile_durations(events):
+	# Yield (event, seconds) for complete events, and for begin/end pairs
+	open_events = {}
+	for event in events:
+		phase = event.get("ph")
+		if phase == "X":
+			yield event, event.get("dur", 0) * 1e-6
+		elif phase == "B":
+			open_events.setdefault((event.get("pid"), event.get("tid")), []).append(event)
+		elif phase == "E":
+			stack = open_events.get((event.get("pid"), event.get("tid")))
+			if stack:
+				begin = stack.pop()
+				yield begin, (event.get("ts", 0) - begin.get("ts", 0)) * 1e-6
+
+
+def _profile_aov_name(event):
+	args = event.get("args") or {}
+	for key in _PROFILE_AOV_ARGS:
+		if isinstance(args.get(key), _TEXT):
+			name = args[key]
+			break
+	else:
+		name = event.get("name", "")
+		# "AOV warm_direct" or "lpe: warm_direct" name the AOV after the keyword
+		match = re.match(r"(?:aovs?|lpes?|light path expressions?)[\s:]+(\S+)$", name, re.IGNORECASE)
+		if match is None:
+			return None
+		name = match.group(1)
+	return name[len(AOV_NODE_PREFIX):] if name.startswith(AOV_NODE_PREFIX) else name
+
+
+def parse_profile(data):
+	"""
+	Frame stats from the parsed profile (Chrome trace) of one frame. Events
+	of AOVs and light path expressions add up to aov_time, and those that
+	name their AOV, in their args or their name, to that AOV's time.
+	"""
+	stats = empty_stats()
+	for event, seconds in _profile_durations(data.get("traceEvents", [])):
+		args = event.get("args") or {}
+		text = " ".join([event.get("name", ""), event.get("cat", "")] +
+						[value for value in args.values() if isinstance(value, _TEXT)])
+		if not (_PROFILE_AOV.search(text) or any(key in args for key in _PROFILE_AOV_ARGS)):
+			continue
+		_add(stats, "aov_time", seconds)
+		name = _profile_aov_name(event)
+		if name:
+			times = stats[AOV_TIMES] = stats[AOV_TIMES] or {}
+			times[name] = times.get(name, 0.0) + seconds
+	return stats
+
+
+def parse_log(lines):
+	"""Frame stats from the lines of an Arnold log"""
+	stats = empty_stats()
+	outputs = []
+	for line in lines:
+		match = _LOG_MEMORY.search(line)
+		if match is not None:
+			field = "peak_memory" if match.group(1).startswith("peak") else "aov_memory"
+			stats[field] = float(match.group(2)) * _UNITS[match.group(3).lower()]
+			continue
+		match = _LOG_RENDER_DONE.search(line)
+		if match is not None:
+			hours, minutes, seconds = match.groups()
+			stats["frame_time"] = int(hours or 0) * 3600 + int(minutes) * 60 + float(seconds)
+			continue
+		match = _LOG_WRITING.search(line)
+		if match is not None and match.group(1) not in outputs:
+			outputs.append(match.group(1))
+
+	sizes = [os.path.getsize(output) for output in outputs if os.path.exists(output)]
+	if sizes:
+		stats["output_bytes"] = sum(sizes)
+	return stats
+
+
+def read_stats_file(path):
+	if path.endswith(".json"):
+		with open(path) as stats_file:
+			data = json.load(stats_file)
+		return parse_profile(data) if "traceEvents" in data else parse_stats_json(data)
+	with open(path) as log_file:
+		return parse_log(log_file)
+
+
+def group_by_frame(paths):
+	"""Group stats files by the last number in their names, which is taken as the frame"""
+	frame_paths = OrderedDict()
+	for path in sorted(paths):
+		numbers = re.findall(r"\d+", os.path.basename(path))
+		frame = int(numbers[-1]) if numbers else path
+		frame_paths.setdefault(frame, []).append(path)
+	return frame_paths
+
+
+def load_frames(frame_paths, cache=None, report=None):
+	"""
+	Read the stats files of every frame, calling report(path, cached) after
+	each file. A frame's files are merged, the first file with a value wins.
+	Returns an OrderedDict of frame -> stats, leaving out frames without any.
+	"""
+	if cache is None:
+		cache = StatsCache()
+	frames = OrderedDict()
+	for frame, paths in frame_paths.items():
+		stats = empty_stats()
+		for path in paths:
+			if not os.path.exists(path):
+				continue
+			file_stats = cache.get(path)
+			cached = file_stats is not None
+			if not cached:
+				stamp = file_stamp(path)
+				file_stats = read_stats_file(path)
+				cache.put(path, stamp, file_stats)
+			for field in FIELDS + [AOV_TIMES]:
+				if stats[field] is None:
+					stats[field] = file_stats.get(field)
+			if report:
+				report(path, cached)
+		if any(value is not None for value in stats.values()):
+			frames[frame] = stats
+	cache.save()
+	return frames
+
+
+def aggregate(frames):
+	"""
+	Totals over the frames: the mean per frame of the times and output size,
+	the peak of the memory, and the number of frames. The time of each AOV
+	is its mean over the frames that have a profile.
+	"""
+	totals = empty_stats()
+	counts = dict((field, 0) for field in FIELDS)
+	profiled = 0
+	for stats in frames.values():
+		if stats.get(AOV_TIMES) is not None:
+			profiled += 1
+			times = totals[AOV_TIMES] = totals[AOV_TIMES] or {}
+			for name, seconds in stats[AOV_TIMES].items():
+				times[name] = times.get(name, 0.0) + seconds
+		for field in FIELDS:
+			value = stats[field]
+			if value is None:
+				continue
+			counts[field] += 1
+			if field in PER_FRAME_FIELDS:
+				_add(totals, field, value)
+			else:
+				totals[field] = max(totals[field] or 0, value)
+	for field in PER_FRAME_FIELDS:
+		if counts[field]:
+			totals[field] /= counts[field]
+	for name in totals[AOV_TIMES] or ():
+		totals[AOV_TIMES][name] /= profiled
+	totals["frames"] = len(frames)
+	return totals
+
+
+def attribute(totals, aov_channels, written=None):
+	"""
+	Share the totals out to AOVs. aov_channels maps each AOV's (light group,
+	pass) to the channels it's written with. written is the channels of every
+	light group AOV the totals came from, when aov_channels are only some of
+	them. Returns an OrderedDict of key -> dict of memory, time and disk per
+	frame, None where the totals don't say. Time is the profiled time of the
+	AOV named <light group>_<pass>.
+	"""
+	channels = (sum(aov_channels.values()) if written is None else written) + BEAUTY_CHANNELS
+	times = totals.get(AOV_TIMES) or {}
+	costs = OrderedDict()
+	for key, aov_channel_count in aov_channels.items():
+		share = float(aov_channel_count) / channels
+		costs[key] = {
+			"memory": None if totals["aov_memory"] is None else totals["aov_memory"] * share,
+			"disk": None if totals["output_bytes"] is None else totals["output_bytes"] * share,
+			"time": times.get("{}_{}".format(*key))
+		}
+	return costs
+
+
+def format_cost(cost):
+	parts = []
+	if cost["memory"] is not None:
+		parts.append(format_bytes(cost["memory"]))
+	if cost["time"] is not None:
+		parts.append("{:.2f}s".format(cost["time"]))
+	if cost["disk"] is not None:
+		parts.append(format_bytes(cost["disk"]) + " disk")
+	return ", ".join(parts)
+
+
+def format_totals(totals):
+	lines = ["{} frames".format(totals["frames"])]
+	if totals["frame_time"] is not None:
+		lines.append("frame time     {:.2f}s per frame".format(totals["frame_time"]))
+	if totals["peak_memory"] is not None:
+		lines.append("peak memory    {}".format(format_bytes(totals["peak_memory"])))
+	if totals["aov_memory"] is not None:
+		lines.append("AOV buffers    {}".format(format_bytes(totals["aov_memory"])))
+	if totals["aov_time"] is not None:
+		lines.append("AOV time       {:.2f}s per frame".format(totals["aov_time"]))
+	if totals["output_bytes"] is not None:
+		lines.append("images         {} per frame".format(format_bytes(totals["output_bytes"])))
+	times = totals.get(AOV_TIMES) or {}
+	for name in sorted(times, key=lambda name: times[name], reverse=True):
+		lines.append("  {:<28} {:.2f}s per frame".format(name, times[name]))
+	return "\n".join(lines)
+
+
+def summary(totals):
+	"""The totals on one line"""
+	parts = ["{} frames".format(totals["frames"])]
+	if totals["frame_time"] is not None:
+		parts.append("{:.1f}s per frame".format(totals["frame_time"]))
+	if totals["aov_memory"] is not None:
+		parts.append("AOV buffers {}".format(format_bytes(totals["aov_memory"])))
+	if not totals.get(AOV_TIMES):
+		parts.append("no AOV times without a profile")
+	return ", ".join(parts)
+
+
+def load_totals(path):
+	with open(path) as totals_file:
+		return json.load(totals_file)["totals"]
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Read Arnold render stats and logs over a frame range")
+	parser.add_argument("patterns", nargs="+",
+						help="stats or profile .json, or log paths with #### for the frame number")
+	parser.add_argument("--frames", required=True, help="frame range like 1001-1100, 1001-1100x5 or 1001,1005")
+	parser.add_argument("--cache", help="JSON file that keeps the stats of files already read")
+	parser.add_argument("--json", help="write the totals to this JSON file, for LPEManager.render_costs()")
+	args = parser.parse_args(argv)
+
+	try:
+		frames = parse_frame_range(args.frames)
+	except ValueError as error:
+		parser.error(str(error))
+
+	start = timeit.default_timer()
+	read = []
+	frame_stats = load_frames(expand_frames(args.patterns, frames), StatsCache(args.cache),
+							lambda path, cached: read.append(cached))
+	totals = aggregate(frame_stats)
+	print(format_totals(totals))
+	print("")
+	print("{} files, {} cached, {:.2f}s".format(len(read), sum(read), timeit.default_timer() - start))
+
+	if args.json:
+		with open(args.json, "w") as json_file:
+			json.dump({"totals": totals, "frames": frame_stats}, json_file, indent=2)
+	return 0 if frame_stats else 1
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,145 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from contribution import StatsCache
+from render_stats import aggregate
+from render_stats import attribute
+from render_stats import group_by_frame
+from render_stats import load_frames
+from render_stats import parse_log
+from render_stats import parse_profile
+from render_stats import parse_stats_json
+
+MB = 1024 ** 2
+
+STATS = {
+	"render 0000": {"frame time microseconds": 1000000},
+	"render 0001": {
+		"frame time microseconds": 90000000,
+		"peak CPU memory used bytes": 4000 * MB,
+		"memory consumed bytes": {"geometry": 1000 * MB, "output buffers": 300 * MB},
+		"microseconds": {"light path expressions": 3000000, "pixel rendering": 80000000}
+	}
+}
+
+PROFILE = {"traceEvents": [
+	{"name": "render", "cat": "render", "ph": "X", "ts": 0, "dur": 9000000, "pid": 1, "tid": 1},
+	{"name": "aov", "cat": "aov", "ph": "X", "ts": 10, "dur": 2000000, "pid": 1, "tid": 1,
+	"args": {"node": "aiAOV_warm_direct"}},
+	{"name": "AOV warm_direct", "cat": "shading", "ph": "X", "ts": 20, "dur": 500000, "pid": 1, "tid": 2},
+	{"name": "lpe: cold_sss", "cat": "shading", "ph": "B", "ts": 100, "pid": 1, "tid": 3},
+	{"name": "lpe: cold_sss", "cat": "shading", "ph": "E", "ts": 250100, "pid": 1, "tid": 3},
+	{"name": "light path expressions", "cat": "shading", "ph": "X", "ts": 0, "dur": 1000000, "pid": 1, "tid": 4}
+]}
+
+LOG = """00:00:00   120MB         | Arnold 7.1.0.0
+00:00:01   500MB         | [driver_exr] writing file `{}'
+00:01:30  4000MB         | peak CPU memory used          3900.00MB
+00:01:30  4000MB         |  output buffers                250.00MB
+00:01:30  4000MB         | render done in 1:29.500
+"""
+
+
+class ParseTest(unittest.TestCase):
+	"""Test class for reading Arnold stats and logs"""
+
+	def test_reads_the_last_render_of_a_stats_file(self):
+		stats = parse_stats_json(STATS)
+		self.assertEqual(stats["frame_time"], 90.0)
+		self.assertEqual(stats["peak_memory"], 4000 * MB)
+		self.assertEqual(stats["aov_memory"], 300 * MB)
+		self.assertEqual(stats["aov_time"], 3.0)
+		self.assertEqual(stats["output_bytes"], None)
+
+	def test_reads_aov_times_from_a_profile(self):
+		stats = parse_profile(PROFILE)
+		self.assertAlmostEqual(stats["aov_time"], 3.75)
+		self.assertEqual(stats["aov_times"], {"warm_direct": 2.5, "cold_sss": 0.25})
+		self.assertEqual(stats["frame_time"], None)
+
+	def test_reads_logs(self):
+		directory = tempfile.mkdtemp()
+		try:
+			image = os.path.join(directory, "shot.1001.exr")
+			with open(image, "wb") as image_file:
+				image_file.write(b"x" * 1000)
+			stats = parse_log(LOG.format(image).splitlines(True))
+		finally:
+			shutil.rmtree(directory)
+		self.assertEqual(stats["frame_time"], 89.5)
+		self.assertEqual(stats["peak_memory"], 3900 * MB)
+		self.assertEqual(stats["aov_memory"], 250 * MB)
+		self.assertEqual(stats["output_bytes"], 1000)
+
+	def test_groups_files_by_frame(self):
+		frame_paths = group_by_frame(["logs/shot010.1002.log", "stats/shot010.1001.json", "logs/shot010.1001.log"])
+		self.assertEqual(list(frame_paths.items()), [
+			(1001, ["logs/shot010.1001.log", "stats/shot010.1001.json"]), (1002, ["logs/shot010.1002.log"])])
+
+
+class TotalsTest(unittest.TestCase):
+	"""Test class for adding up frames and sharing them out to AOVs"""
+
+	def test_averages_times_and_keeps_peak_memory(self):
+		totals = aggregate({
+			1: {"frame_time": 10.0, "peak_memory": 100, "aov_memory": 40, "aov_time": None, "output_bytes": 10},
+			2: {"frame_time": 20.0, "peak_memory": 300, "aov_memory": 20, "aov_time": None, "output_bytes": 30}
+		})
+		self.assertEqual(totals["frames"], 2)
+		self.assertEqual(totals["frame_time"], 15.0)
+		self.assertEqual(totals["peak_memory"], 300)
+		self.assertEqual(totals["aov_memory"], 40)
+		self.assertEqual(totals["aov_time"], None)
+		self.assertEqual(totals["output_bytes"], 20)
+
+	def test_shares_costs_by_channels(self):
+		totals = {"aov_memory": 100.0, "output_bytes": None, "aov_time": 4.0}
+		costs = attribute(totals, {("warm", "direct"): 3, ("warm", "indirect"): 3, ("cold", "direct"): 4})
+		self.assertEqual(costs[("warm", "direct")], {"memory": 100.0 * 3 / 14, "disk": None, "time": None})
+		self.assertAlmostEqual(costs[("cold", "direct")]["memory"], 400.0 / 14)
+
+	def test_gives_aovs_their_profiled_time(self):
+		totals = {"aov_memory": None, "output_bytes": None, "aov_time": 4.0, "aov_times": {"warm_direct": 1.5}}
+		costs = attribute(totals, {("warm", "direct"): 3, ("warm", "indirect"): 3}, written=10)
+		self.assertEqual(costs[("warm", "direct")]["time"], 1.5)
+		self.assertEqual(costs[("warm", "indirect")]["time"], None)
+
+	def test_averages_profiled_times(self):
+		totals = aggregate({
+			1001: dict(parse_profile(PROFILE), frame_time=10.0),
+			1002: dict(parse_profile({"traceEvents": []}), frame_time=20.0, aov_times={"warm_direct": 1.0})
+		})
+		self.assertEqual(totals["aov_times"]["warm_direct"], 1.75)
+		self.assertEqual(totals["aov_times"]["cold_sss"], 0.125)
+
+
+class LoadFramesTest(unittest.TestCase):
+	"""Test class for loading stats files with a cache"""
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.stats_path = os.path.join(self.directory, "shot.1001.json")
+		with open(self.stats_path, "w") as stats_file:
+			json.dump(STATS, stats_file)
+		self.log_path = os.path.join(self.directory, "shot.1001.log")
+		with open(self.log_path, "w") as log_file:
+			log_file.write(LOG.format("missing.exr"))
+		self.cache_path = os.path.join(self.directory, "cache.json")
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_merges_the_files_of_a_frame(self):
+		frames = load_frames({1001: [self.stats_path, self.log_path]})
+		self.assertEqual(frames[1001]["aov_time"], 3.0)
+		self.assertEqual(frames[1001]["aov_memory"], 300 * MB)
+
+	def test_reads_files_once(self):
+		load_frames({1001: [self.stats_path, self.log_path]}, StatsCache(self.cache_path))
+		read = []
+		frames = load_frames({1001: [self.stats_path, self.log_path], 1002: [self.stats_path + "2"]},
+							StatsCache(self.cache_path), lambda path, cached: read.append(cached))
+		self.assertEqual(read, [True, True])
+		self.assertEqual(list(frames), [1001])
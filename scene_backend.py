@@ -0,0 +1,669 @@
+"""
+Scene access for LPEManager and AOV.
+
+Everything the manager and UI need from a scene goes through a backend:
+listing lights, reading and writing their aiAov light groups and reading
+the attributes lights are clustered by, creating, finding, selecting and
+deleting aiAOV nodes and their light path expressions and drivers, and the
+render setup layer collections that turn aiAOVs off.
+
+MayaBackend works on the open Maya scene through PyMEL, maya.cmds and mtoa.
+MemoryBackend keeps lights and aiAOV nodes in plain Python objects with the
+same aiAOV_<group>_<pass> naming, so the manager can be tested and profiled
+without Maya.
+
+get_backend() returns the Maya backend whenever Maya can be imported and
+the in-memory one otherwise. set_backend() swaps it, e.g. for benchmarks.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+import uuid
+
+try:
+	import maya.api.OpenMaya as om
+	import maya.cmds as cmds
+	import maya.mel as mel
+	import mtoa as arnold
+	import pymel.core as pm
+	MAYA_AVAILABLE = True
+except ImportError:
+	MAYA_AVAILABLE = False
+
+AOV_NODE_PREFIX = "aiAOV_"
+MASTER_LAYER = "defaultRenderLayer"
+
+# Suffix of the render setup collection that turns a layer's unused AOVs off
+DISABLED_COLLECTION = "lpeManagerDisabledAOVs"
+
+# Every light type Arnold renders that carries an aiAov light group
+LIGHT_TYPES = [
+	"aiAreaLight", "aiMeshLight", "aiPhotometricLight", "aiSkyDomeLight",
+	"areaLight", "directionalLight", "pointLight", "spotLight"
+]
+
+# Lights that light the scene the same from wherever they're placed
+INFINITE_LIGHT_TYPES = frozenset(["aiSkyDomeLight", "directionalLight"])
+
+_backend = None
+
+
+def get_backend():
+	global _backend
+	if _backend is None:
+		_backend = MayaBackend() if MAYA_AVAILABLE else MemoryBackend()
+	return _backend
+
+
+def set_backend(backend):
+	global _backend
+	_backend = backend
+
+
+def _mel_string(text):
+	"""Escape text for a double quoted MEL string"""
+	return text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MayaBackend(object):
+	"""Backend for the scene open in Maya"""
+
+	def __init__(self):
+		super(MayaBackend, self).__init__()
+		self._interface = None
+		self._edit_depth = 0
+
+	def new_scene(self):
+		pm.newFile(force=True)
+		self._interface = None
+		# defaultArnoldDriver (among other objects) doesn't load until needed.
+		# The following 2 lines will force them to load to avoid runtime errors.
+		from mtoa.core import createOptions
+		createOptions()
+
+	def open_scene(self, path):
+		pm.system.openFile(path, force=True)
+		self._interface = None
+
+	def save_scene(self):
+		pm.system.saveFile(force=True)
+
+	@contextmanager
+	def edit(self, chunk_name):
+		"""
+		Group scene edits into a single undo chunk with viewport refresh suspended.
+		Nested edits join the outermost chunk.
+		"""
+		self._edit_depth += 1
+		if self._edit_depth == 1:
+			pm.undoInfo(openChunk=True, chunkName=chunk_name)
+			pm.refresh(suspend=True)
+		try:
+			yield
+		finally:
+			self._edit_depth -= 1
+			if self._edit_depth == 0:
+				pm.refresh(suspend=False)
+				pm.undoInfo(closeChunk=True)
+
+	def undo(self):
+		pm.undo()
+
+	def read_file_info(self, key):
+		values = cmds.fileInfo(key, query=True)
+		return values[0] if values else None
+
+	def write_file_info(self, key, value):
+		cmds.fileInfo(key, value)
+
+	def render_settings(self):
+		return {
+			"width": cmds.getAttr("defaultResolution.width"),
+			"height": cmds.getAttr("defaultResolution.height"),
+			"half_precision": cmds.getAttr("defaultArnoldDriver.halfPrecision"),
+			"compression": cmds.getAttr("defaultArnoldDriver.exrCompression", asString=True)
+		}
+
+	def list_lights(self):
+		return cmds.ls(type=LIGHT_TYPES)
+
+	def create_light(self, light_type, group=None):
+		light = cmds.createNode(light_type)
+		if group is not None:
+			self.set_light_group(light, group)
+		return light
+
+	def set_light_group(self, light, group):
+		cmds.setAttr(light + ".aiAov", group, type="string")
+
+	def select_nodes(self, nodes):
+		pm.select(nodes)
+
+	def light_group_map(self):
+		"""
+		Map every light group to the lights in it.
+		The lights are listed with one query, and their aiAov plugs are read
+		through a single MSelectionList instead of one getAttr per light.
+		"""
+		group_map = OrderedDict()
+		lights = self.list_lights()
+		if not lights:
+			return group_map
+
+		selection = om.MSelectionList()
+		for light in lights:
+			selection.add(light)
+
+		node_fn = om.MFnDependencyNode()
+		for index, light in enumerate(lights):
+			node_fn.setObject(selection.getDependNode(index))
+			if not node_fn.hasAttribute("aiAov"):
+				continue
+			group = node_fn.findPlug("aiAov", False).asString()
+			group_map.setdefault(group, []).append(light)
+		return group_map
+
+	def set_light_groups(self, light_groups):
+		"""
+		Set the aiAov light group of many lights from a light -> group dict.
+		This stays one setAttr per light rather than a single MDGModifier:
+		setAttr goes through the undo queue and joins the caller's edit()
+		chunk, while a modifier run outside of an MPxCommand can't be undone.
+		"""
+		for light, group in light_groups.items():
+			cmds.setAttr(light + ".aiAov", group, type="string")
+
+	def light_attributes(self, lights):
+		"""
+		Type, world position, intensity, exposure and color of every light,
+		read through a single MSelectionList like light_group_map(). mtoa
+		names the exposure of Maya lights aiExposure and of its own lights
+		exposure. Skydome and directional lights are placed at the origin,
+		since where they are doesn't change how they light.
+		"""
+		selection = om.MSelectionList()
+		for light in lights:
+			selection.add(light)
+
+		node_fn = om.MFnDependencyNode()
+		attributes = []
+		for index in range(len(lights)):
+			path = selection.getDagPath(index)
+			node_fn.setObject(path.node())
+			position = (0.0, 0.0, 0.0)
+			if node_fn.typeName not in INFINITE_LIGHT_TYPES:
+				translation = om.MTransformationMatrix(path.inclusiveMatrix()).translation(om.MSpace.kWorld)
+				position = (translation.x, translation.y, translation.z)
+			exposure = self._float_attribute(node_fn, "aiExposure", None)
+			if exposure is None:
+				exposure = self._float_attribute(node_fn, "exposure", 0.0)
+			color = (1.0, 1.0, 1.0)
+			if node_fn.hasAttribute("color"):
+				plug = node_fn.findPlug("color", False)
+				color = tuple(plug.child(channel).asFloat() for channel in range(3))
+			attributes.append({
+				"type": node_fn.typeName,
+				"position": position,
+				"intensity": self._float_attribute(node_fn, "intensity", 1.0),
+				"exposure": exposure,
+				"color": color
+			})
+		return attributes
+
+	def _float_attribute(self, node_fn, name, default):
+		if not node_fn.hasAttribute(name):
+			return default
+		return node_fn.findPlug(name, False).asFloat()
+
+	def list_aov_nodes(self):
+		return pm.ls(type="aiAOV")
+
+	def find_aov_node(self, node_name):
+		search_results = pm.ls(node_name, type="aiAOV")
+		if search_results:
+			return search_results[0]
+		return None
+
+	def count_aov_nodes(self):
+		return len(cmds.ls(type="aiAOV"))
+
+	def node_uuids(self, nodes):
+		"""UUIDs of several nodes, read through one MSelectionList"""
+		selection = om.MSelectionList()
+		for node in nodes:
+			selection.add(str(node))
+		return [om.MFnDependencyNode(selection.getDependNode(index)).uuid().asString()
+				for index in range(selection.length())]
+
+	def node_names_from_uuids(self, uuids):
+		"""Names of the nodes that still exist for the UUIDs, with one ls call"""
+		return cmds.ls(uuids) if uuids else []
+
+	def find_aov_nodes(self, node_names):
+		"""Find several aiAOV nodes with one query, None for the missing ones"""
+		found = dict((node.nodeName(), node) for node in pm.ls(node_names, type="aiAOV"))
+		return [found.get(node_name) for node_name in node_names]
+
+	def create_aov_node(self, aov_name):
+		# One AOVInterface is shared by every node this backend creates
+		if self._interface is None:
+			self._interface = arnold.aovs.AOVInterface()
+		return pm.PyNode(self._interface.addAOV(aov_name).node)
+
+	def delete_nodes(self, nodes):
+		if nodes:
+			pm.delete(nodes)
+
+	def node_exists(self, node):
+		return node is not None and node.exists()
+
+	def node_name(self, node):
+		return str(node)
+
+	def node_type(self, node):
+		return node.type()
+
+	def get_lpe(self, node):
+		return cmds.getAttr("{}.lightPathExpression".format(node))
+
+	def get_lpes(self, nodes):
+		return [cmds.getAttr("{}.lightPathExpression".format(node)) for node in nodes]
+
+	def set_lpe(self, node, expression):
+		cmds.setAttr("{}.lightPathExpression".format(node), expression, type="string")
+
+	def set_lpes(self, node_expressions):
+		"""
+		Set the light path expression of many aiAOVs with a single MEL call.
+		cmds.setAttr only takes one plug, and an MDGModifier run outside of an
+		MPxCommand can't be undone, so the setAttrs are batched into one script
+		instead: every one of them still joins the caller's edit() chunk.
+		"""
+		if node_expressions:
+			mel.eval("".join('setAttr -type "string" "{}.lightPathExpression" "{}";\n'.format(
+				node, _mel_string(expression)) for node, expression in node_expressions))
+
+	def ensure_driver(self, driver_name, settings):
+		"""Create or update an EXR aiAOVDriver"""
+		if not cmds.objExists(driver_name):
+			driver_name = cmds.createNode("aiAOVDriver", name=driver_name, skipSelect=True)
+			cmds.setAttr(driver_name + ".aiTranslator", "exr", type="string")
+
+		compressions = cmds.attributeQuery("exrCompression", node=driver_name, listEnum=True)[0].split(":")
+		cmds.setAttr(driver_name + ".exrCompression", compressions.index(settings["compression"]))
+		cmds.setAttr(driver_name + ".halfPrecision", settings["half_precision"])
+		cmds.setAttr(driver_name + ".mergeAOVs", settings["merge_aovs"])
+		cmds.setAttr(driver_name + ".prefix", settings["prefix"], type="string")
+		if cmds.attributeQuery("multipart", node=driver_name, exists=True):
+			cmds.setAttr(driver_name + ".multipart", settings["multipart"])
+		return driver_name
+
+	def unused_drivers(self, prefix):
+		"""aiAOVDrivers named prefix or prefix_<anything> that no aiAOV writes through"""
+		drivers = cmds.ls(prefix, prefix + "_*", type="aiAOVDriver") or []
+		return [driver for driver in drivers
+				if not cmds.listConnections(driver + ".message", type="aiAOV", source=False, destination=True)]
+
+	def delete_drivers(self, drivers):
+		if drivers:
+			cmds.delete(drivers)
+
+	def get_aov_output(self, node):
+		"""(driver name, Arnold data type) of an aiAOV's first output"""
+		drivers = cmds.listConnections("{}.outputs[0].driver".format(node), source=True, destination=False)
+		return (drivers[0] if drivers else None), cmds.getAttr("{}.type".format(node))
+
+	def get_aov_types(self, nodes):
+		"""Arnold data type of several aiAOVs"""
+		return [cmds.getAttr("{}.type".format(node)) for node in nodes]
+
+	def set_aov_outputs(self, node_drivers, data_type):
+		"""Write each aiAOV through its driver as the given Arnold data type"""
+		for node, driver in node_drivers:
+			cmds.connectAttr(driver + ".message", "{}.outputs[0].driver".format(node), force=True)
+			cmds.setAttr("{}.type".format(node), data_type)
+
+	def list_render_layers(self):
+		"""Names of the render setup layers, without the master layer"""
+		return [layer.name() for layer in self._render_setup().getRenderLayers()]
+
+	def current_render_layer(self):
+		return self._render_setup().getVisibleRenderLayer().name()
+
+	def set_current_render_layer(self, layer_name):
+		render_setup = self._render_setup()
+		if layer_name == MASTER_LAYER:
+			render_setup.switchToLayer(render_setup.getDefaultRenderLayer())
+		else:
+			render_setup.switchToLayer(render_setup.getRenderLayer(layer_name))
+
+	def get_disabled_aovs(self, layer_name):
+		"""Names of the aiAOV nodes a layer's override collection turns off"""
+		collection = self._disabled_collection(layer_name)
+		if collection is None:
+			return []
+		return collection.getSelector().staticSelection.asList()
+
+	def set_disabled_aovs(self, layer_name, disable, enable):
+		"""
+		Add and remove aiAOV nodes from a layer's override collection.
+		The collection and its absolute override of aiAOV.enabled are made
+		the first time the layer turns anything off.
+		"""
+		collection = self._disabled_collection(layer_name, create=bool(disable))
+		if collection is None:
+			return
+		selector = collection.getSelector()
+		if enable:
+			selector.staticSelection.remove(list(enable))
+		if disable:
+			selector.staticSelection.add(list(disable))
+			if not collection.getOverrides():
+				override = collection.createAbsoluteOverride(list(disable)[0], "enabled")
+				override.setAttrValue(False)
+
+	def _render_setup(self):
+		import maya.app.renderSetup.model.renderSetup as renderSetup
+		return renderSetup.instance()
+
+	def _disabled_collection(self, layer_name, create=False):
+		name = "{}_{}".format(layer_name, DISABLED_COLLECTION)
+		layer = self._render_setup().getRenderLayer(layer_name)
+		for collection in layer.getCollections():
+			if collection.name() == name:
+				return collection
+		if not create:
+			return None
+		collection = layer.createCollection(name)
+		selector = collection.getSelector()
+		selector.setFilterType(selector.kCustom)
+		selector.setCustomFilterValue("aiAOV")
+		return collection
+
+
+class MemoryNode(object):
+	"""Plain Python stand-in for a Maya node"""
+
+	def __init__(self, name, node_type, attributes=None):
+		super(MemoryNode, self).__init__()
+		self.name = name
+		self.node_type = node_type
+		self.attributes = attributes or {}
+		self.alive = True
+		self.uuid = str(uuid.uuid4()).upper()
+
+	def __repr__(self):
+		return "MemoryNode({!r}, {!r})".format(self.name, self.node_type)
+
+	def __str__(self):
+		return self.name
+
+
+class MemoryBackend(object):
+	"""Backend for a scene kept entirely in memory"""
+
+	def __init__(self):
+		super(MemoryBackend, self).__init__()
+		self.new_scene()
+
+	def new_scene(self):
+		self._lights = OrderedDict()
+		self._aov_nodes = OrderedDict()
+		self._drivers = OrderedDict()
+		self._file_info = {}
+		self._undo_stack = []
+		self._open_chunk = None
+		self._chunk_depth = 0
+		self.selection = []
+		self._render_layers = OrderedDict()
+		self._current_layer = MASTER_LAYER
+		self._render_settings = {"width": 1920, "height": 1080, "half_precision": False, "compression": "zip"}
+
+	def open_scene(self, path):
+		raise NotImplementedError("MemoryBackend can't open Maya scene files: {}".format(path))
+
+	def save_scene(self):
+		raise NotImplementedError("MemoryBackend can't save Maya scene files")
+
+	@contextmanager
+	def edit(self, chunk_name):
+		if self._chunk_depth == 0:
+			self._open_chunk = []
+		self._chunk_depth += 1
+		try:
+			yield
+		finally:
+			self._chunk_depth -= 1
+			if self._chunk_depth == 0:
+				if self._open_chunk:
+					self._undo_stack.append(self._open_chunk)
+				self._open_chunk = None
+
+	def undo(self):
+		if self._undo_stack:
+			for inverse in reversed(self._undo_stack.pop()):
+				inverse()
+
+	def read_file_info(self, key):
+		return self._file_info.get(key)
+
+	def write_file_info(self, key, value):
+		self._file_info[key] = value
+
+	def render_settings(self):
+		return dict(self._render_settings)
+
+	def set_render_settings(self, **settings):
+		self._render_settings.update(settings)
+
+	def list_lights(self):
+		return list(self._lights.keys())
+
+	def add_light(self, name, light_type="aiAreaLight", group="default", **attributes):
+		attributes["aiAov"] = group
+		self._lights[name] = MemoryNode(name, light_type, attributes)
+		return name
+
+	def create_light(self, light_type, group=None):
+		name = self._unique_name(light_type + "Shape", self._lights)
+		return self.add_light(name, light_type, "default" if group is None else group)
+
+	def set_light_group(self, light, group):
+		attributes = self._lights[light].attributes
+		previous = attributes["aiAov"]
+		attributes["aiAov"] = group
+		self._record(lambda: attributes.__setitem__("aiAov", previous))
+
+	def set_light_groups(self, light_groups):
+		for light, group in light_groups.items():
+			self.set_light_group(light, group)
+
+	def delete_light(self, light):
+		del self._lights[light]
+
+	def select_nodes(self, nodes):
+		self.selection = list(nodes)
+
+	def light_group_map(self):
+		group_map = OrderedDict()
+		for name, light in self._lights.items():
+			group_map.setdefault(light.attributes["aiAov"], []).append(name)
+		return group_map
+
+	def light_attributes(self, lights):
+		attributes = []
+		for light in lights:
+			node = self._lights[light]
+			position = (0.0, 0.0, 0.0)
+			if node.node_type not in INFINITE_LIGHT_TYPES:
+				position = tuple(node.attributes.get("translate", position))
+			attributes.append({
+				"type": node.node_type,
+				"position": position,
+				"intensity": node.attributes.get("intensity", 1.0),
+				"exposure": node.attributes.get("aiExposure", node.attributes.get("exposure", 0.0)),
+				"color": tuple(node.attributes.get("color", (1.0, 1.0, 1.0)))
+			})
+		return attributes
+
+	def list_aov_nodes(self):
+		return list(self._aov_nodes.values())
+
+	def find_aov_node(self, node_name):
+		return self._aov_nodes.get(node_name)
+
+	def count_aov_nodes(self):
+		return len(self._aov_nodes)
+
+	def node_uuids(self, nodes):
+		return [node.uuid for node in nodes]
+
+	def node_names_from_uuids(self, uuids):
+		names = dict((node.uuid, name) for name, node in self._aov_nodes.items())
+		return [names[node_uuid] for node_uuid in uuids if node_uuid in names]
+
+	def find_aov_nodes(self, node_names):
+		return [self._aov_nodes.get(node_name) for node_name in node_names]
+
+	def create_aov_node(self, aov_name):
+		name = self._unique_name(AOV_NODE_PREFIX + aov_name, self._aov_nodes)
+		node = MemoryNode(name, "aiAOV", {"name": aov_name, "lightPathExpression": "",
+										"driver": "defaultArnoldDriver", "type": 5,
+										"enabled": name not in self._render_layers.get(self._current_layer, ())})
+		self._aov_nodes[name] = node
+		self._record(lambda: self._remove_node(node))
+		return node
+
+	def delete_nodes(self, nodes):
+		for node in nodes:
+			if self.node_exists(node):
+				self._remove_node(node)
+				self._record(lambda node=node: self._restore_node(node))
+
+	def node_exists(self, node):
+		return node is not None and node.alive
+
+	def node_name(self, node):
+		return node.name
+
+	def node_type(self, node):
+		return node.node_type
+
+	def get_lpe(self, node):
+		return node.attributes["lightPathExpression"]
+
+	def get_lpes(self, nodes):
+		return [node.attributes["lightPathExpression"] for node in nodes]
+
+	def set_lpe(self, node, expression):
+		previous = node.attributes["lightPathExpression"]
+		node.attributes["lightPathExpression"] = expression
+		self._record(lambda: node.attributes.__setitem__("lightPathExpression", previous))
+
+	def set_lpes(self, node_expressions):
+		for node, expression in node_expressions:
+			self.set_lpe(node, expression)
+
+	def ensure_driver(self, driver_name, settings):
+		driver = self._drivers.get(driver_name)
+		if driver is None:
+			driver = MemoryNode(driver_name, "aiAOVDriver")
+			self._drivers[driver_name] = driver
+			self._record(lambda: self._drivers.pop(driver_name))
+		previous = dict(driver.attributes)
+		driver.attributes.update(settings)
+		self._record(lambda: setattr(driver, "attributes", previous))
+		return driver_name
+
+	def get_driver(self, driver_name):
+		return self._drivers.get(driver_name)
+
+	def unused_drivers(self, prefix):
+		used = set(node.attributes["driver"] for node in self._aov_nodes.values())
+		return [name for name in self._drivers
+				if (name == prefix or name.startswith(prefix + "_")) and name not in used]
+
+	def delete_drivers(self, drivers):
+		for name in drivers:
+			driver = self._drivers.pop(name)
+			self._record(lambda name=name, driver=driver: self._drivers.__setitem__(name, driver))
+
+	def get_aov_output(self, node):
+		return node.attributes["driver"], node.attributes["type"]
+
+	def get_aov_types(self, nodes):
+		return [node.attributes["type"] for node in nodes]
+
+	def set_aov_outputs(self, node_drivers, data_type):
+		for node, driver in node_drivers:
+			previous = (node.attributes["driver"], node.attributes["type"])
+			node.attributes["driver"] = driver
+			node.attributes["type"] = data_type
+			self._record(lambda node=node, previous=previous: node.attributes.update(
+				driver=previous[0], type=previous[1]))
+
+	def add_render_layer(self, layer_name):
+		self._render_layers[layer_name] = set()
+		return layer_name
+
+	def delete_render_layer(self, layer_name):
+		del self._render_layers[layer_name]
+		if self._current_layer == layer_name:
+			self._current_layer = MASTER_LAYER
+			self._apply_render_layer()
+
+	def list_render_layers(self):
+		return list(self._render_layers.keys())
+
+	def current_render_layer(self):
+		return self._current_layer
+
+	def set_current_render_layer(self, layer_name):
+		if layer_name != MASTER_LAYER and layer_name not in self._render_layers:
+			raise ValueError("No render layer named '{}'".format(layer_name))
+		self._current_layer = layer_name
+		self._apply_render_layer()
+
+	def get_disabled_aovs(self, layer_name):
+		return sorted(self._render_layers[layer_name])
+
+	def set_disabled_aovs(self, layer_name, disable, enable):
+		disabled = self._render_layers[layer_name]
+		previous = set(disabled)
+		disabled.difference_update(enable)
+		disabled.update(disable)
+		self._record(lambda: self._restore_disabled_aovs(layer_name, previous))
+		if layer_name == self._current_layer:
+			self._apply_render_layer()
+
+	def _restore_disabled_aovs(self, layer_name, disabled):
+		self._render_layers[layer_name] = disabled
+		self._apply_render_layer()
+
+	def _apply_render_layer(self):
+		# Overrides of the visible layer show up on the nodes, like in Maya
+		disabled = self._render_layers.get(self._current_layer, ())
+		for name, node in self._aov_nodes.items():
+			node.attributes["enabled"] = name not in disabled
+
+	def _record(self, inverse):
+		# Edits outside of edit() are undone one at a time, like in Maya
+		if self._open_chunk is not None:
+			self._open_chunk.append(inverse)
+		else:
+			self._undo_stack.append([inverse])
+
+	def _remove_node(self, node):
+		node.alive = False
+		del self._aov_nodes[node.name]
+
+	def _restore_node(self, node):
+		node.alive = True
+		self._aov_nodes[node.name] = node
+
+	def _unique_name(self, name, existing):
+		if name not in existing:
+			return name
+		index = 1
+		while "{}{}".format(name, index) in existing:
+			index += 1
+		return "{}{}".format(name, index)
@@ -0,0 +1,101 @@
+import unittest
+from scene_backend import MemoryBackend
+from scene_backend import _mel_string
+
+
+class MemoryBackendTest(unittest.TestCase):
+	"""Test class for MemoryBackend"""
+
+	def setUp(self):
+		self.backend = MemoryBackend()
+		self.backend.add_light("warmLightShape", group="warm")
+		self.backend.add_light("coldLightShape", group="cold")
+
+	def test_maps_lights_to_light_groups(self):
+		self.backend.create_light("pointLight", "warm")
+		group_map = self.backend.light_group_map()
+		self.assertEqual(group_map["warm"], ["warmLightShape", "pointLightShape"])
+		self.assertEqual(group_map["cold"], ["coldLightShape"])
+
+	def test_sets_light_groups_in_bulk(self):
+		with self.backend.edit("test"):
+			self.backend.set_light_groups({"warmLightShape": "key", "coldLightShape": "key"})
+		self.assertEqual(list(self.backend.light_group_map().items()), [("key", ["warmLightShape", "coldLightShape"])])
+		self.backend.undo()
+		self.assertEqual(list(self.backend.light_group_map()), ["warm", "cold"])
+
+	def test_reads_light_attributes(self):
+		self.backend.add_light("keyLightShape", "spotLight", translate=(1.0, 2.0, 3.0), intensity=5.0, aiExposure=2.0)
+		attributes = self.backend.light_attributes(["keyLightShape", "warmLightShape"])
+		self.assertEqual(attributes[0], {"type": "spotLight", "position": (1.0, 2.0, 3.0), "intensity": 5.0,
+										"exposure": 2.0, "color": (1.0, 1.0, 1.0)})
+		self.assertEqual(attributes[1]["type"], "aiAreaLight")
+
+	def test_reads_the_exposure_of_arnold_lights(self):
+		self.backend.add_light("fillLightShape", "aiAreaLight", exposure=3.0)
+		self.assertEqual(self.backend.light_attributes(["fillLightShape"])[0]["exposure"], 3.0)
+
+	def test_places_infinite_lights_at_the_origin(self):
+		self.backend.add_light("skyShape", "aiSkyDomeLight", translate=(0.0, 50.0, 0.0))
+		self.backend.add_light("sunShape", "directionalLight", translate=(10.0, 20.0, 30.0))
+		attributes = self.backend.light_attributes(["skyShape", "sunShape"])
+		self.assertEqual([light["position"] for light in attributes], [(0.0, 0.0, 0.0), (0.0, 0.0, 0.0)])
+
+	def test_names_aov_nodes_like_arnold(self):
+		node = self.backend.create_aov_node("warm_direct")
+		self.assertEqual(self.backend.node_name(node), "aiAOV_warm_direct")
+		self.assertTrue(self.backend.find_aov_node("aiAOV_warm_direct") is node)
+
+	def test_makes_node_names_unique(self):
+		self.backend.create_aov_node("warm_direct")
+		node = self.backend.create_aov_node("warm_direct")
+		self.assertEqual(self.backend.node_name(node), "aiAOV_warm_direct1")
+
+	def test_deletes_nodes(self):
+		node = self.backend.create_aov_node("warm_direct")
+		self.backend.delete_nodes([node])
+		self.assertFalse(self.backend.node_exists(node))
+		self.assertEqual(self.backend.list_aov_nodes(), [])
+
+	def test_undoes_an_edit_chunk_at_once(self):
+		with self.backend.edit("test"):
+			for render_pass in ["direct", "indirect"]:
+				node = self.backend.create_aov_node("warm_" + render_pass)
+				self.backend.set_lpe(node, "C.*")
+		self.backend.undo()
+		self.assertEqual(self.backend.list_aov_nodes(), [])
+
+	def test_undo_restores_deleted_nodes(self):
+		node = self.backend.create_aov_node("warm_direct")
+		self.backend.set_lpe(node, "C.*")
+		self.backend.delete_nodes([node])
+		self.backend.undo()
+		self.assertTrue(self.backend.node_exists(node))
+		self.assertEqual(self.backend.get_lpe(node), "C.*")
+
+	def test_switching_layers_applies_their_disabled_aovs(self):
+		self.backend.add_render_layer("char")
+		node = self.backend.create_aov_node("warm_direct")
+		self.backend.set_disabled_aovs("char", ["aiAOV_warm_direct"], [])
+		self.assertTrue(node.attributes["enabled"])
+		self.backend.set_current_render_layer("char")
+		self.assertFalse(node.attributes["enabled"])
+		self.assertFalse(self.backend.create_aov_node("cold_direct").attributes["enabled"] is False)
+		self.backend.set_current_render_layer("defaultRenderLayer")
+		self.assertTrue(node.attributes["enabled"])
+
+	def test_undo_restores_disabled_aovs(self):
+		self.backend.add_render_layer("char")
+		self.backend.set_disabled_aovs("char", ["aiAOV_warm_direct"], [])
+		self.backend.set_disabled_aovs("char", ["aiAOV_cold_direct"], ["aiAOV_warm_direct"])
+		self.assertEqual(self.backend.get_disabled_aovs("char"), ["aiAOV_cold_direct"])
+		self.backend.undo()
+		self.assertEqual(self.backend.get_disabled_aovs("char"), ["aiAOV_warm_direct"])
+
+
+class MelStringTest(unittest.TestCase):
+	"""Test class for the LPEs batched into a MEL script"""
+
+	def test_escapes_quotes_and_backslashes(self):
+		self.assertEqual(_mel_string("C<RD>[DSV]<L.'key'>"), "C<RD>[DSV]<L.'key'>")
+		self.assertEqual(_mel_string('C.*<L."a\\b">'), 'C.*<L.\\"a\\\\b\\">')
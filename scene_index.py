@@ -0,0 +1,80 @@
+"""
+A compact index of the manager's AOVs, stored inside the scene.
+
+Attaching to a scene normally lists every aiAOV node and parses its name.
+Before the scene is saved, the manager writes down what it found instead:
+the light groups it scanned for, and the group, pass, node UUID, node
+name and LPE of every AOV. The index is JSON, compressed and base64
+encoded so it can sit in the scene's fileInfo.
+
+On the next attach the index is only trusted when all of this holds:
+- its version and checksum match,
+- it was made from the same scatter events, passes and merged groups,
+- it was written for the same light groups,
+- the scene has as many aiAOV nodes as when it was written,
+- every UUID still belongs to a node with the name it had.
+The stored names and LPEs are then used as they are, so attaching costs
+one UUID lookup and no name parsing or LPE formatting. Anything else falls
+back to a full scan. Changing how LPEs are built from those inputs bumps
+INDEX_VERSION, and AOVs the tool rebuilds get new nodes, so their UUIDs
+no longer match.
+"""
+import base64
+import json
+import zlib
+import lpe
+
+INDEX_KEY = "lpeManagerIndex"
+INDEX_VERSION = 3
+
+
+# The columns stored for every AOV, in the order encode_index() takes them
+COLUMNS = ("light_groups", "render_passes", "uuids", "node_names", "lpes")
+
+
+def _checksum(payload):
+	return zlib.crc32(payload) & 0xffffffff
+
+
+def lpe_inputs_hash():
+	"""Hash of everything the stored LPEs were formatted from"""
+	inputs = json.dumps([lpe.SCATTER_EVENTS, lpe.AOV_PASSES, lpe.MERGED_GROUPS], sort_keys=True)
+	return _checksum(inputs.encode("utf-8"))
+
+
+def encode_index(groups, node_count, entries):
+	"""
+	Encode the index. node_count is the number of aiAOV nodes in the scene,
+	and entries are (group, pass, uuid, node name, lpe) tuples, which are
+	stored as one list per column so they decode quickly.
+	"""
+	columns = [list(column) for column in zip(*entries)] or [[] for _ in COLUMNS]
+	index = dict(zip(COLUMNS, columns))
+	index["groups"] = sorted(groups)
+	payload = json.dumps(index, separators=(",", ":")).encode("utf-8")
+	header = "{} {} {} {}\n".format(INDEX_VERSION, _checksum(payload), lpe_inputs_hash(), node_count)
+	return base64.b64encode(zlib.compress(header.encode("ascii") + payload)).decode("ascii")
+
+
+def decode_index(text):
+	"""
+	Decode an index into its groups, node count and columns, or return None
+	when it's missing, damaged or outdated, or its LPEs were formatted from
+	other scatter events, passes or merged groups than the current ones
+	"""
+	if not text:
+		return None
+	try:
+		header, payload = zlib.decompress(base64.b64decode(text)).split(b"\n", 1)
+		version, checksum, inputs_hash, node_count = header.split()
+		if int(version) != INDEX_VERSION or _checksum(payload) != int(checksum):
+			return None
+		if int(inputs_hash) != lpe_inputs_hash():
+			return None
+		index = json.loads(payload.decode("utf-8"))
+		if any(len(index[column]) != len(index["uuids"]) for column in COLUMNS):
+			return None
+		index["node_count"] = int(node_count)
+		return index
+	except (AttributeError, KeyError, TypeError, ValueError, zlib.error):
+		return None
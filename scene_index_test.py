@@ -0,0 +1,64 @@
+import base64
+import json
+import unittest
+import zlib
+import lpe
+from scene_index import decode_index
+from scene_index import encode_index
+from scene_index import lpe_inputs_hash
+
+
+class SceneIndexTest(unittest.TestCase):
+	"""Test class for the scene index encoding"""
+
+	def setUp(self):
+		self.entries = [("warm", "direct", "UUID-1", "aiAOV_warm_direct", "C<RD>L.'warm'>"),
+						("cold", "sss", "UUID-2", "aiAOV_cold_sss", "C<TD>.*L.'cold'>")]
+
+	def test_round_trips(self):
+		index = decode_index(encode_index(set(["warm", "cold"]), 5, self.entries))
+		self.assertEqual(index["groups"], ["cold", "warm"])
+		self.assertEqual(index["light_groups"], ["warm", "cold"])
+		self.assertEqual(index["render_passes"], ["direct", "sss"])
+		self.assertEqual(index["uuids"], ["UUID-1", "UUID-2"])
+		self.assertEqual(index["node_names"], ["aiAOV_warm_direct", "aiAOV_cold_sss"])
+		self.assertEqual(index["lpes"], ["C<RD>L.'warm'>", "C<TD>.*L.'cold'>"])
+		self.assertEqual(index["node_count"], 5)
+
+	def test_round_trips_no_entries(self):
+		index = decode_index(encode_index(["warm"], 0, []))
+		self.assertEqual(index["uuids"], [])
+
+	def test_is_plain_ascii(self):
+		text = encode_index(["warm"], 2, self.entries)
+		self.assertFalse('"' in text)
+		self.assertEqual(text, str(text))
+
+	def test_rejects_damaged_data(self):
+		self.assertEqual(decode_index(None), None)
+		self.assertEqual(decode_index("not an index"), None)
+
+	def test_rejects_a_wrong_checksum(self):
+		data = zlib.decompress(base64.b64decode(encode_index(["warm"], 2, self.entries)))
+		text = base64.b64encode(zlib.compress(data.replace(b"UUID-1", b"UUID-9")))
+		self.assertEqual(decode_index(text), None)
+
+	def test_rejects_an_older_version(self):
+		header, payload = zlib.decompress(base64.b64decode(encode_index(["warm"], 2, self.entries))).split(b"\n", 1)
+		text = base64.b64encode(zlib.compress(header.replace(b"3 ", b"2 ", 1) + b"\n" + payload))
+		self.assertEqual(decode_index(text), None)
+
+	def test_rejects_uneven_columns(self):
+		payload = json.dumps({"groups": [], "light_groups": ["warm"], "render_passes": [],
+							"uuids": [], "node_names": [], "lpes": []}).encode("utf-8")
+		header = "3 {} {} 1\n".format(zlib.crc32(payload) & 0xffffffff, lpe_inputs_hash()).encode("ascii")
+		self.assertEqual(decode_index(base64.b64encode(zlib.compress(header + payload))), None)
+
+	def test_rejects_lpes_built_from_other_inputs(self):
+		text = encode_index(["warm"], 2, self.entries)
+		lpe.register_merged_group("warm_cold", ["warm", "cold"])
+		try:
+			self.assertEqual(decode_index(text), None)
+		finally:
+			lpe.unregister_merged_group("warm_cold")
+		self.assertTrue(decode_index(text) is not None)
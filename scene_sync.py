@@ -0,0 +1,123 @@
+"""
+Keeps an LPEManager in step with edits made to the scene outside of the tool.
+
+Callbacks watch lights and aiAOV nodes being created or deleted, and aiAov
+light groups being changed on lights. Events only record what happened;
+a whole burst of them (a file import, a duplicate, a bulk build) is handled
+by a single flush once Maya is idle, which patches the manager's registry
+and passes the changes on to the UI.
+
+Before the scene is saved, the manager's index is written into it, so the
+next attach can skip scanning the scene.
+"""
+import maya.api.OpenMaya as om
+import maya.cmds as cmds
+from scene_backend import LIGHT_TYPES
+
+
+class SceneSync(object):
+	"""Maya callbacks that patch an LPEManager incrementally"""
+
+	def __init__(self, manager, on_change=None):
+		super(SceneSync, self).__init__()
+		self._manager = manager
+		self._on_change = on_change
+		self._callback_ids = []
+		self._light_callback_ids = {}
+		self._lights_changed = False
+		self._added_nodes = []
+		self._removed_nodes = []
+		self._flush_scheduled = False
+
+	def is_running(self):
+		return bool(self._callback_ids)
+
+	def start(self):
+		if self.is_running():
+			return
+
+		for light_type in LIGHT_TYPES:
+			self._callback_ids.append(om.MDGMessage.addNodeAddedCallback(self._light_added, light_type))
+			self._callback_ids.append(om.MDGMessage.addNodeRemovedCallback(self._light_removed, light_type))
+		self._callback_ids.append(om.MDGMessage.addNodeAddedCallback(self._aov_added, "aiAOV"))
+		self._callback_ids.append(om.MDGMessage.addNodeRemovedCallback(self._aov_removed, "aiAOV"))
+		self._callback_ids.append(om.MSceneMessage.addCallback(om.MSceneMessage.kBeforeSave, self._before_save))
+
+		lights = cmds.ls(type=LIGHT_TYPES)
+		if lights:
+			selection = om.MSelectionList()
+			for light in lights:
+				selection.add(light)
+			for index in range(selection.length()):
+				self._watch_light(selection.getDependNode(index))
+
+	def stop(self):
+		"""Remove every callback, so closed windows don't leave handlers behind"""
+		callback_ids = self._callback_ids + list(self._light_callback_ids.values())
+		if callback_ids:
+			om.MMessage.removeCallbacks(callback_ids)
+		self._callback_ids = []
+		self._light_callback_ids = {}
+		self._on_change = None
+
+	def flush(self):
+		"""Apply every event recorded since the last flush"""
+		self._flush_scheduled = False
+		if not self.is_running():
+			return
+
+		lights_changed = self._lights_changed
+		added_nodes = [handle for handle in self._added_nodes if handle.isValid()]
+		removed_nodes = self._removed_nodes
+		self._lights_changed = False
+		self._added_nodes = []
+		self._removed_nodes = []
+
+		added_names = [om.MFnDependencyNode(handle.object()).name() for handle in added_nodes]
+		changes = self._manager.sync_scene(lights_changed, added_names, removed_nodes)
+		if self._on_change and any(changes.values()):
+			self._on_change(changes)
+
+	def _before_save(self, client_data):
+		# Pending events have to reach the registry before it's written down
+		self.flush()
+		self._manager.save_index()
+
+	def _schedule_flush(self):
+		if not self._flush_scheduled:
+			self._flush_scheduled = True
+			cmds.evalDeferred(self.flush, lowestPriority=True)
+
+	def _watch_light(self, node):
+		key = om.MObjectHandle(node).hashCode()
+		if key not in self._light_callback_ids:
+			self._light_callback_ids[key] = om.MNodeMessage.addAttributeChangedCallback(
+				node, self._light_attribute_changed)
+
+	def _light_added(self, node, client_data):
+		self._watch_light(node)
+		self._lights_changed = True
+		self._schedule_flush()
+
+	def _light_removed(self, node, client_data):
+		callback_id = self._light_callback_ids.pop(om.MObjectHandle(node).hashCode(), None)
+		if callback_id is not None:
+			om.MMessage.removeCallback(callback_id)
+		self._lights_changed = True
+		self._schedule_flush()
+
+	def _light_attribute_changed(self, message, plug, other_plug, client_data):
+		if not message & om.MNodeMessage.kAttributeSet:
+			return
+		if plug.partialName(useLongNames=True) == "aiAov":
+			self._lights_changed = True
+			self._schedule_flush()
+
+	def _aov_added(self, node, client_data):
+		# The node may not have its final name yet, so it's read on flush
+		self._added_nodes.append(om.MObjectHandle(node))
+		self._schedule_flush()
+
+	def _aov_removed(self, node, client_data):
+		self._removed_nodes.append(om.MFnDependencyNode(node).name())
+		self._schedule_flush()
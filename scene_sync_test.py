@@ -0,0 +1,76 @@
+import os
+import unittest
+from lpe_manager import LPEManager
+from scene_backend import MAYA_AVAILABLE
+from scene_backend import get_backend
+if MAYA_AVAILABLE:
+	from scene_sync import SceneSync
+
+# Test scene has 2 lights:
+# warmLightShape
+# coldLightShape
+TEST_SCENE_PATH = "General\\scripts\\lpe_manager\\test_scene.mb"
+
+
+@unittest.skipUnless(MAYA_AVAILABLE, "SceneSync needs Maya callbacks")
+class SceneSyncTest(unittest.TestCase):
+	"""Test class for SceneSync"""
+
+	def setUp(self):
+		self.backend = get_backend()
+		dirPath = os.getcwd()
+		filePath = os.path.join(dirPath, TEST_SCENE_PATH)
+		self.backend.open_scene(filePath)
+
+		self.changes = []
+		self.manager = LPEManager()
+		self.sync = SceneSync(self.manager, self.changes.append)
+		self.sync.start()
+
+	def tearDown(self):
+		self.sync.stop()
+
+	def test_picks_up_aov_nodes_made_outside_the_tool(self):
+		self.backend.create_aov_node("warm_direct")
+		self.sync.flush()
+
+		self.assertEqual(len(self.manager.get_aov_list("warm")), 1)
+		self.assertEqual(len(self.changes), 1)
+		self.assertEqual(self.changes[0]["added_aovs"][0].nice_name(), "warm_direct")
+
+	def test_drops_aov_nodes_deleted_outside_the_tool(self):
+		self.manager.add_aovs_bulk(["warm"], ["direct", "indirect"])
+		self.sync.flush()
+		self.backend.delete_nodes([self.backend.find_aov_node("aiAOV_warm_direct")])
+		self.sync.flush()
+
+		self.assertEqual(len(self.manager.get_aov_list("warm")), 1)
+
+	def test_coalesces_a_burst_of_events(self):
+		for render_pass in ["direct", "indirect", "emission"]:
+			self.backend.create_aov_node("cold_" + render_pass)
+		self.sync.flush()
+
+		self.assertEqual(len(self.changes), 1)
+		self.assertEqual(len(self.changes[0]["added_aovs"]), 3)
+
+	def test_follows_light_group_changes(self):
+		self.backend.set_light_group("coldLightShape", "rim")
+		self.sync.flush()
+
+		self.assertEqual(self.changes[0]["added_groups"], ["rim"])
+		self.assertEqual(self.changes[0]["removed_groups"], ["cold"])
+
+	def test_follows_new_lights(self):
+		self.backend.create_light("pointLight", "practical")
+		self.sync.flush()
+
+		self.assertTrue("practical" in self.changes[-1]["added_groups"])
+
+	def test_stops_handling_events_once_stopped(self):
+		self.sync.stop()
+		self.backend.create_aov_node("warm_direct")
+		self.sync.flush()
+
+		self.assertFalse(self.sync.is_running())
+		self.assertEqual(len(self.manager.get_aov_list("warm")), 0)
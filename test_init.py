@@ -1,23 +1,31 @@
 import unittest
 import os
-import pymel.core as pm
 
 if __name__ == '__main__':
-	# Set the testing environment for Maya
-	rootPath = os.getcwd()
-	mayaEnvDir = os.path.join(rootPath, "__test_environment")
-	os.environ["MAYA_APP_DIR"] = mayaEnvDir
-
-	# Initialize Maya
-	import maya.standalone
-	maya.standalone.initialize('python')
-
-	# Set current project to the test directory
-	projectDir = os.path.join(mayaEnvDir, "projects\\default")
-	pm.Workspace().open(projectDir)
+	try:
+		import maya.standalone
+	except ImportError:
+		maya = None
+
+	if maya is not None:
+		# Set the testing environment for Maya
+		rootPath = os.getcwd()
+		mayaEnvDir = os.path.join(rootPath, "__test_environment")
+		os.environ["MAYA_APP_DIR"] = mayaEnvDir
+
+		# Initialize Maya
+		maya.standalone.initialize('python')
+		import pymel.core as pm
+
+		# Set current project to the test directory
+		projectDir = os.path.join(mayaEnvDir, "projects\\default")
+		pm.Workspace().open(projectDir)
+	else:
+		# Without Maya the tests run against the in-memory scene backend
+		print("Maya is not available, testing with MemoryBackend")
 
 	# Find all tests in and under current directory
-	root = os.path.dirname(__file__)
+	root = os.path.dirname(os.path.abspath(__file__))
 	pattern = '*_test.py'
 
 	loader = unittest.TestLoader().discover(root, pattern=pattern)
@@ -30,4 +38,5 @@ if __name__ == '__main__':
 	runner.run(suite)
 
 	# Uninitialize Maya
-	maya.standalone.uninitialize()
+	if maya is not None:
+		maya.standalone.uninitialize()